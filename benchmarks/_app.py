@@ -0,0 +1,39 @@
+"""Shared setup for benchmark scripts
+
+Benchmarks are plain scripts, run them from the repository root, for example:
+
+    python benchmarks/bench_start_many.py --db postgresql+psycopg2://@/jembewf_bench
+"""
+import argparse
+import os
+import sys
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from jembewf.bench import create_app  # pylint: disable=wrong-import-position,unused-import
+
+
+def argument_parser(description: str) -> argparse.ArgumentParser:
+    """Returns argument parser with options common to all benchmarks"""
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument(
+        "--db",
+        default=os.environ.get("BENCH_DATABASE_URL", "sqlite://"),
+        help="SQLAlchemy database url (default: in memory sqlite)",
+    )
+    parser.add_argument(
+        "-n", "--processes", type=int, default=1000, help="number of processes"
+    )
+    return parser
+
+
+@contextmanager
+def timer(title: str, count: int) -> Iterator[None]:
+    """Prints elapsed time and throughput of the block"""
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    print(f"{title:<40} {elapsed:8.3f}s {count / elapsed:10.1f}/s")
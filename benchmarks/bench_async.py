@@ -0,0 +1,109 @@
+"""Benchmark proceed vs aproceed of fan-out flow whose states call slow HTTP service
+
+Local HTTP service that answers after --latency seconds is started in
+background thread. Sync callbacks call it with urllib, async callbacks
+with asyncio streams.
+"""
+import asyncio
+import threading
+import urllib.request
+
+from _app import argument_parser, create_app, timer
+
+import jembewf
+
+
+def start_service(latency: float) -> str:
+    """Starts fake-latency HTTP service in background thread and returns its url"""
+
+    async def handle(reader, writer):
+        await reader.readuntil(b"\r\n\r\n")
+        await asyncio.sleep(latency)
+        writer.write(b"HTTP/1.0 200 OK\r\nContent-Length: 2\r\n\r\nok")
+        await writer.drain()
+        writer.close()
+
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(
+        asyncio.start_server(handle, "127.0.0.1", 0, backlog=1000)
+    )
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    port = server.sockets[0].getsockname()[1]
+    return f"http://127.0.0.1:{port}/"
+
+
+async def aget(url: str) -> bytes:
+    """Minimal async HTTP GET"""
+    host, port = url[len("http://") :].rstrip("/").split(":")
+    reader, writer = await asyncio.open_connection(host, int(port))
+    writer.write(f"GET / HTTP/1.0\r\nHost: {host}\r\n\r\n".encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    await writer.wait_closed()
+    return response
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument("--fan-out", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    url = start_service(args.latency)
+
+    class SyncCallback(jembewf.StateCallback):
+        """Calls service synchronously"""
+
+        def callback(self):
+            urllib.request.urlopen(url).read()
+
+    class AsyncCallback(jembewf.AsyncStateCallback):
+        """Calls service asynchronously"""
+
+        async def callback(self):
+            await aget(url)
+
+    def fan_out_flow(name, callback):
+        return (
+            jembewf.Flow(name)
+            .add(
+                jembewf.State("start").add(
+                    *(jembewf.Transition(f"branch{i}") for i in range(args.fan_out))
+                ),
+                *(
+                    jembewf.State(f"branch{i}", callback)
+                    .add(jembewf.Transition("end"))
+                    .auto()
+                    for i in range(args.fan_out)
+                ),
+                jembewf.State("end"),
+            )
+            .start_with("start")
+        )
+
+    app, db, jwf = create_app(
+        args.db, fan_out_flow("sync", SyncCallback), fan_out_flow("async", AsyncCallback)
+    )
+    steps = args.processes * args.fan_out
+    with app.app_context():
+        processes = [jwf.start("sync") for _ in range(args.processes)]
+        db.session.commit()
+        with timer("proceed (sync callbacks)", steps):
+            for process in processes:
+                process.proceed()
+            db.session.commit()
+
+        processes = [jwf.start("async") for _ in range(args.processes)]
+        db.session.commit()
+
+        async def aproceed_all():
+            for process in processes:
+                await process.aproceed()
+
+        with timer("aproceed (async callbacks)", steps):
+            asyncio.run(aproceed_all())
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,30 @@
+"""Throughput of processes going through a long chain of auto states"""
+from _app import argument_parser, create_app, timer
+from jembewf import Flow, State, Transition
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument(
+        "--chain", type=int, default=2000, help="number of auto states in chain"
+    )
+    parser.set_defaults(processes=10)
+    args = parser.parse_args()
+
+    flow = Flow("chain")
+    for i in range(args.chain):
+        flow.add(State(f"state{i}").add(Transition(f"state{i + 1}")).auto())
+    flow.add(State(f"state{args.chain}"))
+    flow.start_with("state0")
+
+    app, db, jwf = create_app(args.db, flow, max_auto_steps=None)
+    with app.app_context():
+        with timer(f"steps through {args.chain} auto states", args.chain * args.processes):
+            for _ in range(args.processes):
+                process = jwf.start("chain")
+                assert process.is_running is False
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Wide fan-out flow with CPU heavy guards checked serially, in thread and process pool"""
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from _app import argument_parser, create_app, timer
+
+import jembewf
+
+
+def validate(document: str, rounds: int) -> bool:
+    """CPU heavy pure Python check standing in for document validation"""
+    digest = document.encode()
+    for _ in range(rounds):
+        digest = hashlib.sha256(digest).digest()
+    return digest[0] % 4 != 0
+
+
+class ValidateCallback(jembewf.TransitionCallback):
+    """Proceed when document validates"""
+
+    def can_proceed(self):
+        return validate(*self._validate_args())
+
+    def can_proceed_task(self):
+        return validate, self._validate_args()
+
+    def _validate_args(self):
+        return (
+            f"{self.process.id}-{self.to_state.name}",
+            self.process.variables["rounds"],
+        )
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument("--fan-out", type=int, default=32)
+    parser.add_argument("--rounds", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.set_defaults(processes=20)
+    args = parser.parse_args()
+
+    flow = (
+        jembewf.Flow("fan_out")
+        .add(
+            jembewf.State("start").add(
+                *(
+                    jembewf.Transition(f"branch{i}", ValidateCallback)
+                    for i in range(args.fan_out)
+                )
+            ),
+            *(jembewf.State(f"branch{i}") for i in range(args.fan_out)),
+        )
+        .start_with("start")
+    )
+    app, db, jwf = create_app(args.db, flow)
+    guards = args.processes * args.fan_out
+
+    executors = [
+        ("serial", None),
+        (f"thread pool ({args.workers})", ThreadPoolExecutor(args.workers)),
+        (f"process pool ({args.workers})", ProcessPoolExecutor(args.workers)),
+    ]
+    with app.app_context():
+        for title, executor in executors:
+            jwf.executor = executor
+            processes = [
+                jwf.start("fan_out", rounds=args.rounds)
+                for _ in range(args.processes)
+            ]
+            db.session.commit()
+            with timer(f"proceed guards {title}", guards):
+                for process in processes:
+                    process.proceed()
+                db.session.commit()
+            if executor is not None:
+                executor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
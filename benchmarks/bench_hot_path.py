@@ -0,0 +1,66 @@
+"""Latency, allocations and callback instantiations of start and proceed"""
+import statistics
+import time
+import tracemalloc
+from _app import argument_parser, create_app
+from jembewf import Flow, FlowCallback, State, StateCallback, Transition
+
+INSTANCES = {"flow": 0, "state": 0}
+
+
+class CountingFlowCallback(FlowCallback):
+    """Counts instances, stands for callback loading reference data in __init__"""
+
+    def __init__(self, process):
+        super().__init__(process)
+        INSTANCES["flow"] += 1
+
+
+class CountingStateCallback(StateCallback):
+    """Counts instances, stands for callback loading reference data in __init__"""
+
+    def __init__(self, step):
+        super().__init__(step)
+        INSTANCES["state"] += 1
+
+
+def main():
+    parser = argument_parser(__doc__)
+    args = parser.parse_args()
+
+    flow = (
+        Flow("flow", CountingFlowCallback)
+        .add(
+            State("start", CountingStateCallback).add(Transition("middle")),
+            State("middle", CountingStateCallback).add(Transition("end")),
+            State("end", CountingStateCallback),
+        )
+        .start_with("start")
+    )
+    app, db, jwf = create_app(args.db, flow)
+
+    with app.app_context():
+        latencies = []
+        tracemalloc.start()
+        for _ in range(args.processes):
+            start = time.perf_counter()
+            process = jwf.start("flow")
+            while process.proceed():
+                pass
+            latencies.append(time.perf_counter() - start)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        db.session.commit()
+
+    latencies.sort()
+    print(f"start and proceed to end, {args.processes} processes")
+    print(f"  mean latency      {statistics.mean(latencies) * 1000:8.3f} ms")
+    print(f"  p50 latency       {latencies[len(latencies) // 2] * 1000:8.3f} ms")
+    print(f"  p99 latency       {latencies[int(len(latencies) * 0.99)] * 1000:8.3f} ms")
+    print(f"  peak traced mem   {peak / 1024:8.1f} KiB")
+    print(f"  FlowCallback per process  {INSTANCES['flow'] / args.processes:.2f}")
+    print(f"  StateCallback per process {INSTANCES['state'] / args.processes:.2f}")
+
+
+if __name__ == "__main__":
+    main()
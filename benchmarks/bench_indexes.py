@@ -0,0 +1,77 @@
+"""Shows query plans and timings of hot path queries without and with indexes"""
+import sqlalchemy as sa
+from _app import argument_parser, create_app, timer
+from jembewf import Flow, State, Transition
+
+
+def explain(db, query) -> str:
+    """Returns query plan of the ORM query"""
+    sql = str(
+        query.statement.compile(db.engine, compile_kwargs={"literal_binds": True})
+    )
+    prefix = "EXPLAIN QUERY PLAN " if db.engine.dialect.name == "sqlite" else "EXPLAIN "
+    with db.engine.connect() as conn:
+        return "\n".join(
+            "    " + " ".join(str(col) for col in row)
+            for row in conn.execute(sa.text(prefix + sql))
+        )
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument(
+        "--lookups", type=int, default=1000, help="number of process lookups"
+    )
+    args = parser.parse_args()
+
+    flow = (
+        Flow("flow")
+        .add(
+            State("start").add(Transition("middle")),
+            State("middle").add(Transition("end")),
+            State("end"),
+        )
+        .start_with("start")
+    )
+    app, db, jwf = create_app(args.db, flow)
+
+    with app.app_context():
+        # start without indexes, JembeWF.create_indexes will create them later
+        for model in (jwf.process_model, jwf.step_model):
+            for index in model.__table__.indexes:
+                index.drop(db.engine)
+
+        processes = jwf.start_many("flow", ({} for _ in range(args.processes)))
+        db.session.commit()
+        # end most of the steps so there are many inactive steps
+        step = jwf.step_model
+        process_ids = [p.id for p in processes]
+        db.session.query(step).filter(
+            step.process_id <= process_ids[len(process_ids) * 9 // 10]
+        ).update({"is_active": False}, synchronize_session=False)
+        db.session.commit()
+        with db.engine.connect() as conn:
+            conn.execute(sa.text("ANALYZE"))
+            conn.commit()
+
+        lookups = [process_ids[i % len(process_ids)] for i in range(args.lookups)]
+        for title in ("without indexes", "with indexes"):
+            if title == "with indexes":
+                print("created:", ", ".join(jwf.create_indexes()))
+                with db.engine.connect() as conn:
+                    conn.execute(sa.text("ANALYZE"))
+                    conn.commit()
+
+            query = db.session.query(step).filter(
+                step.is_active == True, step.process_id == process_ids[-1]
+            )
+            print(f"{title}, current_steps plan:\n{explain(db, query)}")
+            with timer(f"current_steps {title}", args.lookups):
+                for process_id in lookups:
+                    db.session.query(step).filter(
+                        step.is_active == True, step.process_id == process_id
+                    ).all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""Steps per second of MemoryStore compared to SQLAlchemy backend"""
+from _app import argument_parser, create_app, timer
+
+import jembewf
+
+
+def linear_flow(states: int) -> jembewf.Flow:
+    """Flow with states in a chain"""
+    flow = jembewf.Flow("linear")
+    for i in range(states - 1):
+        flow.add(jembewf.State(f"state{i}").add(jembewf.Transition(f"state{i + 1}")))
+    flow.add(jembewf.State(f"state{states - 1}"))
+    return flow.start_with("state0")
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument("--states", type=int, default=10)
+    args = parser.parse_args()
+    steps = args.processes * args.states
+
+    store = jembewf.MemoryStore(linear_flow(args.states))
+    with timer("MemoryStore", steps):
+        processes = [store.start("linear") for _ in range(args.processes)]
+        for process in processes:
+            while process.is_running:
+                process.proceed()
+
+    app, db, jwf = create_app(args.db, linear_flow(args.states))
+    with app.app_context():
+        with timer(f"SQLAlchemy ({db.engine.dialect.name})", steps):
+            processes = [jwf.start("linear") for _ in range(args.processes)]
+            db.session.commit()
+            for process in processes:
+                process.load_steps()
+                while process.is_running:
+                    process.proceed()
+            db.session.commit()
+
+        with timer(f"SQLAlchemy proceed_many ({db.engine.dialect.name})", steps):
+            processes = jwf.start_many("linear", ({} for _ in range(args.processes)))
+            db.session.commit()
+            process_ids = [process.id for process in processes]
+            for _ in range(args.states - 1):
+                jwf.proceed_many(process_ids)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
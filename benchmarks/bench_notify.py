@@ -0,0 +1,67 @@
+"""Wake-up latency of a worker waiting on notifier listener
+
+Producer thread starts processes and commits, worker measures time from commit
+to received step notification. Uses PostgresNotifier for PostgreSQL database
+and InProcessNotifier otherwise.
+"""
+import statistics
+import threading
+import time
+
+from _app import argument_parser, create_app
+
+import jembewf
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument(
+        "--interval", type=float, default=0.01, help="seconds between commits"
+    )
+    parser.set_defaults(processes=200)
+    args = parser.parse_args()
+
+    notifier = (
+        jembewf.PostgresNotifier()
+        if args.db.startswith("postgresql")
+        else jembewf.InProcessNotifier()
+    )
+    flow = (
+        jembewf.Flow("flow1")
+        .add(jembewf.State("state1").add(jembewf.Transition("state2")), jembewf.State("state2"))
+        .start_with("state1")
+    )
+    app, db, jwf = create_app(args.db, flow, notifier=notifier)
+    commited_at = {}
+
+    def produce():
+        with app.app_context():
+            for _ in range(args.processes):
+                process = jwf.start("flow1")
+                db.session.flush()
+                process_id = process.id
+                commited_at[process_id] = time.perf_counter()
+                db.session.commit()
+                time.sleep(args.interval)
+
+    latencies = []
+    with app.app_context(), notifier.listener() as listener:
+        producer = threading.Thread(target=produce)
+        producer.start()
+        while len(latencies) < args.processes:
+            for notification in listener.wait(timeout=5):
+                latencies.append(
+                    time.perf_counter() - commited_at[notification["process_id"]]
+                )
+        producer.join()
+
+    latencies.sort()
+    print(
+        f"{type(notifier).__name__}: "
+        f"p50={statistics.median(latencies) * 1000:.2f} ms "
+        f"p99={latencies[int(len(latencies) * 0.99) - 1] * 1000:.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+"""Compares JembeWF.start_many with calling JembeWF.start in a loop"""
+from _app import argument_parser, create_app, timer
+from jembewf import Flow, State, Transition
+
+
+def main():
+    parser = argument_parser(__doc__)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    flow = (
+        Flow("flow")
+        .add(State("start").add(Transition("end")), State("end"))
+        .start_with("start")
+    )
+    app, db, jwf = create_app(args.db, flow)
+    processes_vars = [{"number": i} for i in range(args.processes)]
+
+    with app.app_context():
+        with timer("start (loop)", args.processes):
+            for process_vars in processes_vars:
+                jwf.start("flow", **process_vars)
+            db.session.commit()
+
+        with timer(f"start_many (batch_size={args.batch_size})", args.processes):
+            jwf.start_many("flow", processes_vars, batch_size=args.batch_size)
+            db.session.commit()
+
+
+if __name__ == "__main__":
+    main()
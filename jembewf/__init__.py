@@ -1,16 +1,64 @@
-from typing import TYPE_CHECKING, Dict, Optional, Type
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    ContextManager,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
+from functools import partial
 import json
+import pickle
 from .flow import Flow, FlowCallback
-from .state import State, StateCallback
-from .transition import Transition, TransitionCallback
+from .graph import FlowGraph
+from .state import State, StateCallback, AsyncStateCallback
+from .transition import Transition, TransitionCallback, AsyncTransitionCallback
 from .process_mixin import ProcessMixin, CantStartProcess
 from .step_mixin import StepMixin
-from .helpers import get_jembewf, CanProceed
-
+from .subscription_mixin import SubscriptionMixin
+from .variable_mixin import VariableMixin
+from .variables import FlowVariable, ProcessVariables
+from .helpers import get_jembewf, CanProceed, import_string
+from .runner import Runner, RunnerStats
+from .scheduler import Scheduler
+from .archive import Archiver
+from .memory import MemoryStore, MemoryProcess, MemoryStep
+from .notifier import (
+    Notifier,
+    PostgresNotifier,
+    PostgresListener,
+    InProcessNotifier,
+    InProcessListener,
+)
+from .instrumentation import (
+    NO_SPAN,
+    Span,
+    Instrumentation,
+    OpenTelemetryInstrumentation,
+)
+from .metrics import Metrics
+from .registry import FlowRegistry
+from .definitions import (
+    FlowSnapshot,
+    flow_from_dict,
+    flows_from_file,
+    compile_flows,
+    load_snapshot,
+)
+from .schema import create_indexes
+from .commands import cli
 
 if TYPE_CHECKING:
+    from concurrent.futures import Executor
     from flask import Flask
     from flask_sqlalchemy import SQLAlchemy
+    import sqlalchemy as sa
     import jembewf
 
 
@@ -20,13 +68,41 @@ __all__ = (
     "JembeWF",
     "Flow",
     "FlowCallback",
+    "FlowGraph",
     "State",
     "StateCallback",
+    "AsyncStateCallback",
     "Transition",
     "TransitionCallback",
+    "AsyncTransitionCallback",
     "ProcessMixin",
     "StepMixin",
+    "SubscriptionMixin",
+    "VariableMixin",
+    "FlowVariable",
+    "ProcessVariables",
     "CantStartProcess",
+    "Runner",
+    "RunnerStats",
+    "Scheduler",
+    "Archiver",
+    "MemoryStore",
+    "MemoryProcess",
+    "MemoryStep",
+    "Notifier",
+    "PostgresNotifier",
+    "PostgresListener",
+    "InProcessNotifier",
+    "InProcessListener",
+    "Span",
+    "Instrumentation",
+    "OpenTelemetryInstrumentation",
+    "Metrics",
+    "FlowRegistry",
+    "FlowSnapshot",
+    "flow_from_dict",
+    "flows_from_file",
+    "compile_flows",
 )
 
 
@@ -39,11 +115,33 @@ class JembeWF:
         db: Optional["SQLAlchemy"] = None,
         process_model: Optional[Type["jembewf.ProcessMixin"]] = None,
         step_model: Optional[Type["jembewf.StepMixin"]] = None,
+        max_auto_steps: Optional[int] = 10000,
+        executor: Optional["Executor"] = None,
+        subscription_model: Optional[Type["jembewf.SubscriptionMixin"]] = None,
+        notifier: Optional["jembewf.Notifier"] = None,
+        instrumentation: Optional["jembewf.Instrumentation"] = None,
+        metrics: Optional["jembewf.Metrics"] = None,
+        variable_model: Optional[Type["jembewf.VariableMixin"]] = None,
     ) -> None:
 
-        self.flows: Dict[str, "jembewf.Flow"] = {}
+        self.flows = FlowRegistry(on_load=self._flow_loaded)
+        # event transitions and indexed variables of flows loaded from
+        # snapshot, known before flows are unpickled
+        self._snapshot_declarations: Dict[
+            str, Tuple[bool, Sequence["jembewf.FlowVariable"]]
+        ] = {}
+        # Flow.compact_steps keep of flows loaded from snapshot
+        self._snapshot_keep_steps: Dict[str, int] = {}
         self.initialised = False
 
+        # maximum number of auto steps proceeded by one create or proceed call,
+        # None for no limit
+        self.max_auto_steps = max_auto_steps
+
+        # thread or process pool executing TransitionCallback.can_proceed_task
+        # of fanned-out transitions in parallel, None to check them one by one
+        self.executor = executor
+
         self.db: "SQLAlchemy"
         if db is not None:
             self.db = db
@@ -56,6 +154,21 @@ class JembeWF:
         if step_model is not None:
             self.step_model = step_model
 
+        # required only by flows with transitions waiting on events
+        self.subscription_model = subscription_model
+
+        # notifies workers about activated steps and ended processes
+        self.notifier = notifier
+
+        # records spans around create, proceed, can_proceed and callbacks
+        self.instrumentation = instrumentation
+
+        # counts processes and steps for Prometheus
+        self.metrics = metrics
+
+        # keeps process variables one row per variable instead of json column
+        self.variable_model = variable_model
+
         if app is not None:
             if process_model is None or step_model is None or db is None:
                 raise Exception(
@@ -101,8 +214,27 @@ class JembeWF:
         if step_model is not None:
             self.step_model = step_model
 
+        # check if subscription_model is provided when flows wait on events
+        # and declare indexes of indexed variables
+        for flow in self.flows.loaded():
+            self._init_flow(
+                flow.name, flow.has_event_transitions, flow.variables.values()
+            )
+        for flow_name, declarations in self._snapshot_declarations.items():
+            self._init_flow(flow_name, *declarations)
+
+        if self.notifier is not None:
+            self.notifier.init_db(self.db)
+        if self.instrumentation is not None:
+            self.instrumentation.init_app(app, self.db)
+        if self.metrics is not None:
+            self.metrics.init_app(app, self.db)
+        if self.variable_model is not None:
+            self.variable_model.init_db(self.db)
+
         # initialise extension
         app.extensions["jembewf"] = self
+        app.cli.add_command(cli)
         self.initialised = True
 
     def add(self, *flows: "jembewf.Flow") -> "jembewf.JembeWF":
@@ -113,11 +245,48 @@ class JembeWF:
             )
 
         for flow in flows:
-            if flow.name in self.flows:
-                raise Exception(
-                    f"Flow with same name '{flow.name}' is already registred."
-                )
-            self.flows[flow.name] = flow
+            self.flows.add(flow)
+        return self
+
+    def add_lazy(self, flow_name: str, import_path: str) -> "jembewf.JembeWF":
+        """Registers flow imported from import_path on the first use
+
+        import_path ("package.module:name") points to the Flow or to a function
+        returning the Flow. Module of the flow, and modules of its callbacks,
+        are imported only when the flow is used (ex. process.flow or get_flow).
+        """
+        if self.initialised:
+            raise Exception(
+                "Can't add flows to JembeWF because it is already initialised."
+            )
+        self.flows.add_loader(flow_name, partial(_import_flow, import_path))
+        return self
+
+    def load_snapshot(
+        self, snapshot: Union[str, Dict[str, "jembewf.FlowSnapshot"]]
+    ) -> "jembewf.JembeWF":
+        """Registers flows compiled to snapshot with compile_flows
+
+        snapshot is path of the snapshot file or snapshots returned by
+        load_snapshot. Flows are unpickled on the first use, load snapshot
+        before workers are forked to share it between them.
+        """
+        if self.initialised:
+            raise Exception(
+                "Can't add flows to JembeWF because it is already initialised."
+            )
+        if isinstance(snapshot, str):
+            snapshot = load_snapshot(snapshot)
+        for flow_name, flow_snapshot in snapshot.items():
+            self.flows.add_loader(
+                flow_name, partial(pickle.loads, flow_snapshot.pickled)
+            )
+            self._snapshot_declarations[flow_name] = (
+                flow_snapshot.has_event_transitions,
+                flow_snapshot.indexed_variables,
+            )
+            if flow_snapshot.keep_steps is not None:
+                self._snapshot_keep_steps[flow_name] = flow_snapshot.keep_steps
         return self
 
     def start(self, flow_name: str, **process_vars) -> "jembewf.ProcessMixin":
@@ -127,6 +296,79 @@ class JembeWF:
         """
         return self.process_model.create(flow_name, **process_vars)
 
+    def start_many(
+        self,
+        flow_name: str,
+        processes_vars: Iterable[Dict[str, Any]],
+        batch_size: int = 1000,
+    ) -> List["jembewf.ProcessMixin"]:
+        """Start many Process instances from same Flow definition
+
+        Processes and their starting steps are inserted in batches of batch_size
+        using multi-row INSERTs instead of one INSERT per process and step.
+
+        Returns list of Process instances that has been started.
+        """
+        return self.process_model.create_many(
+            flow_name, processes_vars, batch_size=batch_size
+        )
+
+    def proceed_many(
+        self, processes: Union[Iterable[int], "sa.orm.Query", "sa.Select"]
+    ) -> Set[int]:
+        """Proceed many processes at once
+
+        processes can be list of process ids, query of processes or
+        select statement returning process ids.
+
+        Returns ids of the processes that proceeded to new steps.
+        """
+        return self.process_model.proceed_many(processes)
+
+    def signal(self, event: str, key: Optional[Any] = None, **params) -> Set[int]:
+        """Proceed steps waiting on the event
+
+        Only active steps subscribed to the event (and key when it is provided)
+        are looked up and proceeded with transitions waiting on the event.
+        params are passed to the transition callbacks.
+
+        Returns ids of the processes that proceeded to new steps.
+        """
+        if self.subscription_model is None:
+            raise Exception("JembeWF 'subscription_model' is not provided")
+        return self.subscription_model.signal(event, key, **params)
+
+    def find_processes(self, flow_name: str, **variable_filters) -> "sa.orm.Query":
+        """Returns query of the flow processes with variables equal to filters
+
+        ex. `jwf.find_processes("flow1", customer_id=5).filter_by(is_running=True)`
+        """
+        return self.process_model.find_processes(flow_name, **variable_filters)
+
+    def compact_steps(self, batch_size: int = 100) -> int:
+        """Collapses old steps of flows configured with Flow.compact_steps
+
+        Processes are compacted in batches of batch_size, every batch is commited.
+        Flows are not loaded to find out their keep_steps: loaded flows and
+        flows from snapshot are compacted, flows added with add_lazy only
+        after they are loaded.
+
+        Returns number of deleted steps.
+        """
+        keep_steps = dict(self._snapshot_keep_steps)
+        keep_steps.update((flow.name, flow.keep_steps) for flow in self.flows.loaded())
+        return sum(
+            self.step_model.compact_flow_steps(flow_name, keep, batch_size)
+            for flow_name, keep in keep_steps.items()
+            if keep is not None
+        )
+
+    def span(self, name: str, **attributes) -> ContextManager[Optional["jembewf.Span"]]:
+        """Returns span of the instrumentation or no-op context manager"""
+        if self.instrumentation is None:
+            return NO_SPAN
+        return self.instrumentation.span(name, **attributes)
+
     def can_start(self, flow_name: str, **process_vars) -> bool:
         """Check if process from flow definition can be started"""
         return self.process_model.can_start(flow_name, **process_vars)
@@ -148,6 +390,51 @@ class JembeWF:
         except KeyError as err:
             raise ValueError(f"Flow '{flow_name}' doesn't exit!") from err
 
+    def create_indexes(self) -> List[str]:
+        """Creates missing indexes declared by process and step models
+
+        Returns names of created indexes.
+        """
+        return create_indexes()
+
     def has_flow(self, flow_name: str) -> bool:
         """Returns true if flow with provided name exist"""
         return flow_name in self.flows
+
+    def _init_flow(
+        self,
+        flow_name: str,
+        has_event_transitions: bool,
+        variables: Iterable["jembewf.FlowVariable"],
+    ):
+        """Checks models required by the flow and declares its variable indexes
+
+        Indexes of variables declared with index=True are created
+        by db.create_all or create_indexes.
+        """
+        if has_event_transitions and self.subscription_model is None:
+            raise Exception(
+                f"JembeWF 'subscription_model' must be provided in __init__ "
+                f"because flow '{flow_name}' has transitions waiting on events"
+            )
+        variable_model = self.variable_model or self.process_model
+        for variable in variables:
+            if variable.index:
+                variable_model.declare_variable_index(flow_name, variable)
+
+    def _flow_loaded(self, flow: "jembewf.Flow"):
+        """Initialises flow created by loader after JembeWF is initialised"""
+        if self.initialised and flow.name not in self._snapshot_declarations:
+            self._init_flow(
+                flow.name, flow.has_event_transitions, flow.variables.values()
+            )
+
+
+def _import_flow(import_path: str) -> "jembewf.Flow":
+    """Imports Flow or function returning Flow from import path"""
+    flow = import_string(import_path)
+    if not isinstance(flow, Flow) and callable(flow):
+        flow = flow()
+    if not isinstance(flow, Flow):
+        raise ValueError(f"'{import_path}' is not a Flow.")
+    return flow
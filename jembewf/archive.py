@@ -0,0 +1,367 @@
+from typing import IO, Any, Dict, List, Optional, Tuple
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+import glob
+import gzip
+import json
+import os
+import uuid
+import sqlalchemy as sa
+from .helpers import get_jembewf
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+__all__ = ("Archiver",)
+
+
+class Archiver:
+    """Moves ended processes and their steps out of process and step tables
+
+    Processes that ended before older_than are moved in batches of batch_size,
+    each batch in its own transaction: rows are copied to archive tables
+    (process and step table names with "_archive" suffix) with
+    INSERT ... SELECT or appended to JSONL file (gzip compressed when path
+    ends with .gz), one line per process with its steps, and then deleted.
+    Rows of variable_model table are archived with their processes.
+
+    JSONL lines of a batch are first written to pending file of the archiver
+    ("<path>.<pid>.<uuid>.pending") and appended to path only after the batch
+    is commited, so a batch whose transaction failed is never in the archive.
+    Pending files left by archivers stopped between commit and append are
+    appended (or discarded when their processes were not deleted) by the
+    next run.
+
+    Like Runner, processes are claimed with SELECT ... FOR UPDATE SKIP LOCKED,
+    so many archivers can run at the same time. With JSONL file they are
+    coordinated with file locks (fcntl.flock): archiver holds the lock of its
+    pending file until it is appended and appends while holding "<path>.lock".
+    Where fcntl is not available only one archiver may use the same path.
+    """
+
+    def __init__(
+        self,
+        older_than: timedelta = timedelta(days=30),
+        batch_size: int = 1000,
+        path: Optional[str] = None,
+    ):
+        """
+        Args:
+            older_than (timedelta): Archive processes ended more than older_than ago
+            batch_size (int): Number of processes archived in one transaction
+            path (Optional[str]): JSONL file to append archived processes to,
+                None to archive to archive tables
+        """
+        self.older_than = older_than
+        self.batch_size = batch_size
+        self.path = path
+        # JSONL lines of the batch waiting for commit
+        self.pending_path = (
+            f"{path}.{os.getpid()}.{uuid.uuid4().hex}.pending"
+            if path is not None
+            else None
+        )
+        # open and locked pending file
+        self._pending_file: Optional[IO[str]] = None
+        self.archived_processes = 0
+        self.archived_steps = 0
+
+    @staticmethod
+    def get_archive_tables() -> Tuple[sa.Table, sa.Table]:
+        """Returns archive tables of process and step tables
+
+        Archive tables have the same columns as the original ones but
+        without foreign keys and defaults. They are defined in metadata of
+        the models, so db.create_all creates them once they are defined.
+        """
+        jwf = get_jembewf()
+        process_table = jwf.process_model.__table__
+        step_table = jwf.step_model.__table__
+        return (
+            _archive_table(process_table),
+            _archive_table(step_table, "process_id"),
+        )
+
+    @staticmethod
+    def get_variable_archive_table() -> Optional[sa.Table]:
+        """Returns archive table of variable_model table, None without variable_model"""
+        jwf = get_jembewf()
+        if jwf.variable_model is None:
+            return None
+        return _archive_table(jwf.variable_model.__table__)
+
+    def create_tables(self):
+        """Creates missing archive tables"""
+        jwf = get_jembewf()
+        tables = list(self.get_archive_tables())
+        variable_archive = self.get_variable_archive_table()
+        if variable_archive is not None:
+            tables.append(variable_archive)
+        for table in tables:
+            table.create(jwf.db.engine, checkfirst=True)
+
+    def claim(self, now: datetime) -> List[int]:
+        """Claims (locks) ids of the next batch of processes to archive"""
+        jwf = get_jembewf()
+        process = jwf.process_model
+        return list(
+            jwf.db.session.scalars(
+                sa.select(process.id)
+                .where(
+                    process.is_running == False,
+                    process.ended_at < now - self.older_than,
+                )
+                .order_by(process.id)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            )
+        )
+
+    def archive(self, process_ids: List[int]) -> int:
+        """Moves processes and their steps to archive, without commit
+
+        In JSONL mode lines are written to pending_path, call publish after
+        the commit to append them to path.
+
+        Returns number of archived steps.
+        """
+        jwf = get_jembewf()
+        session = jwf.db.session
+        process_table = jwf.process_model.__table__
+        step_table = jwf.step_model.__table__
+        process_in_batch = process_table.c.id.in_(process_ids)
+        step_in_batch = step_table.c.process_id.in_(process_ids)
+
+        if self.path is None:
+            process_archive, step_archive = self.get_archive_tables()
+            session.execute(
+                process_archive.insert().from_select(
+                    [column.name for column in process_table.columns],
+                    sa.select(process_table).where(process_in_batch),
+                )
+            )
+            steps = session.execute(
+                step_archive.insert().from_select(
+                    [column.name for column in step_table.columns],
+                    sa.select(step_table).where(step_in_batch),
+                )
+            ).rowcount
+            if jwf.variable_model is not None:
+                variable_table = jwf.variable_model.__table__
+                session.execute(
+                    self.get_variable_archive_table()
+                    .insert()
+                    .from_select(
+                        [column.name for column in variable_table.columns],
+                        sa.select(variable_table).where(
+                            variable_table.c.process_id.in_(process_ids)
+                        ),
+                    )
+                )
+        else:
+            steps = self._write(process_ids)
+
+        if jwf.variable_model is not None:
+            variable_table = jwf.variable_model.__table__
+            session.execute(
+                variable_table.delete().where(
+                    variable_table.c.process_id.in_(process_ids)
+                )
+            )
+
+        if jwf.subscription_model is not None:
+            subscription_table = jwf.subscription_model.__table__
+            session.execute(
+                subscription_table.delete().where(
+                    subscription_table.c.step_id.in_(
+                        sa.select(step_table.c.id).where(step_in_batch)
+                    )
+                )
+            )
+        session.execute(step_table.delete().where(step_in_batch))
+        session.execute(process_table.delete().where(process_in_batch))
+        return steps
+
+    def run(self, now: Optional[datetime] = None) -> int:
+        """Archives all processes ended before now - older_than in batches
+
+        Returns number of archived processes.
+        """
+        jwf = get_jembewf()
+        now = now or datetime.utcnow()
+        if self.path is None:
+            self.create_tables()
+        else:
+            self.recover()
+        archived = 0
+        while True:
+            process_ids = self.claim(now)
+            if not process_ids:
+                jwf.db.session.commit()
+                return archived
+            try:
+                steps = self.archive(process_ids)
+                jwf.db.session.commit()
+            except Exception:
+                jwf.db.session.rollback()
+                self.discard()
+                raise
+            self.publish()
+            archived += len(process_ids)
+            self.archived_processes += len(process_ids)
+            self.archived_steps += steps
+
+    def publish(self):
+        """Appends commited lines from pending file to JSONL file"""
+        if self._pending_file is None:
+            return
+        self._append(self.pending_path)
+        self._close_pending()
+
+    def discard(self):
+        """Removes pending file of the batch whose transaction failed"""
+        if self._pending_file is None:
+            return
+        os.remove(self.pending_path)
+        self._close_pending()
+
+    def recover(self):
+        """Publishes or discards pending files left by stopped archivers
+
+        Pending files locked by running archivers are skipped. Batch is deleted
+        in one transaction, so pending file was commited when its first
+        process doesn't exist any more.
+        """
+        jwf = get_jembewf()
+        for pending_path in sorted(glob.glob(f"{glob.escape(self.path)}.*.pending")):
+            with open(pending_path, "rt", encoding="utf-8") as pending_file:
+                if not _lock(pending_file, blocking=False):
+                    continue
+                if not os.path.exists(pending_path):
+                    # appended by the archiver that released the lock
+                    continue
+                line = pending_file.readline()
+                if line and (
+                    jwf.db.session.get(
+                        jwf.process_model, json.loads(line)["process"]["id"]
+                    )
+                    is None
+                ):
+                    self._append(pending_path)
+                else:
+                    os.remove(pending_path)
+        jwf.db.session.commit()
+
+    def _append(self, pending_path: str):
+        """Appends lines of pending file to JSONL file and removes it"""
+        opener = gzip.open if self.path.endswith(".gz") else open
+        with self._archive_lock():
+            with open(pending_path, "rt", encoding="utf-8") as pending_file:
+                with opener(self.path, "at", encoding="utf-8") as archive_file:
+                    for line in pending_file:
+                        archive_file.write(line)
+                    archive_file.flush()
+                    if opener is open:
+                        os.fsync(archive_file.fileno())
+            os.remove(pending_path)
+
+    @contextmanager
+    def _archive_lock(self):
+        """Holds the lock of JSONL file while lines are appended to it"""
+        with open(f"{self.path}.lock", "a", encoding="utf-8") as lock_file:
+            _lock(lock_file)
+            yield
+
+    def _close_pending(self):
+        self._pending_file.close()
+        self._pending_file = None
+
+    def _write(self, process_ids: List[int]) -> int:
+        """Writes processes with their steps to pending JSONL file"""
+        jwf = get_jembewf()
+        session = jwf.db.session
+        process_table = jwf.process_model.__table__
+        step_table = jwf.step_model.__table__
+        processes: Dict[Any, Dict[str, Any]] = {
+            row["id"]: {"process": dict(row), "steps": []}
+            for row in session.execute(
+                sa.select(process_table)
+                .where(process_table.c.id.in_(process_ids))
+                .order_by(process_table.c.id)
+            ).mappings()
+        }
+        steps = 0
+        for row in session.execute(
+            sa.select(step_table)
+            .where(step_table.c.process_id.in_(process_ids))
+            .order_by(step_table.c.id)
+        ).mappings():
+            processes[row["process_id"]]["steps"].append(dict(row))
+            steps += 1
+        if jwf.variable_model is not None:
+            variable = jwf.variable_model
+            for process_id, name, value in session.execute(
+                sa.select(variable.process_id, variable.name, variable.value).where(
+                    variable.process_id.in_(process_ids)
+                )
+            ):
+                record = processes[process_id]["process"]
+                record["variables"] = dict(record["variables"] or {}, **{name: value})
+
+        # written under temporary name and renamed, so recover never sees
+        # pending file before it is locked and complete
+        temporary_path = f"{self.pending_path}.tmp"
+        pending_file = open(temporary_path, "wt", encoding="utf-8")
+        try:
+            _lock(pending_file)
+            for record in processes.values():
+                pending_file.write(json.dumps(record, default=_json_default) + "\n")
+            pending_file.flush()
+            os.fsync(pending_file.fileno())
+            os.replace(temporary_path, self.pending_path)
+        except Exception:
+            pending_file.close()
+            os.remove(temporary_path)
+            raise
+        self._pending_file = pending_file
+        return steps
+
+
+def _lock(lock_file: IO[str], blocking: bool = True) -> bool:
+    """Locks file exclusively, returns False when it is locked by another process"""
+    if fcntl is None:
+        return True
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _archive_table(table: sa.Table, *indexed_columns: str) -> sa.Table:
+    """Returns archive table of the table, defines it when it doesn't exist"""
+    name = f"{table.name}_archive"
+    if name in table.metadata.tables:
+        return table.metadata.tables[name]
+    return sa.Table(
+        name,
+        table.metadata,
+        *(
+            sa.Column(
+                column.name,
+                column.type,
+                primary_key=column.primary_key,
+                autoincrement=False,
+            )
+            for column in table.columns
+        ),
+        *(sa.Index(f"ix_{name}_{column}", column) for column in indexed_columns),
+    )
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,19 @@
+"""Synthetic flows and load-testing harness
+
+Run from command line:
+
+    python -m jembewf.bench --db sqlite:// --db postgresql+psycopg2://@/jembewf_bench
+"""
+from .flows import FLOWS, linear, fan_out, diamond, auto_chain
+from .harness import BenchResult, create_app, run
+
+__all__ = (
+    "FLOWS",
+    "linear",
+    "fan_out",
+    "diamond",
+    "auto_chain",
+    "BenchResult",
+    "create_app",
+    "run",
+)
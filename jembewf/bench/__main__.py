@@ -0,0 +1,63 @@
+import json
+import click
+from .flows import FLOWS
+from .harness import run
+
+
+@click.command("jembewf-bench")
+@click.option(
+    "--db",
+    "databases",
+    multiple=True,
+    default=["sqlite://"],
+    show_default=True,
+    envvar="BENCH_DATABASE_URL",
+    help="SQLAlchemy database url, can be repeated. Tables are dropped!",
+)
+@click.option(
+    "--flow",
+    "flows",
+    multiple=True,
+    type=click.Choice(list(FLOWS)),
+    help="Synthetic flow, can be repeated. Defaults to all flows.",
+)
+@click.option("-n", "--processes", default=1000, show_default=True)
+@click.option(
+    "--size",
+    default=10,
+    show_default=True,
+    help="Number of states in chain or branches in fan-out.",
+)
+@click.option("--many", is_flag=True, help="Use start_many and proceed_many.")
+@click.option(
+    "--trace-memory/--no-trace-memory",
+    default=True,
+    show_default=True,
+    help="Measure peak memory with tracemalloc (slows down the run).",
+)
+@click.option("--json", "as_json", is_flag=True, help="Print results as JSON lines.")
+def main(
+    databases,
+    flows,
+    processes: int,
+    size: int,
+    many: bool,
+    trace_memory: bool,
+    as_json: bool,
+):
+    """Drive processes of synthetic flows and report throughput"""
+    for db_url in databases:
+        for flow_name in flows or FLOWS:
+            result = run(
+                flow_name,
+                db_url,
+                processes=processes,
+                size=size,
+                many=many,
+                trace_memory=trace_memory,
+            )
+            click.echo(json.dumps(result.as_dict()) if as_json else str(result))
+
+
+if __name__ == "__main__":
+    main()  # pylint: disable=no-value-for-parameter
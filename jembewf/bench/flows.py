@@ -0,0 +1,58 @@
+from typing import Callable, Dict
+from ..flow import Flow
+from ..state import State
+from ..transition import Transition
+
+__all__ = ("linear", "fan_out", "diamond", "auto_chain", "FLOWS")
+
+
+def linear(size: int) -> Flow:
+    """Chain of size states, every step is proceeded by proceed"""
+    flow = Flow("linear")
+    for i in range(size - 1):
+        flow.add(State(f"state{i}").add(Transition(f"state{i + 1}")))
+    flow.add(State(f"state{size - 1}"))
+    return flow.start_with("state0")
+
+
+def fan_out(size: int) -> Flow:
+    """Start state with size transitions to end states"""
+    return (
+        Flow("fan_out")
+        .add(
+            State("start").add(*(Transition(f"branch{i}") for i in range(size))),
+            *(State(f"branch{i}") for i in range(size)),
+        )
+        .start_with("start")
+    )
+
+
+def diamond(size: int) -> Flow:
+    """Start state fanning out to size branches that join in the same end state"""
+    return (
+        Flow("diamond")
+        .add(
+            State("start").add(*(Transition(f"branch{i}") for i in range(size))),
+            *(State(f"branch{i}").add(Transition("end")) for i in range(size)),
+            State("end", join="all"),
+        )
+        .start_with("start")
+    )
+
+
+def auto_chain(size: int) -> Flow:
+    """Chain of size auto states proceeded by start"""
+    flow = Flow("auto_chain")
+    for i in range(size - 1):
+        flow.add(State(f"state{i}").add(Transition(f"state{i + 1}")).auto())
+    flow.add(State(f"state{size - 1}"))
+    return flow.start_with("state0")
+
+
+# synthetic flow factories by name
+FLOWS: Dict[str, Callable[[int], Flow]] = {
+    "linear": linear,
+    "fan_out": fan_out,
+    "diamond": diamond,
+    "auto_chain": auto_chain,
+}
@@ -0,0 +1,203 @@
+from typing import Any, Dict, List, Optional, Tuple
+from dataclasses import asdict, dataclass, field
+import statistics
+import time
+import tracemalloc
+import flask
+from flask_sqlalchemy import SQLAlchemy
+import sqlalchemy as sa
+from ..flow import Flow
+from ..process_mixin import ProcessMixin
+from ..step_mixin import StepMixin
+from .. import JembeWF
+from .flows import FLOWS
+
+__all__ = ("BenchResult", "create_app", "run")
+
+
+@dataclass
+class BenchResult:
+    """Metrics of one benchmark run"""
+
+    flow: str
+    database: str
+    processes: int
+    steps: int = 0
+    elapsed: float = 0.0
+    statements: int = 0
+    start_latencies: List[float] = field(default_factory=list, repr=False)
+    proceed_latencies: List[float] = field(default_factory=list, repr=False)
+    # peak memory allocated by Python while processes were driven, in bytes
+    peak_memory: Optional[int] = None
+
+    @property
+    def steps_per_second(self) -> float:
+        """Created steps per second"""
+        return self.steps / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def sql_per_step(self) -> float:
+        """SQL statements executed per created step"""
+        return self.statements / self.steps if self.steps else 0.0
+
+    @staticmethod
+    def percentile(latencies: List[float], percent: float) -> Optional[float]:
+        """Returns percentile of latencies in seconds, None when there are none"""
+        if not latencies:
+            return None
+        if len(latencies) == 1:
+            return latencies[0]
+        return statistics.quantiles(latencies, n=100, method="inclusive")[
+            int(percent) - 1
+        ]
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Returns metrics as dict without raw latencies"""
+        result = asdict(self)
+        del result["start_latencies"]
+        del result["proceed_latencies"]
+        result.update(
+            steps_per_second=self.steps_per_second,
+            sql_per_step=self.sql_per_step,
+            start_p50=self.percentile(self.start_latencies, 50),
+            start_p99=self.percentile(self.start_latencies, 99),
+            proceed_p50=self.percentile(self.proceed_latencies, 50),
+            proceed_p99=self.percentile(self.proceed_latencies, 99),
+        )
+        return result
+
+    def __str__(self) -> str:
+        def ms(latencies: List[float], percent: float) -> str:
+            value = self.percentile(latencies, percent)
+            return f"{value * 1000:.2f}" if value is not None else "-"
+
+        memory = (
+            f"{self.peak_memory / 2**20:.1f} MB" if self.peak_memory is not None else "-"
+        )
+        return (
+            f"{self.flow:<12} {self.database:<10} {self.steps:>8} steps "
+            f"{self.steps_per_second:10.1f} steps/s "
+            f"start p50/p99 {ms(self.start_latencies, 50)}/"
+            f"{ms(self.start_latencies, 99)} ms "
+            f"proceed p50/p99 {ms(self.proceed_latencies, 50)}/"
+            f"{ms(self.proceed_latencies, 99)} ms "
+            f"{self.sql_per_step:.2f} SQL/step peak {memory}"
+        )
+
+
+def create_app(
+    db_url: str, *flows: Flow, **jwf_params
+) -> Tuple[flask.Flask, SQLAlchemy, JembeWF]:
+    """Creates Flask app with Process and Step models and registred flows
+
+    Tables are dropped and created again, so never point it to database
+    with data you want to keep.
+    """
+    app = flask.Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = db_url
+    db = SQLAlchemy(app)
+
+    class Process(ProcessMixin, db.Model):  # type: ignore
+        """Process"""
+
+    class Step(StepMixin, db.Model):  # type: ignore
+        """Step"""
+
+    jwf = JembeWF(**jwf_params)
+    jwf.add(*flows)
+    jwf.init_app(app, db, Process, Step)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app, db, jwf
+
+
+def run(
+    flow_name: str,
+    db_url: str = "sqlite://",
+    processes: int = 1000,
+    size: int = 10,
+    many: bool = False,
+    trace_memory: bool = True,
+) -> BenchResult:
+    """Drives processes of synthetic flow until they end and collects metrics
+
+    Args:
+        flow_name (str): Name of the synthetic flow from jembewf.bench.FLOWS
+        db_url (str): SQLAlchemy database url, tables are dropped and created
+        processes (int): Number of processes
+        size (int): Number of states in chain or number of branches
+        many (bool): Use start_many/proceed_many instead of start/proceed
+            of every process
+        trace_memory (bool): Measure peak memory with tracemalloc, which
+            slows down the run
+
+    Returns:
+        BenchResult: Collected metrics
+    """
+    flow = FLOWS[flow_name](size)
+    app, db, jwf = create_app(db_url, flow, max_auto_steps=None)
+    result = BenchResult(flow_name, "", processes)
+
+    def count_statement(*_):
+        result.statements += 1
+
+    with app.app_context():
+        result.database = db.engine.dialect.name
+        sa.event.listen(db.engine, "before_cursor_execute", count_statement)
+        started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if trace_memory:
+            tracemalloc.reset_peak()
+        start = time.perf_counter()
+        if many:
+            _run_many(jwf, result, flow.name, processes)
+        else:
+            _run_each(jwf, result, flow.name, processes)
+        result.elapsed = time.perf_counter() - start
+        if trace_memory:
+            result.peak_memory = tracemalloc.get_traced_memory()[1]
+        if started_tracing:
+            tracemalloc.stop()
+        sa.event.remove(db.engine, "before_cursor_execute", count_statement)
+
+        step = jwf.step_model
+        result.steps = db.session.query(sa.func.count(step.id)).scalar()
+        db.session.remove()
+        db.drop_all()
+        db.engine.dispose()
+    return result
+
+
+def _run_each(jwf: JembeWF, result: BenchResult, flow_name: str, processes: int):
+    started = []
+    for _ in range(processes):
+        call_start = time.perf_counter()
+        started.append(jwf.start(flow_name))
+        result.start_latencies.append(time.perf_counter() - call_start)
+    jwf.db.session.commit()
+
+    for process in started:
+        process.load_steps()
+        while process.is_running:
+            call_start = time.perf_counter()
+            if not process.proceed():
+                break
+            result.proceed_latencies.append(time.perf_counter() - call_start)
+    jwf.db.session.commit()
+
+
+def _run_many(jwf: JembeWF, result: BenchResult, flow_name: str, processes: int):
+    call_start = time.perf_counter()
+    started = jwf.start_many(flow_name, ({} for _ in range(processes)))
+    result.start_latencies.append(time.perf_counter() - call_start)
+    jwf.db.session.commit()
+
+    process_ids = [process.id for process in started]
+    while process_ids:
+        call_start = time.perf_counter()
+        proceeded = jwf.proceed_many(process_ids)
+        result.proceed_latencies.append(time.perf_counter() - call_start)
+        jwf.db.session.commit()
+        process_ids = [pid for pid in process_ids if pid in proceeded]
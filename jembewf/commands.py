@@ -0,0 +1,141 @@
+from typing import Tuple
+from datetime import timedelta
+import click
+from flask.cli import with_appcontext
+from .archive import Archiver
+from .definitions import compile_flows, flows_from_file
+from .helpers import get_jembewf
+from .runner import Runner
+from .scheduler import Scheduler
+from .schema import create_indexes
+
+__all__ = ("cli",)
+
+
+@click.group("jembewf")
+def cli():
+    """Jembe Workflow Management commands"""
+
+
+@cli.command("run")
+@click.option("--batch-size", default=100, show_default=True, help="Steps per batch.")
+@click.option(
+    "--idle-sleep",
+    default=1.0,
+    show_default=True,
+    help="Seconds to sleep when there is no step to proceed.",
+)
+@click.option("--once", is_flag=True, help="Go only once through active steps.")
+@with_appcontext
+def run_command(batch_size: int, idle_sleep: float, once: bool):
+    """Proceed active steps of running processes"""
+    runner = Runner(batch_size=batch_size, idle_sleep=idle_sleep)
+    try:
+        if once:
+            runner.run_once()
+        else:
+            runner.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        click.echo(str(runner.stats))
+
+
+@cli.command("schedule")
+@click.option("--batch-size", default=100, show_default=True, help="Steps per batch.")
+@click.option(
+    "--max-sleep",
+    default=60.0,
+    show_default=True,
+    help="Maximum seconds to sleep until next due step.",
+)
+@click.option(
+    "--retry-delay",
+    default=60.0,
+    show_default=True,
+    help="Seconds to wait before retrying due transitions that can't proceed.",
+)
+@click.option("--once", is_flag=True, help="Proceed only steps that are due now.")
+@with_appcontext
+def schedule_command(batch_size: int, max_sleep: float, retry_delay: float, once: bool):
+    """Proceed steps whose timed transitions are due"""
+    scheduler = Scheduler(
+        batch_size=batch_size, max_sleep=max_sleep, retry_delay=retry_delay
+    )
+    try:
+        if once:
+            scheduler.run_due()
+        else:
+            scheduler.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        click.echo(str(scheduler.stats))
+
+
+@cli.command("archive")
+@click.option(
+    "--days",
+    default=30,
+    show_default=True,
+    help="Archive processes ended more than days ago.",
+)
+@click.option(
+    "--batch-size", default=1000, show_default=True, help="Processes per batch."
+)
+@click.option(
+    "--path",
+    default=None,
+    help="Append processes to JSONL file (gzip when it ends with .gz) "
+    "instead of archive tables.",
+)
+@with_appcontext
+def archive_command(days: int, batch_size: int, path: str):
+    """Move ended processes and their steps to archive"""
+    archiver = Archiver(
+        older_than=timedelta(days=days), batch_size=batch_size, path=path
+    )
+    try:
+        archiver.run()
+    finally:
+        click.echo(
+            f"Archived {archiver.archived_processes} processes "
+            f"and {archiver.archived_steps} steps"
+        )
+
+
+@cli.command("compact")
+@click.option(
+    "--batch-size", default=100, show_default=True, help="Processes per batch."
+)
+@with_appcontext
+def compact_command(batch_size: int):
+    """Collapse old steps of flows configured with Flow.compact_steps"""
+    deleted = get_jembewf().compact_steps(batch_size=batch_size)
+    click.echo(f"Compacted {deleted} steps")
+
+
+@cli.command("compile-flows")
+@click.argument("snapshot")
+@click.argument("definitions", nargs=-1)
+@with_appcontext
+def compile_flows_command(snapshot: str, definitions: Tuple[str, ...]):
+    """Compile flows to SNAPSHOT file loaded by JembeWF.load_snapshot
+
+    Flows are created from DEFINITIONS (JSON or YAML files), without them
+    flows registered in JembeWF are compiled.
+    """
+    if definitions:
+        flows = [flow for path in definitions for flow in flows_from_file(path)]
+    else:
+        flows = list(get_jembewf().flows.values())
+    compiled = compile_flows(flows, snapshot)
+    click.echo(f"Compiled {len(compiled)} flows to {snapshot}")
+
+
+@cli.command("create-indexes")
+@with_appcontext
+def create_indexes_command():
+    """Create missing indexes on process and step tables"""
+    for index_name in create_indexes():
+        click.echo(f"Created index {index_name}")
@@ -0,0 +1,224 @@
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+from datetime import timedelta
+import json
+import os
+import pickle
+import tempfile
+from .flow import Flow
+from .helpers import import_string
+from .state import State
+from .transition import Transition
+
+if TYPE_CHECKING:
+    import jembewf
+
+__all__ = (
+    "FlowSnapshot",
+    "flow_from_dict",
+    "flows_from_file",
+    "compile_flows",
+    "load_snapshot",
+)
+
+# types of declared variables by name, other types are given with import path
+VARIABLE_TYPES = {
+    "str": str,
+    "int": int,
+    "float": float,
+    "bool": bool,
+    "dict": dict,
+    "list": list,
+}
+
+
+class FlowSnapshot(NamedTuple):
+    """Pickled flow with declarations JembeWF needs before the flow is unpickled"""
+
+    pickled: bytes
+    has_event_transitions: bool
+    # declared variables with index=True
+    indexed_variables: Tuple["jembewf.FlowVariable", ...]
+    # Flow.compact_steps keep, so JembeWF.compact_steps doesn't unpickle the flow
+    keep_steps: Optional[int] = None
+
+
+def flow_from_dict(definition: Dict[str, Any]) -> "jembewf.Flow":
+    """Creates flow from its declarative definition
+
+    Example of the definition (as YAML):
+
+        name: order
+        callback: myapp.flows:OrderCallback
+        start_with: [new]
+        compact_steps: 10
+        variables:
+          - {name: customer_id, type: int, index: true}
+        states:
+          - name: new
+            callback: myapp.flows:NewCallback
+            auto: true
+            transitions:
+              - {to: approved, callback: myapp.flows:ApproveCallback}
+              - {to: escalated, after: 86400}
+              - {to: paid, on: invoice.paid, key: myapp.flows:invoice_key}
+          - {name: approved}
+          - {name: escalated}
+          - {name: paid, join: all}
+
+    Callbacks and functions (at, key) are import paths, after is in seconds
+    and config of flows, states and transitions is given as config mapping.
+
+    Raises:
+        ValueError: When definition has unknown keys
+    """
+    _check_keys(
+        definition,
+        "flow",
+        {
+            "name",
+            "callback",
+            "config",
+            "start_with",
+            "compact_steps",
+            "variables",
+            "states",
+        },
+    )
+    flow = Flow(
+        definition["name"],
+        _import(definition.get("callback")),
+        **definition.get("config", {}),
+    )
+    flow.add(*(_state_from_dict(state) for state in definition.get("states", [])))
+    for variable in definition.get("variables", []):
+        _check_keys(variable, "variable", {"name", "type", "default", "index"})
+        type_ = variable.get("type")
+        if isinstance(type_, str):
+            type_ = VARIABLE_TYPES.get(type_) or import_string(type_)
+        flow.variable(
+            variable["name"],
+            type_,
+            variable.get("default"),
+            variable.get("index", False),
+        )
+    if definition.get("compact_steps") is not None:
+        flow.compact_steps(definition["compact_steps"])
+    return flow.start_with(*definition.get("start_with", []))
+
+
+def flows_from_file(path: str) -> List["jembewf.Flow"]:
+    """Creates flows defined in JSON or YAML (.yaml, .yml) file
+
+    File contains list of flow definitions (see flow_from_dict) or
+    mapping with the list under "flows" key. YAML requires PyYAML.
+    """
+    with open(path, "r", encoding="utf-8") as definition_file:
+        if path.endswith((".yaml", ".yml")):
+            try:
+                import yaml  # pylint: disable=import-outside-toplevel
+            except ImportError as err:
+                raise Exception(
+                    "PyYAML must be installed to load flows from YAML files."
+                ) from err
+            definitions = yaml.safe_load(definition_file)
+        else:
+            definitions = json.load(definition_file)
+    if isinstance(definitions, dict):
+        definitions = definitions.get("flows", [])
+    return [flow_from_dict(definition) for definition in definitions]
+
+
+def compile_flows(
+    flows: Iterable["jembewf.Flow"], path: str
+) -> Dict[str, FlowSnapshot]:
+    """Pickles validated flows one by one and saves them to snapshot file
+
+    Load the snapshot with JembeWF.load_snapshot: flows are unpickled only
+    when they are used, without validating them and computing
+    transition names again.
+
+    Returns:
+        Dict[str, FlowSnapshot]: Saved snapshots of the flows by flow name
+    """
+    snapshots = {}
+    for flow in flows:
+        if flow.name in snapshots:
+            raise Exception(f"Flow with same name '{flow.name}' is already compiled.")
+        snapshots[flow.name] = FlowSnapshot(
+            pickle.dumps(flow, protocol=pickle.HIGHEST_PROTOCOL),
+            flow.has_event_transitions,
+            tuple(v for v in flow.variables.values() if v.index),
+            flow.keep_steps,
+        )
+
+    # write to temporary file and rename it so workers never read half of it
+    directory = os.path.dirname(os.path.abspath(path))
+    with tempfile.NamedTemporaryFile(
+        "wb", dir=directory, delete=False
+    ) as snapshot_file:
+        pickle.dump(snapshots, snapshot_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(snapshot_file.name, path)
+    return snapshots
+
+
+def load_snapshot(path: str) -> Dict[str, FlowSnapshot]:
+    """Returns snapshots of the flows saved by compile_flows"""
+    with open(path, "rb") as snapshot_file:
+        return pickle.load(snapshot_file)
+
+
+def _state_from_dict(definition: Dict[str, Any]) -> "jembewf.State":
+    _check_keys(
+        definition,
+        "state",
+        {"name", "callback", "auto", "join", "config", "transitions"},
+    )
+    state = State(
+        definition["name"],
+        _import(definition.get("callback")),
+        join=definition.get("join"),
+        **definition.get("config", {}),
+    )
+    for transition in definition.get("transitions", []):
+        _check_keys(
+            transition,
+            "transition",
+            {"to", "callback", "after", "at", "on", "key", "config"},
+        )
+        after = transition.get("after")
+        state.add(
+            Transition(
+                transition["to"],
+                _import(transition.get("callback")),
+                after=timedelta(seconds=after) if after is not None else None,
+                at=_import(transition.get("at")),
+                on=transition.get("on"),
+                key=_import(transition.get("key")),
+                **transition.get("config", {}),
+            )
+        )
+    if definition.get("auto", False):
+        state.auto()
+    return state
+
+
+def _import(path: Any) -> Any:
+    return import_string(path) if isinstance(path, str) else path
+
+
+def _check_keys(definition: Dict[str, Any], kind: str, keys: set):
+    unknown = set(definition).difference(keys)
+    if unknown:
+        raise ValueError(
+            f"Unknown keys {sorted(unknown)} in {kind} definition "
+            f"'{definition.get('name', definition.get('to'))}'."
+        )
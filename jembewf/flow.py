@@ -1,4 +1,6 @@
-from typing import TYPE_CHECKING, Type, Dict, Optional, List, Union
+from typing import TYPE_CHECKING, Any, Type, Dict, Optional, List, Union
+from .graph import FlowGraph
+from .variables import FlowVariable
 
 if TYPE_CHECKING:
     import jembewf
@@ -27,6 +29,23 @@ class FlowCallback:
         """
         return True
 
+    @classmethod
+    def can_start_flow(
+        cls, flow: "jembewf.Flow", **process_vars
+    ) -> Optional[Union[bool, "jembewf.CanProceed"]]:
+        """Check if a flow can be started using only process variables
+
+        Override this method instead of can_start to check if process
+        can be started without creating process instance first.
+        Default returns None which means that can_start of the process
+        instance callback is used.
+
+        Returns:
+            Optional[Union[bool, jembewf.CanProceed]]: None to use can_start,
+                otherwise same as can_start.
+        """
+        return None
+
     def callback(self):
         """Called right after process is created and before startit transitions"""
 
@@ -50,6 +69,15 @@ class Flow:
         self.ends_with_states: List[str] = []
 
         self.validated = False
+        # compiled graph of the flow, available after start_with
+        self.graph: "jembewf.FlowGraph"
+
+        # number of the last inactive steps per state kept by compaction,
+        # None to never compact steps
+        self.keep_steps: Optional[int] = None
+
+        # declared process variables by name
+        self.variables: Dict[str, "jembewf.FlowVariable"] = {}
 
     def start_with(self, *state_names: str) -> "jembewf.Flow":
         """Define state names that will be executed when flow starts
@@ -74,12 +102,72 @@ class Flow:
         # Can't be done earlier because we need to define have
         # all states defined to associate to_state
         for state in self.states.values():
-            for transition in state.transitions:
-                transition.attach_to_from_state(state)
+            for transition_id, transition in enumerate(state.transitions):
+                transition.attach_to_from_state(state, transition_id)
 
         self._validate_flow()
+        self.graph = FlowGraph.compile(self)
+        return self
+
+    def compact_steps(self, keep: int = 10) -> "jembewf.Flow":
+        """Keep only last keep inactive steps per state when steps are compacted
+
+        Older inactive steps of the state are collapsed into one summary step
+        by JembeWF.compact_steps (or "flask jembewf compact"), which is useful
+        for flows that loop between states.
+        """
+        if keep < 0:
+            raise ValueError("Number of kept steps can't be negative.")
+        self.keep_steps = keep
+        return self
+
+    def variable(
+        self,
+        name: str,
+        type_: Optional[type] = None,
+        default: Any = None,
+        index: bool = False,
+    ) -> "jembewf.Flow":
+        """Declares typed process variable
+
+        Values of the variable passed when process is started or assigned
+        to process.vars must be instances of type_, and process.vars returns
+        default when process doesn't have the variable.
+        With index=True index used by JembeWF.find_processes is declared
+        for the variable when JembeWF is initialised.
+        """
+        self.variables[name] = FlowVariable(name, type_, default, index)
         return self
 
+    def check_variables(self, variables: Dict[str, Any]) -> Dict[str, Any]:
+        """Returns variables with values of declared variables checked
+
+        Raises:
+            ValueError: When value is not of the type of the declared variable
+        """
+        return {
+            name: self.variables[name].check(value)
+            if name in self.variables
+            else value
+            for name, value in variables.items()
+        }
+
+    @property
+    def has_event_transitions(self) -> bool:
+        """True when any of the states has transitions waiting on events"""
+        return any(state.event_transitions for state in self.states.values())
+
+    def __getstate__(self):
+        """Pickles flow without graph, it is compiled again when unpickled"""
+        state = self.__dict__.copy()
+        state.pop("graph", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.validated:
+            self.graph = FlowGraph.compile(self)
+
     def add(self, *states: "jembewf.State") -> "jembewf.Flow":
         """Add States to flow
 
@@ -0,0 +1,49 @@
+from typing import TYPE_CHECKING, Mapping, Tuple
+from dataclasses import dataclass
+from types import MappingProxyType
+
+if TYPE_CHECKING:
+    import jembewf
+
+__all__ = ("FlowGraph",)
+
+
+@dataclass(frozen=True)
+class FlowGraph:
+    """Immutable graph of the Flow compiled when flow definition is completed
+
+    States are identified by integer ids (position in state_names) so
+    in_degree is kept in tuple indexed by state id. Join states get their
+    join_count from it.
+    """
+
+    state_names: Tuple[str, ...]
+    state_ids: Mapping[str, int]
+    # transitions of all states by transition name
+    transitions: Mapping[str, "jembewf.Transition"]
+    # number of transitions leading to the state
+    in_degree: Tuple[int, ...]
+
+    @classmethod
+    def compile(cls, flow: "jembewf.Flow") -> "jembewf.FlowGraph":
+        """Compiles graph of the flow, transitions must be attached to states"""
+        state_names = tuple(flow.states.keys())
+        state_ids = {name: state_id for state_id, name in enumerate(state_names)}
+
+        transitions = {}
+        in_degree = [0] * len(state_names)
+        for state in flow.states.values():
+            for transition in state.transitions:
+                transitions[transition.name] = transition
+                in_degree[state_ids[transition.to_state_name]] += 1
+            state.compile()
+        for state_id, state in enumerate(flow.states.values()):
+            if state.join:
+                state.join_count = in_degree[state_id]
+
+        return cls(
+            state_names=state_names,
+            state_ids=MappingProxyType(state_ids),
+            transitions=MappingProxyType(transitions),
+            in_degree=tuple(in_degree),
+        )
@@ -1,5 +1,7 @@
-from typing import TYPE_CHECKING, Optional, Union
+from typing import TYPE_CHECKING, Any, Optional, Union
 from dataclasses import dataclass
+import importlib
+import inspect
 from flask import current_app
 
 if TYPE_CHECKING:
@@ -8,6 +10,9 @@ if TYPE_CHECKING:
 __all__ = (
     "CanProceed",
     "get_jembewf",
+    "ensure_sync",
+    "maybe_await",
+    "import_string",
 )
 
 
@@ -59,3 +64,49 @@ def get_jembewf() -> "jembewf.JembeWF":
     if jembewf_instance is None:
         raise Exception("JembeWF extension is not initialised")
     return jembewf_instance
+
+
+def ensure_sync(result: Any, callback: Any) -> Any:
+    """Returns result of the synchronous callback method
+
+    Raises:
+        Exception: When callback method is async (returned awaitable), async callbacks
+            can only be used with aproceed
+    """
+    if inspect.isawaitable(result):
+        if inspect.iscoroutine(result):
+            result.close()
+        raise Exception(
+            f"Callback '{type(callback).__name__}' is async and can be used only "
+            "with aproceed."
+        )
+    return result
+
+
+def import_string(path: str) -> Any:
+    """Imports object from dotted path "package.module:name"
+
+    "package.module.name" is also accepted.
+
+    Raises:
+        ValueError: When path is not valid or object doesn't exist
+    """
+    module_name, _, name = path.partition(":")
+    if not name:
+        module_name, _, name = path.rpartition(".")
+    if not module_name or not name:
+        raise ValueError(f"Import path '{path}' must be 'package.module:name'.")
+    obj = importlib.import_module(module_name)
+    for attr in name.split("."):
+        try:
+            obj = getattr(obj, attr)
+        except AttributeError as err:
+            raise ValueError(f"Can't import '{path}'.") from err
+    return obj
+
+
+async def maybe_await(result: Any) -> Any:
+    """Awaits result of the callback method if it is awaitable"""
+    if inspect.isawaitable(result):
+        return await result
+    return result
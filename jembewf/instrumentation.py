@@ -0,0 +1,165 @@
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional
+from contextlib import contextmanager, nullcontext
+import contextvars
+import threading
+import time
+import sqlalchemy as sa
+
+if TYPE_CHECKING:
+    from flask import Flask
+    from flask_sqlalchemy import SQLAlchemy
+
+__all__ = ("Span", "Instrumentation", "OpenTelemetryInstrumentation")
+
+# returned instead of span when instrumentation is not set
+NO_SPAN = nullcontext()
+
+
+class Span:
+    """Timed operation on the hot path of JembeWF
+
+    Spans are nested, statements and rows of the span include statements and rows
+    of its child spans.
+    """
+
+    def __init__(
+        self, name: str, attributes: Dict[str, Any], parent: Optional["Span"] = None
+    ):
+        self.name = name
+        self.attributes = attributes
+        self.parent = parent
+        # wall time in seconds
+        self.duration = 0.0
+        # SQL statements executed while span was open
+        self.statements = 0
+        # rows inserted, updated or deleted while span was open
+        self.rows = 0
+        self.error: Optional[BaseException] = None
+
+    def __repr__(self):
+        return (
+            f"<Span {self.name} {self.attributes} {self.duration * 1000:.3f} ms "
+            f"statements={self.statements} rows={self.rows}>"
+        )
+
+
+class Instrumentation:
+    """Records spans around create, proceed, can_proceed and callbacks
+
+    Every hook is called with the ended Span:
+
+        jwf = JembeWF(instrumentation=Instrumentation(print))
+
+    Span names are:
+
+        process.create, process.proceed, step.create, step.proceed,
+        step.can_proceed and callback (callback, can_start and can_proceed
+        methods of flow, state and transition callbacks)
+
+    SQL statements are counted per thread, so spans of coroutines running
+    concurrently with aproceed include statements of each other.
+
+    Extend this class and override span_started/span_ended to send spans
+    elsewhere.
+    """
+
+    def __init__(self, *hooks: Callable[[Span], Any]):
+        self.hooks: List[Callable[[Span], Any]] = list(hooks)
+        self._current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+            f"jembewf_span_{id(self)}", default=None
+        )
+        self._counters = threading.local()
+
+    def init_app(self, app: "Flask", db: "SQLAlchemy"):
+        """Counts statements and rows of db engines, called by JembeWF.init_app"""
+        with app.app_context():
+            for engine in db.engines.values():
+                sa.event.listen(engine, "after_cursor_execute", self._after_execute)
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        """Opens span as child of the current span"""
+        span = Span(name, attributes, self._current.get())
+        token = self._current.set(span)
+        counters = self._get_counters()
+        statements, rows = counters
+        self.span_started(span)
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as error:
+            span.error = error
+            raise
+        finally:
+            span.duration = time.perf_counter() - start
+            span.statements = counters[0] - statements
+            span.rows = counters[1] - rows
+            self._current.reset(token)
+            self.span_ended(span)
+
+    def span_started(self, span: Span):
+        """Called when span is opened"""
+
+    def span_ended(self, span: Span):
+        """Called with ended span, calls hooks"""
+        for hook in self.hooks:
+            hook(span)
+
+    def _get_counters(self) -> List[int]:
+        counters = getattr(self._counters, "value", None)
+        if counters is None:
+            counters = self._counters.value = [0, 0]
+        return counters
+
+    def _after_execute(
+        self, conn, cursor, statement, parameters, context, executemany
+    ):  # pylint: disable=too-many-arguments
+        counters = self._get_counters()
+        counters[0] += 1
+        if context is not None and (
+            context.isinsert or context.isupdate or context.isdelete
+        ):
+            rows = cursor.rowcount
+            if rows <= 0 and context.isinsert:
+                # some drivers (sqlite) report rowcount of INSERT ... RETURNING
+                # only after rows are fetched
+                rows = len(parameters) if executemany else 1
+            counters[1] += max(rows, 0)
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    """Sends spans to OpenTelemetry tracer
+
+    Requires opentelemetry-api package. Attributes are prefixed with "jembewf."
+    and jembewf.statements and jembewf.rows are set when span ends.
+    """
+
+    def __init__(self, *hooks: Callable[[Span], Any], tracer: Any = None):
+        super().__init__(*hooks)
+        if tracer is None:
+            from opentelemetry import trace  # pylint: disable=import-outside-toplevel
+
+            tracer = trace.get_tracer("jembewf")
+        self.tracer = tracer
+        self._contexts: Dict[int, Any] = {}
+
+    def span_started(self, span: Span):
+        context = self.tracer.start_as_current_span(
+            f"jembewf.{span.name}",
+            attributes={
+                f"jembewf.{key}": value
+                for key, value in span.attributes.items()
+                if value is not None
+            },
+        )
+        self._contexts[id(span)] = (context, context.__enter__())
+
+    def span_ended(self, span: Span):
+        context, otel_span = self._contexts.pop(id(span))
+        otel_span.set_attribute("jembewf.statements", span.statements)
+        otel_span.set_attribute("jembewf.rows", span.rows)
+        if span.error is not None:
+            context.__exit__(type(span.error), span.error, span.error.__traceback__)
+        else:
+            context.__exit__(None, None, None)
+        super().span_ended(span)
@@ -0,0 +1,453 @@
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Deque,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+from collections import deque
+from datetime import datetime
+from itertools import count
+from .helpers import CanProceed, ensure_sync
+from .process_mixin import CantStartProcess
+
+if TYPE_CHECKING:
+    import jembewf
+
+__all__ = ("MemoryStore", "MemoryProcess", "MemoryStep")
+
+
+class MemoryProcess:
+    """Process of the MemoryStore, same API as ProcessMixin used by callbacks"""
+
+    __slots__ = (
+        "store",
+        "id",
+        "flow",
+        "variables",
+        "is_running",
+        "started_at",
+        "ended_at",
+        "steps",
+        "active_steps",
+        "joins",
+        "_callback",
+    )
+
+    def __init__(
+        self, store: "MemoryStore", flow: "jembewf.Flow", variables: Dict[str, Any]
+    ):
+        self.store = store
+        self.id: Optional[int] = None
+        self.flow = flow
+        self.variables = variables
+        self.is_running = True
+        self.started_at = datetime.utcnow()
+        self.ended_at: Optional[datetime] = None
+        self.steps: List["MemoryStep"] = []
+        # active steps by step id
+        self.active_steps: Dict[int, "MemoryStep"] = {}
+        # waiting step and names of arrived transitions to join states
+        # (State(join="all")) by state name
+        self.joins: Dict[str, Tuple["MemoryStep", Set[str]]] = {}
+        self._callback: Optional["jembewf.FlowCallback"] = None
+
+    @property
+    def flow_name(self) -> str:
+        """Name of the flow of the process"""
+        return self.flow.name
+
+    @property
+    def callback(self) -> "jembewf.FlowCallback":
+        """FlowCallback of the flow instance"""
+        if self._callback is None:
+            self._callback = self.flow.callback(self)
+        return self._callback
+
+    @property
+    def vars(self) -> Dict[str, Any]:
+        """Process variables, same as variables"""
+        return self.variables
+
+    def current_steps(self) -> List["MemoryStep"]:
+        """Returns current active process steps"""
+        return list(self.active_steps.values())
+
+    def last_steps(self) -> List["MemoryStep"]:
+        """Returns last steps of the process"""
+        return [step for step in self.steps if step.is_last_step]
+
+    def proceed(self) -> bool:
+        """Proceed with process execution
+
+        Returns True if process proceed to new steps
+        """
+        proceeded = False
+        for step in self.current_steps():
+            if not step.is_last_step and step.proceed():
+                proceeded = True
+        return proceeded
+
+    def check_is_running(self) -> bool:
+        """Check if process is still running and update is_running if necessary"""
+        is_running = bool(self.active_steps)
+        if self.is_running != is_running:
+            self.is_running = is_running
+            self.ended_at = datetime.utcnow()
+        return is_running
+
+    def __repr__(self):
+        return f"<MemoryProcess #{self.id}: '{self.flow_name}'>"
+
+
+class MemoryStep:
+    """Step of the MemoryStore, same API as StepMixin used by callbacks"""
+
+    __slots__ = (
+        "id",
+        "process",
+        "state",
+        "variables",
+        "is_active",
+        "is_last_step",
+        "started_at",
+        "ended_at",
+        "prev_step",
+        "due_at",
+        "_callback",
+    )
+
+    def __init__(
+        self,
+        process: MemoryProcess,
+        state: "jembewf.State",
+        prev_step: Optional["MemoryStep"] = None,
+        **step_vars,
+    ):
+        self.id: int = next(process.store._step_ids)  # pylint: disable=protected-access
+        self.process = process
+        self.state = state
+        self.variables = step_vars
+        self.is_active = True
+        self.is_last_step = state.is_end
+        self.started_at = datetime.utcnow()
+        self.ended_at: Optional[datetime] = None
+        self.prev_step = prev_step
+        self.due_at = state.next_due_at(self) if state.timed_transitions else None
+        self._callback: Optional["jembewf.StateCallback"] = None
+
+    @property
+    def process_id(self) -> Optional[int]:
+        """Id of the process of the step"""
+        return self.process.id
+
+    @property
+    def state_name(self) -> str:
+        """Name of the state of the step"""
+        return self.state.name
+
+    @property
+    def callback(self) -> "jembewf.StateCallback":
+        """StateCallback of the state instance"""
+        if self._callback is None:
+            self._callback = self.state.callback(self)
+        return self._callback
+
+    def proceed(
+        self, transition: Optional["jembewf.Transition"] = None, **transition_params
+    ) -> Union[bool, "jembewf.CanProceed"]:
+        """Proceed process with transition from this step
+
+        See StepMixin.proceed
+        """
+        return self.proceed_transitions(
+            [transition] if transition else None, **transition_params
+        )
+
+    def proceed_transitions(
+        self,
+        transitions: Optional[Sequence["jembewf.Transition"]] = None,
+        **transition_params,
+    ) -> Union[bool, "jembewf.CanProceed"]:
+        """Proceed process with transitions from this step
+
+        See StepMixin.proceed_transitions
+        """
+        store = self.process.store
+        return store._proceed_auto_steps(  # pylint: disable=protected-access
+            self._proceeding(transitions, **transition_params)
+        )
+
+    def can_proceed(
+        self, transition: Optional["jembewf.Transition"] = None
+    ) -> Union[bool, "jembewf.CanProceed"]:
+        """Check if process can proceed
+
+        See StepMixin.can_proceed
+        """
+        cannot_proceed = CanProceed(False)
+        for trans in self._get_transitions([transition] if transition else None):
+            if not (due := trans.check_due(self)):
+                cannot_proceed.append_reason(due)
+                continue
+            transition_callback = trans.callback(trans, self)
+            if can_proceed := ensure_sync(
+                transition_callback.can_proceed(), transition_callback
+            ):
+                return True
+            cannot_proceed.append_reason(can_proceed)
+        return cannot_proceed
+
+    def _proceeding(
+        self,
+        transitions: Optional[Sequence["jembewf.Transition"]] = None,
+        **transition_params,
+    ) -> Generator["MemoryStep", None, Union[bool, "jembewf.CanProceed"]]:
+        if self.is_last_step or not self.is_active:
+            return False
+
+        now = datetime.utcnow()
+        store = self.process.store
+        proceeded = False
+        cannot_proceed = CanProceed(False)
+        for trans in self._get_transitions(transitions):
+            if not (can_proceed := trans.check_due(self, now)):
+                cannot_proceed.append_reason(can_proceed)
+                continue
+            transition_callback = trans.callback(trans, self, **transition_params)
+            if not (
+                can_proceed := ensure_sync(
+                    transition_callback.can_proceed(), transition_callback
+                )
+            ):
+                cannot_proceed.append_reason(can_proceed)
+                continue
+            auto_steps: Deque[MemoryStep] = deque()
+            store._create(  # pylint: disable=protected-access
+                self.process,
+                transition_callback.to_state,
+                auto_steps,
+                self,
+                transition_callback,
+            )
+            proceeded = True
+            yield from auto_steps
+        if not proceeded:
+            return cannot_proceed
+
+        store._deactivate(self)  # pylint: disable=protected-access
+        self.process.check_is_running()
+        return True
+
+    def _get_transitions(
+        self, transitions: Optional[Sequence["jembewf.Transition"]] = None
+    ) -> Sequence["jembewf.Transition"]:
+        if transitions is None:
+            return self.state.direct_transitions
+        for transition in transitions:
+            if not self.state.owns(transition):
+                raise ValueError(
+                    f"Transition '{transition}' is not transition from state '{self.state}'"
+                )
+        return transitions
+
+    def __repr__(self):
+        return f"<MemoryStep #{self.id}: '{self.state_name}' from process #{self.process_id}: '{self.process.flow_name}'>"
+
+
+class MemoryStore:
+    """Runs flows without database, processes and steps are kept in memory
+
+    Use it for simulations, tests and short lived pipelines. Flow, State and
+    Transition definitions and their callbacks are the same as with JembeWF
+    and SQLAlchemy models, but nothing is persisted and no Flask application
+    is required (as long as callbacks don't use get_jembewf).
+
+    Active steps are indexed by flow and state name and by process, so finding
+    steps waiting in a state doesn't scan all steps.
+    """
+
+    def __init__(self, *flows: "jembewf.Flow", max_auto_steps: Optional[int] = 10000):
+        self.flows: Dict[str, "jembewf.Flow"] = {}
+        self.max_auto_steps = max_auto_steps
+        self.processes: Dict[int, MemoryProcess] = {}
+        # active steps by flow name, state name and step id
+        self.active: Dict[str, Dict[str, Dict[int, MemoryStep]]] = {}
+        self._process_ids = count(1)
+        self._step_ids = count(1)
+        self.add(*flows)
+
+    def add(self, *flows: "jembewf.Flow") -> "MemoryStore":
+        """Add/Register Flow definition"""
+        for flow in flows:
+            if flow.name in self.flows:
+                raise Exception(
+                    f"Flow with same name '{flow.name}' is already registred."
+                )
+            self.flows[flow.name] = flow
+            self.active[flow.name] = {state_name: {} for state_name in flow.states}
+        return self
+
+    def get_flow(self, flow_name: str) -> "jembewf.Flow":
+        """Returns flow instance by flow name
+
+        Raises:
+            ValueError: When flow with provided name doesn't exist
+        """
+        try:
+            return self.flows[flow_name]
+        except KeyError as err:
+            raise ValueError(f"Flow '{flow_name}' doesn't exit!") from err
+
+    def can_start(self, flow_name: str, **process_vars) -> bool:
+        """Check if process from flow definition can be started"""
+        flow = self.get_flow(flow_name)
+        can_start = flow.callback.can_start_flow(flow, **process_vars)
+        if can_start is not None:
+            return can_start
+        return MemoryProcess(self, flow, process_vars).callback.can_start()
+
+    def start(self, flow_name: str, **process_vars) -> MemoryProcess:
+        """Start Process instance from Flow definition
+
+        Raises:
+            CantStartProcess: When process can't be started
+        """
+        flow = self.get_flow(flow_name)
+        process = MemoryProcess(self, flow, flow.check_variables(process_vars))
+        can_start = flow.callback.can_start_flow(flow, **process_vars)
+        if can_start is None:
+            can_start = process.callback.can_start()
+        if not can_start:
+            raise CantStartProcess(
+                f"Can't start process '{flow_name}' with process vars: {process_vars}"
+            )
+
+        process.id = next(self._process_ids)
+        self.processes[process.id] = process
+        process.callback.callback()
+        auto_steps: Deque[MemoryStep] = deque()
+        for state_name in flow.starts_with_states:
+            self._create(process, flow.states[state_name], auto_steps)
+        self._proceed_auto_steps(auto_steps)
+        return process
+
+    def active_steps(
+        self, flow_name: str, state_name: Optional[str] = None
+    ) -> Iterator[MemoryStep]:
+        """Returns active steps of the flow, only in the state when state_name is provided"""
+        states = self.active[flow_name]
+        if state_name is not None:
+            return iter(list(states[state_name].values()))
+        return iter([step for steps in states.values() for step in steps.values()])
+
+    def proceed_all(self) -> int:
+        """Proceeds every active step once
+
+        Steps created while proceeding are not proceeded (except auto steps).
+
+        Returns number of proceeded steps.
+        """
+        steps = [
+            step
+            for states in self.active.values()
+            for steps in states.values()
+            for step in steps.values()
+            if not step.is_last_step
+        ]
+        steps.sort(key=lambda step: step.id)
+        return sum(1 for step in steps if step.proceed())
+
+    def signal(self, event: str, key: Optional[Any] = None, **params) -> Set[int]:
+        """Proceed steps waiting on the event
+
+        See JembeWF.signal
+        """
+        key = str(key) if key is not None else None
+        process_ids = set()
+        for flow in self.flows.values():
+            for state in flow.states.values():
+                transitions = [t for t in state.event_transitions if t.on == event]
+                if not transitions:
+                    continue
+                for step in list(self.active[flow.name][state.name].values()):
+                    step_transitions = [
+                        t
+                        for t in transitions
+                        if key is None or t.event_key(step) == key
+                    ]
+                    if step_transitions and step.proceed_transitions(
+                        step_transitions, **params
+                    ):
+                        process_ids.add(step.process.id)
+        return process_ids
+
+    def _create(
+        self,
+        process: MemoryProcess,
+        state: "jembewf.State",
+        auto_steps: Deque[MemoryStep],
+        prev_step: Optional[MemoryStep] = None,
+        transition_callback: Optional["jembewf.TransitionCallback"] = None,
+    ) -> MemoryStep:
+        if state.join and transition_callback:
+            step, arrived = process.joins.get(state.name, (None, set()))
+            if step is None:
+                step = MemoryStep(process, state, prev_step)
+                step.is_active = False
+                process.steps.append(step)
+            arrived.add(transition_callback.transition.name)
+            if len(arrived) < state.join_count:
+                process.joins[state.name] = (step, arrived)
+                ensure_sync(transition_callback.callback(step), transition_callback)
+                return step
+            process.joins.pop(state.name, None)
+            step.is_active = True
+        else:
+            step = MemoryStep(process, state, prev_step)
+            process.steps.append(step)
+        process.active_steps[step.id] = step
+        self.active[process.flow.name][state.name][step.id] = step
+
+        if transition_callback:
+            ensure_sync(transition_callback.callback(step), transition_callback)
+        ensure_sync(step.callback.callback(), step.callback)
+
+        if step.is_last_step:
+            self._deactivate(step)
+        elif state.auto_proceed:
+            auto_steps.append(step)
+        return step
+
+    def _deactivate(self, step: MemoryStep):
+        step.is_active = False
+        step.ended_at = datetime.utcnow()
+        del step.process.active_steps[step.id]
+        del self.active[step.process.flow.name][step.state.name][step.id]
+
+    def _proceed_auto_steps(
+        self, auto_steps: Union[Iterable[MemoryStep], Generator]
+    ) -> Any:
+        proceeded = 0
+        result = None
+        stack = [iter(auto_steps)]
+        while stack:
+            try:
+                step = next(stack[-1])
+            except StopIteration as stop:
+                stack.pop()
+                result = stop.value
+                continue
+            if self.max_auto_steps is not None and proceeded >= self.max_auto_steps:
+                continue
+            stack.append(step._proceeding())  # pylint: disable=protected-access
+            proceeded += 1
+        return result
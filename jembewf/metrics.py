@@ -0,0 +1,304 @@
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
+from collections import Counter
+import threading
+import time
+import flask
+import sqlalchemy as sa
+from .helpers import get_jembewf
+
+if TYPE_CHECKING:
+    from flask import Flask
+    from flask_sqlalchemy import SQLAlchemy
+    import jembewf
+
+__all__ = ("Metrics", "Histogram")
+
+# session.info key of metric changes waiting for commit
+PENDING_KEY = "jembewf_pending_metrics"
+
+# seconds spent in state, from 10ms to a week
+DEFAULT_BUCKETS = (0.01, 0.1, 1.0, 10.0, 60.0, 600.0, 3600.0, 86400.0, 604800.0)
+
+
+class Histogram:
+    """Counts of observed values in buckets with their sum"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Adds value to the first bucket it fits in"""
+        for position, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                self.counts[position] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+class _Changes:
+    """Metric changes made in one transaction"""
+
+    __slots__ = ("running", "active", "started", "ended", "steps", "durations")
+
+    def __init__(self):
+        self.running: Counter = Counter()
+        self.active: Counter = Counter()
+        self.started: Counter = Counter()
+        self.ended: Counter = Counter()
+        self.steps: Counter = Counter()
+        self.durations: List[Tuple[Tuple[str, str], float]] = []
+
+
+class Metrics:
+    """Prometheus metrics of processes and steps maintained incrementally
+
+    Counts are changed when processes and steps are created and ended, and
+    applied after the transaction is commited. Gauges of running processes
+    and active steps start from counts loaded with one GROUP BY query on
+    the first scrape, after that tables are not queried again.
+
+    Every Python process (web worker, runner) has its own counts. Counters
+    and histograms from all of them can be summed in Prometheus, but gauges
+    see only changes made by its own process, so with many processes set
+    refresh_interval to reload gauges from database at most that often.
+
+    Exposed metrics:
+
+        jembewf_running_processes{flow}
+        jembewf_active_steps{flow, state}
+        jembewf_processes_started_total{flow}
+        jembewf_processes_ended_total{flow}
+        jembewf_steps_started_total{flow, state}
+        jembewf_state_duration_seconds{flow, state} (histogram)
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = "/metrics",
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        refresh_interval: Optional[float] = None,
+    ):
+        """
+        Args:
+            path (Optional[str]): Url of the Flask endpoint, None to not register
+                endpoint and call render from your own view
+            buckets (Sequence[float]): Upper bounds in seconds of the state
+                duration histogram
+            refresh_interval (Optional[float]): Reload gauges from database
+                when they are older than refresh_interval seconds,
+                None to load them only once
+        """
+        self.path = path
+        self.buckets = tuple(sorted(buckets))
+        self.refresh_interval = refresh_interval
+        self._lock = threading.Lock()
+        self._loaded_at: Optional[float] = None
+
+        self.running_processes: Counter = Counter()
+        self.active_steps: Counter = Counter()
+        self.processes_started_total: Counter = Counter()
+        self.processes_ended_total: Counter = Counter()
+        self.steps_started_total: Counter = Counter()
+        self.state_durations: Dict[Tuple[str, str], Histogram] = {}
+
+    def init_app(self, app: "Flask", db: "SQLAlchemy"):
+        """Registers session events and endpoint, called by JembeWF.init_app"""
+        session_factory = db.session.session_factory
+        sa.event.listen(session_factory, "after_commit", self._after_commit)
+        sa.event.listen(session_factory, "after_rollback", self._after_rollback)
+        if self.path is not None:
+            app.add_url_rule(self.path, "jembewf_metrics", self.view)
+
+    def process_started(self, process: "jembewf.ProcessMixin"):
+        """Counts started process"""
+        changes = self._changes(sa.orm.object_session(process))
+        changes.running[process.flow_name] += 1
+        changes.started[process.flow_name] += 1
+
+    def process_ended(self, process: "jembewf.ProcessMixin"):
+        """Counts ended process"""
+        self.processes_ended(sa.orm.object_session(process), [process.flow_name])
+
+    def processes_ended(self, session: sa.orm.Session, flow_names: Iterable[str]):
+        """Counts processes ended with bulk update, one flow name per process"""
+        changes = self._changes(session)
+        for flow_name in flow_names:
+            changes.running[flow_name] -= 1
+            changes.ended[flow_name] += 1
+
+    def step_started(self, step: "jembewf.StepMixin"):
+        """Counts created step, last steps are never counted as active"""
+        key = (step.process.flow_name, step.state_name)
+        changes = self._changes(sa.orm.object_session(step))
+        changes.steps[key] += 1
+        if not step.is_last_step:
+            changes.active[key] += 1
+
+    def step_ended(self, step: "jembewf.StepMixin"):
+        """Counts ended step and observes time spent in its state"""
+        key = (step.process.flow_name, step.state_name)
+        changes = self._changes(sa.orm.object_session(step))
+        changes.active[key] -= 1
+        if step.started_at is not None and step.ended_at is not None:
+            changes.durations.append(
+                (key, (step.ended_at - step.started_at).total_seconds())
+            )
+
+    def load(self):
+        """Loads gauges of running processes and active steps from database"""
+        jwf = get_jembewf()
+        process = jwf.process_model
+        step = jwf.step_model
+        session = jwf.db.session
+        running = Counter(
+            dict(
+                session.execute(
+                    sa.select(process.flow_name, sa.func.count())
+                    .where(process.is_running == True)
+                    .group_by(process.flow_name)
+                ).all()
+            )
+        )
+        active = Counter(
+            {
+                (flow_name, state_name): count
+                for flow_name, state_name, count in session.execute(
+                    sa.select(process.flow_name, step.state_name, sa.func.count())
+                    .join(process, step.process_id == process.id)
+                    .where(step.is_active == True)
+                    .group_by(process.flow_name, step.state_name)
+                ).all()
+            }
+        )
+        with self._lock:
+            self.running_processes = running
+            self.active_steps = active
+            self._loaded_at = time.monotonic()
+
+    def render(self) -> str:
+        """Returns metrics in Prometheus text format
+
+        Gauges are loaded from database on the first call and
+        when they are older than refresh_interval.
+        """
+        if self._loaded_at is None or (
+            self.refresh_interval is not None
+            and time.monotonic() - self._loaded_at > self.refresh_interval
+        ):
+            self.load()
+
+        lines: List[str] = []
+        with self._lock:
+            self._render_counter(
+                lines,
+                "jembewf_running_processes",
+                "gauge",
+                "Running processes",
+                self.running_processes,
+            )
+            self._render_counter(
+                lines,
+                "jembewf_active_steps",
+                "gauge",
+                "Active steps waiting to proceed",
+                self.active_steps,
+            )
+            self._render_counter(
+                lines,
+                "jembewf_processes_started_total",
+                "counter",
+                "Started processes",
+                self.processes_started_total,
+            )
+            self._render_counter(
+                lines,
+                "jembewf_processes_ended_total",
+                "counter",
+                "Ended processes",
+                self.processes_ended_total,
+            )
+            self._render_counter(
+                lines,
+                "jembewf_steps_started_total",
+                "counter",
+                "Created steps",
+                self.steps_started_total,
+            )
+            name = "jembewf_state_duration_seconds"
+            lines.append(f"# HELP {name} Time spent in state until step proceeded")
+            lines.append(f"# TYPE {name} histogram")
+            for key, histogram in sorted(self.state_durations.items()):
+                labels = self._labels(key)
+                cumulative = 0
+                for upper_bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f'{name}_bucket{{{labels},le="{upper_bound}"}} {cumulative}'
+                    )
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def view(self) -> flask.Response:
+        """Flask view returning rendered metrics"""
+        return flask.Response(
+            self.render(), mimetype="text/plain; version=0.0.4; charset=utf-8"
+        )
+
+    def _render_counter(
+        self, lines: List[str], name: str, metric_type: str, help_text: str, values
+    ):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for key, value in sorted(values.items()):
+            lines.append(f"{name}{{{self._labels(key)}}} {value}")
+
+    @staticmethod
+    def _labels(key) -> str:
+        names = ("flow", "state")
+        values = key if isinstance(key, tuple) else (key,)
+        return ",".join(
+            '{}="{}"'.format(
+                label,
+                str(value)
+                .replace("\\", "\\\\")
+                .replace('"', '\\"')
+                .replace("\n", "\\n"),
+            )
+            for label, value in zip(names, values)
+        )
+
+    def _changes(self, session: Optional[sa.orm.Session]) -> _Changes:
+        if session is None:
+            session = get_jembewf().db.session()
+        changes = session.info.get(PENDING_KEY)
+        if changes is None:
+            changes = session.info[PENDING_KEY] = _Changes()
+        return changes
+
+    def _after_commit(self, session: sa.orm.Session):
+        changes = session.info.pop(PENDING_KEY, None)
+        if changes is None:
+            return
+        with self._lock:
+            if self._loaded_at is not None:
+                self.running_processes.update(changes.running)
+                self.active_steps.update(changes.active)
+            self.processes_started_total.update(changes.started)
+            self.processes_ended_total.update(changes.ended)
+            self.steps_started_total.update(changes.steps)
+            for key, duration in changes.durations:
+                histogram = self.state_durations.get(key)
+                if histogram is None:
+                    histogram = self.state_durations[key] = Histogram(self.buckets)
+                histogram.observe(duration)
+
+    def _after_rollback(self, session: sa.orm.Session):
+        session.info.pop(PENDING_KEY, None)
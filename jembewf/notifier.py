@@ -0,0 +1,256 @@
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+from abc import ABC, abstractmethod
+import json
+import queue
+import select
+import threading
+import sqlalchemy as sa
+from .helpers import get_jembewf
+
+if TYPE_CHECKING:
+    from flask_sqlalchemy import SQLAlchemy
+    import jembewf
+
+__all__ = (
+    "Notifier",
+    "PostgresNotifier",
+    "PostgresListener",
+    "InProcessNotifier",
+    "InProcessListener",
+)
+
+# session.info keys of notifications waiting for step ids and waiting for commit
+PENDING_KEY = "jembewf_pending_notifications"
+READY_KEY = "jembewf_ready_notifications"
+
+
+class Notifier(ABC):
+    """Notifies workers when step is activated or process is ended
+
+    Steps and processes are queued on the session and turned into
+    notifications after they are flushed (when step ids are known).
+    Notifications are dicts:
+
+        {"type": "step", "id": 1, "process_id": 1, "flow": "flow1", "state": "state2"}
+        {"type": "process_ended", "id": 1}
+
+    Extend this class to deliver notifications with other transport,
+    subclasses must implement listener.
+    """
+
+    def __init__(self, channel: str = "jembewf"):
+        self.channel = channel
+
+    def init_db(self, db: "SQLAlchemy"):
+        """Registers session events, called by JembeWF.init_app"""
+        session_factory = db.session.session_factory
+        sa.event.listen(session_factory, "after_flush_postexec", self._after_flush)
+        sa.event.listen(session_factory, "after_commit", self._after_commit)
+        sa.event.listen(session_factory, "after_rollback", self._after_rollback)
+
+    def step_activated(self, step: "jembewf.StepMixin"):
+        """Queues notification of active step that waits to be proceeded"""
+        self._pending(step).append(("step", step))
+
+    def process_ended(self, process: "jembewf.ProcessMixin"):
+        """Queues notification of ended process"""
+        self._pending(process).append(("process_ended", process))
+
+    def processes_ended(self, session: sa.orm.Session, process_ids: List[int]):
+        """Sends notifications of processes ended with bulk update"""
+        notifications = [
+            {"type": "process_ended", "id": process_id} for process_id in process_ids
+        ]
+        if notifications:
+            session.info.setdefault(READY_KEY, []).extend(notifications)
+            self.emit(session, notifications)
+
+    def emit(self, session: sa.orm.Session, notifications: List[Dict[str, Any]]):
+        """Called inside transaction with notifications ready to be sent"""
+
+    def publish(self, notifications: List[Dict[str, Any]]):
+        """Called after commit with notifications of the commited transaction"""
+
+    @abstractmethod
+    def listener(self, engine: Optional[sa.engine.Engine] = None):
+        """Returns listener (context manager) on which workers wait for notifications"""
+
+    def _pending(self, instance: Any) -> list:
+        session = sa.orm.object_session(instance)
+        if session is None:
+            session = get_jembewf().db.session()
+        return session.info.setdefault(PENDING_KEY, [])
+
+    def _after_flush(self, session: sa.orm.Session, flush_context):
+        pending = session.info.get(PENDING_KEY)
+        if not pending:
+            return
+        notifications = []
+        waiting = []
+        for notification_type, instance in pending:
+            if instance.id is None:
+                waiting.append((notification_type, instance))
+            elif notification_type == "step":
+                notifications.append(
+                    {
+                        "type": "step",
+                        "id": instance.id,
+                        "process_id": instance.process_id,
+                        "flow": instance.process.flow_name,
+                        "state": instance.state_name,
+                    }
+                )
+            else:
+                notifications.append({"type": notification_type, "id": instance.id})
+        session.info[PENDING_KEY] = waiting
+        if notifications:
+            session.info.setdefault(READY_KEY, []).extend(notifications)
+            self.emit(session, notifications)
+
+    def _after_commit(self, session: sa.orm.Session):
+        notifications = session.info.pop(READY_KEY, None)
+        if notifications:
+            self.publish(notifications)
+
+    def _after_rollback(self, session: sa.orm.Session):
+        session.info.pop(PENDING_KEY, None)
+        session.info.pop(READY_KEY, None)
+
+
+class PostgresNotifier(Notifier):
+    """Sends notifications with PostgreSQL NOTIFY
+
+    Notifications are sent with pg_notify in the same transaction that
+    created steps, so PostgreSQL delivers them to listeners only after commit.
+    Listener requires psycopg2 driver.
+    """
+
+    def emit(self, session: sa.orm.Session, notifications: List[Dict[str, Any]]):
+        session.connection().execute(
+            sa.text("SELECT pg_notify(:channel, :payload)"),
+            [
+                {"channel": self.channel, "payload": json.dumps(notification)}
+                for notification in notifications
+            ],
+        )
+
+    def listener(self, engine: Optional[sa.engine.Engine] = None):
+        """Returns PostgresListener on engine, defaults to engine of JembeWF db"""
+        if engine is None:
+            engine = get_jembewf().db.engine
+        return PostgresListener(engine, self.channel)
+
+
+class PostgresListener:
+    """Waits for notifications on dedicated LISTEN connection
+
+    Use as context manager:
+
+        with notifier.listener() as listener:
+            for notification in listener.wait(timeout=10):
+                ...
+    """
+
+    def __init__(self, engine: sa.engine.Engine, channel: str):
+        self.engine = engine
+        self.channel = channel
+        self.connection = None
+
+    def __enter__(self) -> "PostgresListener":
+        self.connection = self.engine.raw_connection()
+        dbapi_connection = self.connection.driver_connection
+        dbapi_connection.autocommit = True
+        with dbapi_connection.cursor() as cursor:
+            cursor.execute(
+                f"LISTEN {self.engine.dialect.identifier_preparer.quote(self.channel)}"
+            )
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Closes listening connection"""
+        if self.connection is not None:
+            self.connection.invalidate()
+            self.connection = None
+
+    def wait(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Blocks until notifications arrive or timeout seconds pass
+
+        Returns received notifications, empty list on timeout.
+        """
+        dbapi_connection = self.connection.driver_connection
+        dbapi_connection.poll()
+        if not dbapi_connection.notifies:
+            select.select([dbapi_connection], [], [], timeout)
+            dbapi_connection.poll()
+        notifications = [
+            json.loads(notify.payload) for notify in dbapi_connection.notifies
+        ]
+        dbapi_connection.notifies.clear()
+        return notifications
+
+
+class InProcessNotifier(Notifier):
+    """Delivers notifications to listeners in the same Python process
+
+    Fallback for SQLite and test runs. Notifications are published after commit.
+    """
+
+    def __init__(self, channel: str = "jembewf"):
+        super().__init__(channel)
+        self._lock = threading.Lock()
+        self._queues: List[queue.Queue] = []
+
+    def publish(self, notifications: List[Dict[str, Any]]):
+        with self._lock:
+            queues = list(self._queues)
+        for listener_queue in queues:
+            for notification in notifications:
+                listener_queue.put(notification)
+
+    def listener(self, engine: Optional[sa.engine.Engine] = None):
+        return InProcessListener(self)
+
+    def _add_queue(self, listener_queue: queue.Queue):
+        with self._lock:
+            self._queues.append(listener_queue)
+
+    def _remove_queue(self, listener_queue: queue.Queue):
+        with self._lock:
+            self._queues.remove(listener_queue)
+
+
+class InProcessListener:
+    """Waits for notifications published by InProcessNotifier"""
+
+    def __init__(self, notifier: InProcessNotifier):
+        self.notifier = notifier
+        self.queue: queue.Queue = queue.Queue()
+
+    def __enter__(self) -> "InProcessListener":
+        self.notifier._add_queue(self.queue)  # pylint: disable=protected-access
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Stops receiving notifications"""
+        self.notifier._remove_queue(self.queue)  # pylint: disable=protected-access
+
+    def wait(self, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Blocks until notifications arrive or timeout seconds pass
+
+        Returns received notifications, empty list on timeout.
+        """
+        try:
+            notifications = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                notifications.append(self.queue.get_nowait())
+            except queue.Empty:
+                return notifications
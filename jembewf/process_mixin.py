@@ -1,9 +1,26 @@
-from typing import TYPE_CHECKING, List
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    ContextManager,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+from collections import deque
+from itertools import islice
 from datetime import datetime
 from sqlalchemy_json import NestedMutableJson
 from sqlalchemy.orm import declarative_mixin, declared_attr, object_session
+from sqlalchemy.orm.attributes import set_committed_value
 import sqlalchemy as sa
 from .helpers import get_jembewf, CanProceed
+from .instrumentation import NO_SPAN
+from .variables import ProcessVariables
 
 
 if TYPE_CHECKING:
@@ -29,6 +46,13 @@ class ProcessMixin:
 
     __tablename__ = "jwf_processes"
 
+    # set to False in model to not create indexes declared by ProcessMixin
+    __create_indexes__: bool = True
+
+    @declared_attr
+    def __table_args__(cls):
+        return cls.get_table_args()
+
     __step_table_name__: str = "jwf_steps"
     __step_class_name__: str = "Step"
 
@@ -56,7 +80,13 @@ class ProcessMixin:
         )
 
     def current_steps(self) -> List["jembewf.StepMixin"]:
-        """Returns current active process steps"""
+        """Returns current active process steps
+
+        When steps are loaded (see load_steps) active steps are found
+        in loaded steps without querying database.
+        """
+        if self.steps_loaded:
+            return [step for step in self.steps if step.is_active]
         session = object_session(self)
         step = get_jembewf().step_model
         return list(
@@ -67,9 +97,43 @@ class ProcessMixin:
 
     def last_steps(self) -> List["jembewf.StepMixin"]:
         """Returns last steps of the process"""
+        if self.steps_loaded:
+            return [step for step in self.steps if step.is_last_step]
+        session = object_session(self)
+        step = get_jembewf().step_model
+        return list(
+            session.query(step)
+            .filter(step.is_last_step == True, step.process == self)
+            .all()
+        )
+
+    def load_steps(self) -> List["jembewf.StepMixin"]:
+        """Loads all steps of the process with one query
+
+        After steps are loaded current_steps, last_steps and check_is_running
+        are answered from loaded steps. Steps created in the same session are
+        added to loaded steps automatically.
+
+        To load steps of many processes at once use
+        `query.options(Process.with_steps())`.
+        """
         session = object_session(self)
         step = get_jembewf().step_model
-        return list(session.query(step).filter(step.is_last_step == True).all())
+        steps = list(
+            session.query(step).filter(step.process == self).order_by(step.id).all()
+        )
+        set_committed_value(self, "steps", steps)
+        return steps
+
+    @classmethod
+    def with_steps(cls) -> "sa.orm.interfaces.LoaderOption":
+        """Query option that loads steps of all queried processes with one query"""
+        return sa.orm.selectinload(cls.steps)
+
+    @property
+    def steps_loaded(self) -> bool:
+        """True when steps of the process are loaded in the session"""
+        return "steps" not in sa.inspect(self).unloaded
 
     @property
     def flow(self) -> "jembewf.Flow":
@@ -78,8 +142,28 @@ class ProcessMixin:
 
     @property
     def callback(self) -> "jembewf.FlowCallback":
-        """FlowCallback of the process instance"""
-        return self.flow.callback(self)
+        """FlowCallback of the process instance
+
+        Callback is created once per process instance and created again
+        only when flow_name of the process is changed.
+        """
+        flow = self.flow
+        cached = self.__dict__.get("_jwf_callback")
+        if cached is None or cached[0] is not flow:
+            cached = (flow, flow.callback(self))
+            self._jwf_callback = cached
+        return cached[1]
+
+    @property
+    def vars(self) -> "jembewf.ProcessVariables":
+        """Process variables stored in process.variables or in variable_model table
+
+        See ProcessVariables.
+        """
+        variables = self.__dict__.get("_jwf_vars")
+        if variables is None:
+            variables = self._jwf_vars = ProcessVariables(self)
+        return variables
 
     @classmethod
     def can_start(cls, flow_name: str, **process_vars) -> bool:
@@ -95,6 +179,10 @@ class ProcessMixin:
         Returns:
             bool: True if process can be started
         """
+        flow = cls._get_flow(flow_name)
+        can_start = flow.callback.can_start_flow(flow, **process_vars)
+        if can_start is not None:
+            return can_start
         process = cls._create_process(flow_name, **process_vars)
         return process.callback.can_start()
 
@@ -113,22 +201,98 @@ class ProcessMixin:
             jembewf.ProcessMixin: Instance of the process model
         """
         jwf = get_jembewf()
-        process = cls._create_process(flow_name, **process_vars)
-        if process.callback.can_start():
-            # add process to db
-            jwf.db.session.add(process)
+        with jwf.span("process.create", flow=flow_name):
+            process = cls._create_process(flow_name, **process_vars)
+            flow = process.flow
+            can_start = flow.callback.can_start_flow(flow, **process_vars)
+            if can_start is None:
+                with process._callback_span("can_start"):
+                    can_start = process.callback.can_start()
+            if can_start:
+                # add process to db
+                jwf.db.session.add(process)
+                if jwf.metrics is not None:
+                    jwf.metrics.process_started(process)
+
+                with process._callback_span("callback"):
+                    process.callback.callback()
+
+                # create steps for starting states
+                for state_name in flow.starts_with_states:
+                    state = flow.states[state_name]
+                    jwf.step_model.create(process, state)
+            else:
+                raise CantStartProcess(
+                    f"Can't start process '{flow_name}' with process vars: {process_vars}"
+                )
+        return process
+
+    @classmethod
+    def create_many(
+        cls,
+        flow_name: str,
+        processes_vars: Iterable[Dict[str, Any]],
+        batch_size: int = 1000,
+    ) -> List["jembewf.ProcessMixin"]:
+        """Creates process instances for flow named flow_name in batches
+
+        Processes and steps for the starting states of each batch are flushed
+        together so they are inserted with multi-row INSERT statements
+        (with RETURNING ids on PostgreSQL) instead of one INSERT per row.
+        FlowCallback and StateCallback hooks are still called for every
+        created process and step.
 
-            process.callback.callback()
+        Args:
+            flow_name (str): name of the flow for witch we are creating the processes
+            processes_vars: global process variables, one dict per process
+            batch_size (int): number of processes inserted with one flush
+
+        Raises:
+            ValueError: Can't create processes because flow does not exist!
+            CantStartProcess: When any of the processes can't be started.
+                Every batch is checked before it is inserted so processes of
+                the batch are not added to the session, processes of the
+                previous batches are already flushed and remain in the session.
+
+        Returns:
+            List[jembewf.ProcessMixin]: Created processes in the order of processes_vars
+        """
+        jwf = get_jembewf()
+        flow = cls._get_flow(flow_name)
+        processes: List["jembewf.ProcessMixin"] = []
+        processes_vars = iter(processes_vars)
+        while True:
+            batch_vars = list(islice(processes_vars, batch_size))
+            if not batch_vars:
+                break
+            batch = [
+                cls._create_process(flow_name, **process_vars)
+                for process_vars in batch_vars
+            ]
+            for process, process_vars in zip(batch, batch_vars):
+                can_start = flow.callback.can_start_flow(flow, **process_vars)
+                if can_start is None:
+                    with process._callback_span("can_start"):
+                        can_start = process.callback.can_start()
+                if not can_start:
+                    raise CantStartProcess(
+                        f"Can't start process '{flow_name}' with process vars: {process_vars}"
+                    )
+
+            # flush inserts batch with multi-row INSERT ... RETURNING
+            jwf.db.session.add_all(batch)
+            jwf.db.session.flush()
+            for process in batch:
+                if jwf.metrics is not None:
+                    jwf.metrics.process_started(process)
+                with process._callback_span("callback"):
+                    process.callback.callback()
 
             # create steps for starting states
-            for state_name in process.flow.starts_with_states:
-                state = process.flow.states[state_name]
-                jwf.step_model.create(process, state)
-        else:
-            raise CantStartProcess(
-                f"Can't start process '{flow_name}' with process vars: {process_vars}"
-            )
-        return process
+            for state_name in flow.starts_with_states:
+                jwf.step_model.create_many(batch, flow.states[state_name])
+            processes.extend(batch)
+        return processes
 
     def proceed(self) -> bool:
         """Proceed with process execution
@@ -139,23 +303,228 @@ class ProcessMixin:
         Returns True if process proceed to new steps
         """
         proceded = False
-        for step in self.current_steps():
-            if not step.is_last_step:
-                proceded = proceded or bool(step.proceed())
+        with get_jembewf().span(
+            "process.proceed", flow=self.flow_name, process_id=self.id
+        ):
+            for step in self.current_steps():
+                if not step.is_last_step:
+                    proceded = proceded or bool(step.proceed())
         return proceded
 
+    async def aproceed(self) -> bool:
+        """Proceed with process execution awaiting async callbacks
+
+        Same as StepMixin.aproceed but callbacks of all active steps are
+        awaited concurrently.
+
+        Returns True if process proceed to new steps
+        """
+        # pylint: disable=protected-access
+        jwf = get_jembewf()
+        steps = [step for step in self.current_steps() if not step.is_last_step]
+        with jwf.span(
+            "process.proceed", flow=self.flow_name, process_id=self.id, count=len(steps)
+        ):
+            auto_steps: Deque["jembewf.StepMixin"] = deque()
+            results = await jwf.step_model._aproceed_steps(steps, auto_steps)
+            await jwf.step_model._aproceed_auto_steps(auto_steps)
+        return any(bool(result) for result in results)
+
+    @classmethod
+    def proceed_many(
+        cls, processes: Union[Iterable[int], "sa.orm.Query", "sa.Select"]
+    ) -> Set[int]:
+        """Proceed many processes at once
+
+        Active steps of all processes are loaded with one query, new steps
+        are inserted with one flush and is_running/ended_at of finished processes
+        are updated with one UPDATE.
+
+        Args:
+            processes: Ids of the processes, query of the processes or
+                select statement returning process ids
+
+        Returns:
+            Set[int]: Ids of the processes that proceeded to new steps
+        """
+        jwf = get_jembewf()
+        step = jwf.step_model
+        if isinstance(processes, sa.orm.Query):
+            processes = processes.with_entities(jwf.process_model.id).statement
+        if not isinstance(processes, sa.Select):
+            processes = list(processes)
+            if not processes:
+                return set()
+
+        steps = (
+            jwf.db.session.query(step)
+            .options(sa.orm.joinedload(step.process))
+            .filter(
+                step.is_active == True,
+                step.is_last_step == False,
+                step.process_id.in_(processes),
+            )
+            .order_by(step.process_id, step.id)
+            .all()
+        )
+        return {s.process_id for s in step.proceed_steps(steps)}
+
+    @classmethod
+    def find_processes(cls, flow_name: str, **variable_filters) -> "sa.orm.Query":
+        """Returns query of the flow processes with variables equal to filters
+
+        Filters with the names of process model columns are compared with
+        the columns, the others with process variables (in variables json
+        column or in variable_model table). Declare variables with
+        Flow.variable(..., index=True) to find processes using index.
+
+        Raises:
+            ValueError: When flow doesn't exist or filter value is not of the
+                type of the declared variable
+        """
+        jwf = get_jembewf()
+        flow = jwf.get_flow(flow_name)
+        process = jwf.process_model
+        attrs, variables = cls._split_process_vars(flow_name, **variable_filters)
+        query = jwf.db.session.query(process).filter(process.flow_name == flow_name)
+        for name, value in attrs.items():
+            query = query.filter(getattr(process, name) == value)
+        for name, value in variables.items():
+            if jwf.variable_model is not None:
+                query = query.filter(
+                    jwf.variable_model.has_value(process.id, name, value)
+                )
+            else:
+                declared = flow.variables.get(name)
+                type_ = declared.type if declared is not None else type(value)
+                query = query.filter(
+                    process.variable_expression(name, type_) == value
+                )
+        return query
+
+    @classmethod
+    def variable_expression(
+        cls, name: str, type_: Optional[type] = None
+    ) -> sa.ColumnElement:
+        """Returns SQL expression of the variable in variables json column
+
+        Value is extracted as bool, int or float for those types and as
+        string for the others. Indexes of indexed variables are created on
+        the same expression so find_processes can use them.
+        """
+        value = cls.variables[name]
+        if type_ is bool:
+            return value.as_boolean()
+        if type_ is int:
+            return value.as_integer()
+        if type_ is float:
+            return value.as_float()
+        return value.as_string()
+
+    @classmethod
+    def declare_variable_index(
+        cls, flow_name: str, variable: "jembewf.FlowVariable"
+    ) -> sa.Index:
+        """Declares expression index of the variable in variables json column
+
+        Index is partial, only on processes of the flow, so the value is cast
+        to the type declared by that flow and never for processes of other
+        flows. Index is created by db.create_all or JembeWF.create_indexes.
+        """
+        name = f"ix_{cls.__tablename__}_{flow_name}_variables_{variable.name}"
+        for index in cls.__table__.indexes:
+            if index.name == name:
+                return index
+        return sa.Index(
+            name,
+            cls.variable_expression(variable.name, variable.type),
+            postgresql_where=cls.flow_name == flow_name,
+            sqlite_where=cls.flow_name == flow_name,
+        )
+
+    @classmethod
+    def update_is_running(cls, process_ids: Iterable[int]) -> List[int]:
+        """Ends running processes without active steps with one UPDATE
+
+        Sets is_running to False and ended_at for every process from
+        process_ids that is running but has no active steps.
+        Processes are locked with SELECT ... FOR UPDATE first, so when two
+        transactions end last active steps of the same process the second
+        one waits for the first and sees its ended steps.
+
+        Returns:
+            List[int]: Ids of ended processes
+        """
+        jwf = get_jembewf()
+        process = jwf.process_model
+        step = jwf.step_model
+        process_ids = list(process_ids)
+        if not process_ids:
+            return []
+        jwf.db.session.execute(
+            sa.select(process.id)
+            .where(process.id.in_(process_ids))
+            .order_by(process.id)
+            .with_for_update()
+        )
+        active_steps = sa.exists().where(
+            step.process_id == process.id, step.is_active == True
+        )
+        rows = jwf.db.session.execute(
+            sa.update(process)
+            .where(
+                process.id.in_(process_ids),
+                process.is_running == True,
+                ~active_steps,
+            )
+            .values(is_running=False, ended_at=datetime.utcnow())
+            .returning(process.id, process.flow_name)
+            .execution_options(synchronize_session="fetch")
+        ).all()
+        ended = [process_id for process_id, _ in rows]
+        if jwf.notifier is not None:
+            jwf.notifier.processes_ended(jwf.db.session(), ended)
+        if jwf.metrics is not None:
+            jwf.metrics.processes_ended(
+                jwf.db.session(), [flow_name for _, flow_name in rows]
+            )
+        return ended
+
     def check_is_running(self):
         """Check if process is still running and update is_running if necessary"""
-        session = object_session(self)
-        step = get_jembewf().step_model
-        is_running = session.query(
-            session.query(step).filter(step.is_active == True, step.process == self).exists()
-        ).scalar()
+        if self.steps_loaded:
+            # active steps are usually the latest ones
+            is_running = any(step.is_active for step in reversed(self.steps))
+        else:
+            session = object_session(self)
+            step = get_jembewf().step_model
+            is_running = session.query(
+                session.query(step)
+                .filter(step.is_active == True, step.process == self)
+                .exists()
+            ).scalar()
         if self.is_running != is_running:
             self.is_running = is_running
             self.ended_at = datetime.utcnow()
+            jwf = get_jembewf()
+            if jwf.notifier is not None and not is_running:
+                jwf.notifier.process_ended(self)
+            if jwf.metrics is not None and not is_running:
+                jwf.metrics.process_ended(self)
         return is_running
 
+    def _callback_span(self, method: str) -> ContextManager:
+        """Returns span around the method of the FlowCallback"""
+        jwf = get_jembewf()
+        if jwf.instrumentation is None:
+            return NO_SPAN
+        return jwf.span(
+            "callback",
+            flow=self.flow_name,
+            callback=type(self.callback).__name__,
+            method=method,
+        )
+
     @classmethod
     def _create_process(cls, flow_name: str, **process_vars) -> "jembewf.ProcessMixin":
         """Creates process instance
@@ -165,18 +534,52 @@ class ProcessMixin:
         The rest of the process_vars are saved in process.variables (json field)
         """
         jwf = get_jembewf()
+        attrs, variables = cls._split_process_vars(flow_name, **process_vars)
+
+        process = jwf.process_model()
+        process.flow_name = flow_name
+        process.is_running = True
+
+        # assign process variables to model attributes if one with same name exist
+        # assign the rest of process_vars to process.variables
+        for attr_name, value in attrs.items():
+            setattr(process, attr_name, value)
+        if jwf.variable_model is None:
+            process.variables = variables
+        else:
+            # variables are written to variable table when process is flushed
+            process.variables = {}
+            process.vars.update(variables)
+
+        return process
+
+    @classmethod
+    def _get_flow(cls, flow_name: str) -> "jembewf.Flow":
+        """Returns flow to start
+
+        Raises:
+            ValueError: Can't start flow because it does not exist!
+        """
         try:
-            flow = jwf.flows[flow_name]
+            return get_jembewf().flows[flow_name]
         except KeyError as err:
             raise ValueError(
                 f"Can't start flow '{flow_name}' because it does not exist!"
             ) from err
 
-        process = jwf.process_model()
-        process.flow_name = flow.name
+    @classmethod
+    def _split_process_vars(
+        cls, flow_name: str, **process_vars
+    ) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+        """Splits process_vars to model attributes and process.variables
+
+        process_vars that have same name as process model fields excluding field defined
+        by ProcessMixin are saved directly in model.
+        The rest of the process_vars are saved in process.variables (json field)
+        """
+        jwf = get_jembewf()
+        flow = cls._get_flow(flow_name)
 
-        # assign process variables to model attributes if one with same name exist
-        # assign the rest of process_vars to process.variables
         valid_model_attr = set(
             sa.orm.class_mapper(jwf.process_model).attrs.keys()
         ).difference(
@@ -190,13 +593,29 @@ class ProcessMixin:
                 "ended_at",
             }
         )
-        for attr_name in valid_model_attr.intersection(process_vars.keys()):
-            setattr(process, attr_name, process_vars[attr_name])
-        process.variables = {
+        attrs = {k: v for k, v in process_vars.items() if k in valid_model_attr}
+        variables = {
             k: v for k, v in process_vars.items() if k not in valid_model_attr
         }
+        return attrs, flow.check_variables(variables)
 
-        return process
+    @classmethod
+    def get_table_args(cls) -> tuple:
+        """Returns indexes used by the queries on running processes
+
+        When model defines its own __table_args__ it should include these by
+        declaring __table_args__ with declared_attr that returns
+        `(*cls.get_table_args(), ...)`.
+        """
+        if not cls.__create_indexes__:
+            return ()
+        return (
+            sa.Index(
+                f"ix_{cls.__tablename__}_flow_name_is_running",
+                "flow_name",
+                "is_running",
+            ),
+        )
 
     @classmethod
     def get_step_table_name(cls) -> str:
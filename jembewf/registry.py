@@ -0,0 +1,80 @@
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Mapping, Optional
+import threading
+
+if TYPE_CHECKING:
+    import jembewf
+
+__all__ = ("FlowRegistry",)
+
+
+class FlowRegistry(Mapping[str, "jembewf.Flow"]):
+    """Flows of JembeWF by name
+
+    Flows can be registered as Flow instances or with a loader, function
+    that returns the flow. Loader is called on the first access to the flow
+    (ex. get_flow or process.flow), so flows that are never used are never
+    created.
+    """
+
+    def __init__(
+        self, on_load: Optional[Callable[["jembewf.Flow"], None]] = None
+    ) -> None:
+        """
+        Args:
+            on_load (Optional[Callable]): Called with every flow created by loader
+        """
+        self.on_load = on_load
+        self._flows: Dict[str, "jembewf.Flow"] = {}
+        self._loaders: Dict[str, Callable[[], "jembewf.Flow"]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, flow: "jembewf.Flow"):
+        """Registers flow"""
+        self._check_name(flow.name)
+        self._flows[flow.name] = flow
+
+    def add_loader(self, name: str, loader: Callable[[], "jembewf.Flow"]):
+        """Registers loader of the flow named name"""
+        self._check_name(name)
+        self._loaders[name] = loader
+
+    def loaded(self) -> List["jembewf.Flow"]:
+        """Returns flows registered or already created by loaders"""
+        return list(self._flows.values())
+
+    def is_loaded(self, name: str) -> bool:
+        """True when flow is registered or already created by loader"""
+        return name in self._flows
+
+    def __getitem__(self, name: str) -> "jembewf.Flow":
+        try:
+            return self._flows[name]
+        except KeyError:
+            pass
+        with self._lock:
+            if name in self._flows:
+                return self._flows[name]
+            loader = self._loaders[name]
+            flow = loader()
+            if flow.name != name:
+                raise ValueError(
+                    f"Loader of flow '{name}' returned flow '{flow.name}'."
+                )
+            self._flows[name] = flow
+            del self._loaders[name]
+        if self.on_load is not None:
+            self.on_load(flow)
+        return flow
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._flows or name in self._loaders
+
+    def __iter__(self) -> Iterator[str]:
+        return iter([*self._flows, *self._loaders])
+
+    def __len__(self) -> int:
+        return len(self._flows) + len(self._loaders)
+
+    def _check_name(self, name: str):
+        if name in self:
+            raise Exception(f"Flow with same name '{name}' is already registred.")
@@ -0,0 +1,160 @@
+from typing import TYPE_CHECKING, List, Optional
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+import time
+import sqlalchemy as sa
+from .helpers import get_jembewf
+
+if TYPE_CHECKING:
+    import jembewf
+
+__all__ = ("Runner", "RunnerStats")
+
+
+@dataclass
+class RunnerStats:
+    """Throughput and claim latency metrics collected by the Runner"""
+
+    batches: int = 0
+    claimed_steps: int = 0
+    proceeded_steps: int = 0
+    claim_time: float = 0.0
+    proceed_time: float = 0.0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since stats are collected"""
+        return time.monotonic() - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """Proceeded steps per second"""
+        elapsed = self.elapsed
+        return self.proceeded_steps / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def avg_claim_latency(self) -> float:
+        """Average seconds needed to claim one batch of steps"""
+        return self.claim_time / self.batches if self.batches else 0.0
+
+    def __str__(self) -> str:
+        return (
+            f"batches={self.batches} claimed={self.claimed_steps} "
+            f"proceeded={self.proceeded_steps} "
+            f"throughput={self.throughput:.1f} steps/s "
+            f"avg_claim_latency={self.avg_claim_latency * 1000:.2f} ms"
+        )
+
+
+class Runner:
+    """Advance running processes by proceeding their active steps
+
+    Runner claims active steps with SELECT ... FOR UPDATE SKIP LOCKED, proceeds
+    claimed steps with StepMixin.proceed_steps and commits after each batch.
+    Many runners (in different worker processes) can run at the same time
+    without proceeding the same step twice because a step locked by one runner
+    is skipped by others until batch is commited.
+
+    On databases that does not support FOR UPDATE SKIP LOCKED (ex. SQLite)
+    claiming silently falls back to regular SELECT, so only one runner should be used.
+    """
+
+    def __init__(self, batch_size: int = 100, idle_sleep: float = 1.0):
+        self.batch_size = batch_size
+        self.idle_sleep = idle_sleep
+        self.stats = RunnerStats()
+
+    def claim(
+        self, after_id: int = 0, until_id: Optional[int] = None
+    ) -> List["jembewf.StepMixin"]:
+        """Claims (locks) next batch of active steps with id greater than after_id
+
+        When until_id is provided steps with id greater than until_id are not claimed.
+        """
+        jwf = get_jembewf()
+        step = jwf.step_model
+        start = time.perf_counter()
+        query = jwf.db.session.query(step).filter(
+            step.is_active == True,
+            step.is_last_step == False,
+            step.id > after_id,
+        )
+        if until_id is not None:
+            query = query.filter(step.id <= until_id)
+        steps = list(
+            query.order_by(step.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        self.stats.claim_time += time.perf_counter() - start
+        self.stats.batches += 1
+        self.stats.claimed_steps += len(steps)
+        return steps
+
+    def run_batch(
+        self, after_id: int = 0, until_id: Optional[int] = None
+    ) -> Optional[int]:
+        """Claims and proceeds one batch of steps and commits it
+
+        Returns id of the last claimed step or None if there was nothing to claim.
+        """
+        jwf = get_jembewf()
+        steps = self.claim(after_id, until_id)
+        if not steps:
+            jwf.db.session.commit()
+            return None
+
+        start = time.perf_counter()
+        try:
+            proceeded = jwf.step_model.proceed_steps(steps)
+            self.stats.proceeded_steps += len(proceeded)
+            jwf.db.session.commit()
+        except Exception:
+            jwf.db.session.rollback()
+            raise
+        finally:
+            self.stats.proceed_time += time.perf_counter() - start
+        return steps[-1].id
+
+    def run_once(self) -> int:
+        """Goes once through all active steps in batches
+
+        Steps created while going through active steps are left for the next pass,
+        so flows that loops back can't keep runner in the same pass forever.
+
+        Returns number of proceeded steps.
+        """
+        jwf = get_jembewf()
+        step = jwf.step_model
+        until_id = jwf.db.session.query(sa.func.max(step.id)).scalar()
+        if until_id is None:
+            jwf.db.session.commit()
+            return 0
+
+        proceeded = self.stats.proceeded_steps
+        last_id: Optional[int] = 0
+        while last_id is not None:
+            last_id = self.run_batch(last_id, until_id)
+        return self.stats.proceeded_steps - proceeded
+
+    def run(self, max_passes: Optional[int] = None):
+        """Runs until max_passes are done or forever when max_passes is None
+
+        Sleeps idle_sleep seconds after every pass that proceeded no steps.
+        When JembeWF has notifier, instead of sleeping it waits on notifier
+        listener at most idle_sleep seconds, so new steps are proceeded
+        as soon as they are commited.
+        """
+        notifier = get_jembewf().notifier
+        with notifier.listener() if notifier else nullcontext() as listener:
+            passes = 0
+            while max_passes is None or passes < max_passes:
+                if not self.run_once():
+                    if listener is not None:
+                        listener.wait(self.idle_sleep)
+                    else:
+                        time.sleep(self.idle_sleep)
+                passes += 1
+
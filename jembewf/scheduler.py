@@ -0,0 +1,142 @@
+from typing import TYPE_CHECKING, List, Optional
+from datetime import datetime, timedelta
+import time
+import sqlalchemy as sa
+from .helpers import get_jembewf
+from .runner import RunnerStats
+
+if TYPE_CHECKING:
+    import jembewf
+
+__all__ = ("Scheduler",)
+
+
+class Scheduler:
+    """Proceed steps whose timed transitions are due
+
+    Steps of states with timed transitions (Transition(after=...) or Transition(at=...))
+    have due_at set to the earliest time one of the transitions can proceed.
+    Scheduler claims only active steps with due_at in the past, using the partial
+    index on due_at, proceeds them and moves due_at to the next timer of the step
+    or clears it when there is none. Between passes it sleeps until the next
+    due_at but not longer than max_sleep seconds.
+
+    Due timed transitions refused by TransitionCallback.can_proceed are retried:
+    due_at is moved retry_delay seconds ahead, growing with the time the
+    transition is overdue up to max_retry_delay seconds.
+
+    Like Runner, steps are claimed with SELECT ... FOR UPDATE SKIP LOCKED so
+    many schedulers can run at the same time on databases that support it.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = 100,
+        max_sleep: float = 60.0,
+        retry_delay: float = 60.0,
+        max_retry_delay: float = 3600.0,
+    ):
+        self.batch_size = batch_size
+        self.max_sleep = max_sleep
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.stats = RunnerStats()
+
+    def claim(self, now: datetime) -> List["jembewf.StepMixin"]:
+        """Claims (locks) next batch of active steps due at or before now"""
+        jwf = get_jembewf()
+        step = jwf.step_model
+        start = time.perf_counter()
+        steps = list(
+            jwf.db.session.query(step)
+            .filter(
+                step.is_active == True,
+                step.due_at != None,
+                step.due_at <= now,
+            )
+            .order_by(step.due_at, step.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        self.stats.claim_time += time.perf_counter() - start
+        self.stats.batches += 1
+        self.stats.claimed_steps += len(steps)
+        return steps
+
+    def run_due(self, now: Optional[datetime] = None) -> int:
+        """Proceeds all steps due at or before now in batches
+
+        Returns number of proceeded steps.
+        """
+        jwf = get_jembewf()
+        now = now or datetime.utcnow()
+        proceeded = 0
+        while True:
+            steps = self.claim(now)
+            if not steps:
+                jwf.db.session.commit()
+                return proceeded
+
+            start = time.perf_counter()
+            try:
+                batch_proceeded = len(jwf.step_model.proceed_steps(steps))
+                for step in steps:
+                    if step.is_active:
+                        step.due_at = self.next_step_due_at(step, now)
+                jwf.db.session.commit()
+            except Exception:
+                jwf.db.session.rollback()
+                raise
+            finally:
+                self.stats.proceed_time += time.perf_counter() - start
+            proceeded += batch_proceeded
+            self.stats.proceeded_steps += batch_proceeded
+
+    def next_step_due_at(
+        self, step: "jembewf.StepMixin", now: datetime
+    ) -> Optional[datetime]:
+        """Returns due_at of the step that stays active after it is proceeded
+
+        When one of its timed transitions is due but didn't proceed, step is
+        retried after retry_delay or after the time it is overdue, whichever
+        is longer, but not later than max_retry_delay.
+        """
+        next_due_at = step.state.next_due_at(step, after=now)
+        overdue_since = step.state.next_due_at(step)
+        if overdue_since is None or overdue_since > now:
+            return next_due_at
+        delay = min(
+            max(self.retry_delay, (now - overdue_since).total_seconds()),
+            self.max_retry_delay,
+        )
+        retry_at = now + timedelta(seconds=delay)
+        return min(retry_at, next_due_at) if next_due_at is not None else retry_at
+
+    def next_due_at(self) -> Optional[datetime]:
+        """Returns the earliest due_at of active steps"""
+        jwf = get_jembewf()
+        step = jwf.step_model
+        return (
+            jwf.db.session.query(sa.func.min(step.due_at))
+            .filter(step.is_active == True, step.due_at != None)
+            .scalar()
+        )
+
+    def run(self, max_passes: Optional[int] = None):
+        """Runs until max_passes are done or forever when max_passes is None"""
+        jwf = get_jembewf()
+        passes = 0
+        while max_passes is None or passes < max_passes:
+            self.run_due()
+            next_due_at = self.next_due_at()
+            jwf.db.session.commit()
+            sleep = self.max_sleep
+            if next_due_at is not None:
+                sleep = min(
+                    max((next_due_at - datetime.utcnow()).total_seconds(), 0.0),
+                    self.max_sleep,
+                )
+            passes += 1
+            if max_passes is None or passes < max_passes:
+                time.sleep(sleep)
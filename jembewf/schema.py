@@ -0,0 +1,63 @@
+from typing import List, Optional, Set, Union
+import sqlalchemy as sa
+from .helpers import get_jembewf
+
+__all__ = ("create_indexes",)
+
+
+def create_indexes(
+    bind: Optional[Union[sa.engine.Engine, sa.engine.Connection]] = None,
+) -> List[str]:
+    """Creates missing indexes of process, step, subscription and variable models
+
+    Use it to add indexes to tables created before indexes were declared
+    by ProcessMixin and StepMixin. On large PostgreSQL tables consider creating
+    them with CREATE INDEX CONCURRENTLY from a migration instead.
+
+    Args:
+        bind (Optional[Union[sa.engine.Engine, sa.engine.Connection]]):
+            Engine or connection to use, defaults to engine of JembeWF db.
+
+    Returns:
+        List[str]: Names of created indexes
+    """
+    jwf = get_jembewf()
+    if bind is None:
+        bind = jwf.db.engine
+
+    created = []
+    models = [jwf.process_model, jwf.step_model]
+    if jwf.subscription_model is not None:
+        models.append(jwf.subscription_model)
+    if jwf.variable_model is not None:
+        models.append(jwf.variable_model)
+    for model in models:
+        table = model.__table__
+        existing = _existing_indexes(bind, table)
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            if index.name not in existing:
+                index.create(bind)
+                created.append(index.name)
+    return created
+
+
+def _existing_indexes(
+    bind: Union[sa.engine.Engine, sa.engine.Connection], table: sa.Table
+) -> Set[str]:
+    """Returns names of indexes of the table that exist in database
+
+    SQLite reflection skips expression indexes, so on SQLite names are
+    read from sqlite_master.
+    """
+    if bind.dialect.name == "sqlite":
+        query = sa.text(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table"
+        )
+        if isinstance(bind, sa.engine.Connection):
+            return set(bind.scalars(query, {"table": table.name}))
+        with bind.connect() as connection:
+            return set(connection.scalars(query, {"table": table.name}))
+    return {
+        index["name"]
+        for index in sa.inspect(bind).get_indexes(table.name, schema=table.schema)
+    }
@@ -1,9 +1,11 @@
-from typing import TYPE_CHECKING, Optional, Type, List
+from typing import TYPE_CHECKING, Optional, Type, List, Mapping
+from datetime import datetime
+from types import MappingProxyType
 
 if TYPE_CHECKING:
     import jembewf
 
-__all__ = ("State", "StateCallback")
+__all__ = ("State", "StateCallback", "AsyncStateCallback")
 
 
 class StateCallback:
@@ -23,6 +25,17 @@ class StateCallback:
         """Called on arrive to the state"""
 
 
+class AsyncStateCallback(StateCallback):
+    """StateCallback with async callback
+
+    Use it for states whose callback waits on I/O (ex. calls HTTP service).
+    Async callbacks are awaited by aproceed, proceed raises an exception.
+    """
+
+    async def callback(self):  # pylint: disable=invalid-overridden-method
+        """Called on arrive to the state"""
+
+
 class State:
     """Defines and configures State"""
 
@@ -30,8 +43,11 @@ class State:
         self,
         name: str,
         callback: Optional[Type["jembewf.StateCallback"]] = None,
+        join: Optional[str] = None,
         **config,
     ) -> None:
+        if join not in (None, "all"):
+            raise ValueError(f"State '{name}' join must be None or 'all'.")
         self.name = name
         self.callback: Type[StateCallback] = (
             callback if callback is not None else StateCallback
@@ -39,8 +55,23 @@ class State:
         self.config = config
         self.auto_proceed = False
 
+        # with join="all" step of the state is created only when every
+        # transition leading to the state arrived (AND-join)
+        self.join = join
+        # number of arrivals that activates join state, set when flow is compiled
+        self.join_count = 0
+
         # list of all transitions that belogns to this state
         self.transitions: List["jembewf.Transition"] = []
+        # transitions by name, set when flow is compiled
+        self.transitions_by_name: Mapping[str, "jembewf.Transition"] = {}
+        # transitions with 'after' or 'at' timer, set when flow is compiled
+        self.timed_transitions: List["jembewf.Transition"] = []
+        # transitions waiting on events and transitions that doesn't,
+        # set when flow is compiled
+        self.event_transitions: List["jembewf.Transition"] = []
+        self.direct_transitions: List["jembewf.Transition"] = []
+        self.compiled = False
 
         self.flow: "jembewf.Flow"
 
@@ -48,6 +79,11 @@ class State:
 
     def add(self, *transitions: "jembewf.Transition") -> "jembewf.State":
         """Adds transition to the state"""
+        if self.compiled:
+            raise Exception(
+                f"Can't add transitions to state '{self.name}' "
+                f"because flow '{self.flow.name}' is already compiled."
+            )
         self.transitions.extend(transitions)
         return self
 
@@ -61,6 +97,42 @@ class State:
         self.flow = flow
         self._validate()
 
+    @property
+    def is_end(self) -> bool:
+        """True when state has no transitions"""
+        return len(self.transitions) == 0
+
+    def compile(self):
+        """Index transitions by name, called by FlowGraph.compile"""
+        self.transitions_by_name = MappingProxyType(
+            {transition.name: transition for transition in self.transitions}
+        )
+        self.timed_transitions = [t for t in self.transitions if t.is_timed]
+        self.event_transitions = [t for t in self.transitions if t.on is not None]
+        self.direct_transitions = [t for t in self.transitions if t.on is None]
+        self.compiled = True
+
+    def next_due_at(
+        self, step: "jembewf.StepMixin", after: Optional[datetime] = None
+    ) -> Optional[datetime]:
+        """Returns the earliest due time of timed transitions from the step
+
+        When after is provided only due times later than after are considered.
+        Returns None when there is no such timed transition.
+        """
+        due_times = [
+            due_at
+            for due_at in (t.due_at(step) for t in self.timed_transitions)
+            if due_at is not None and (after is None or due_at > after)
+        ]
+        return min(due_times, default=None)
+
+    def __getstate__(self):
+        """Pickles state without transitions_by_name, FlowGraph.compile sets it"""
+        state = self.__dict__.copy()
+        state["transitions_by_name"] = {}
+        return state
+
     def _validate(self):
         if not hasattr(self, "flow"):
             raise Exception(f"State '{self.name}' is not attached to the flow")
@@ -69,18 +141,19 @@ class State:
     def get_transition(self, transition_name: str) -> "jembewf.Transition":
         """Get current state transition by transition name"""
         try:
-            return next(
-                trans for trans in self.transitions if trans.name == transition_name
-            )
-        except StopIteration:
+            return self.transitions_by_name[transition_name]
+        except KeyError as err:
             raise ValueError(
                 f"Transition {transition_name} does not exist in state '{self.name}'!"
-            ) from StopIteration
+            ) from err
 
     def has_transition(self, transition_name: str) -> bool:
         """Check if transition exsist"""
-        try:
-            next(trans for trans in self.transitions if trans.name == transition_name)
-            return True
-        except StopIteration:
-            return False
+        return transition_name in self.transitions_by_name
+
+    def owns(self, transition: "jembewf.Transition") -> bool:
+        """Check if transition is transition from this state"""
+        return (
+            self.transitions_by_name.get(getattr(transition, "name", None))
+            is transition
+        )
@@ -1,15 +1,40 @@
-from typing import TYPE_CHECKING, Optional, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    ContextManager,
+    Deque,
+    Dict,
+    Generator,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+)
+from collections import deque
+import asyncio
 from datetime import datetime
 from sqlalchemy_json import NestedMutableJson
 from sqlalchemy.orm import declarative_mixin, declared_attr
+from sqlalchemy.orm.attributes import set_committed_value
 import sqlalchemy as sa
-from .helpers import CanProceed, get_jembewf
+from .helpers import CanProceed, ensure_sync, get_jembewf, maybe_await
+from .instrumentation import NO_SPAN
 
 if TYPE_CHECKING:
     import jembewf
 
 __all__ = ("StepMixin",)
 
+# number of auto proceeded steps after which session is flushed
+AUTO_STEPS_FLUSH_INTERVAL = 100
+
+# maximum number of step ids in one IN (...) when steps are compacted
+COMPACT_CHUNK_SIZE = 10000
+
 
 @declarative_mixin
 class StepMixin:
@@ -27,6 +52,13 @@ class StepMixin:
 
     __tablename__ = "jwf_steps"
 
+    # set to False in model to not create indexes declared by StepMixin
+    __create_indexes__: bool = True
+
+    @declared_attr
+    def __table_args__(cls):
+        return cls.get_table_args()
+
     id = sa.Column(sa.Integer, primary_key=True)
 
     # process
@@ -62,6 +94,17 @@ class StepMixin:
 
     started_at = sa.Column(sa.DateTime, default=datetime.utcnow, nullable=False)
     ended_at = sa.Column(sa.DateTime)
+    # earliest time when timed transition from the step can proceed
+    due_at = sa.Column(sa.DateTime)
+    # number of old steps of the state collapsed into this summary step by
+    # compaction, started_at/ended_at of summary step are their time range
+    compacted_steps = sa.Column(sa.Integer)
+    # number of branches arrived to the join state (State(join="all")),
+    # step waits inactive until all transitions leading to the state arrived
+    join_arrivals = sa.Column(sa.Integer)
+    # names of the transitions arrived to the join state, every transition
+    # is counted once even when its branch loops and arrives again
+    join_transitions = sa.Column(sa.JSON)
 
     # prev_step, next_step
 
@@ -85,8 +128,17 @@ class StepMixin:
 
     @property
     def callback(self) -> "jembewf.StateCallback":
-        """StateCallback of the state instance"""
-        return self.state.callback(self)
+        """StateCallback of the state instance
+
+        Callback is created once per step instance and created again
+        only when state of the step is changed.
+        """
+        state = self.state
+        cached = self.__dict__.get("_jwf_callback")
+        if cached is None or cached[0] is not state:
+            cached = (state, state.callback(self))
+            self._jwf_callback = cached
+        return cached[1]
 
     @classmethod
     def create(
@@ -107,30 +159,535 @@ class StepMixin:
         Returns:
             jembewf.StepMixin: _description_
         """
+        auto_steps: Deque["jembewf.StepMixin"] = deque()
+        step = cls._create(
+            process, state, auto_steps, prev_step, transition_callback, **step_vars
+        )
+        cls._proceed_auto_steps(auto_steps)
+        return step
+
+    @classmethod
+    def create_many(
+        cls,
+        processes: Sequence["jembewf.ProcessMixin"],
+        state: "jembewf.State",
+    ) -> List["jembewf.StepMixin"]:
+        """Creates one step for the state in every process
+
+        All steps are inserted with one multi-row INSERT ... RETURNING statement
+        before state callbacks are called for each of them in order.
+        Auto steps of a process are proceeded before callbacks of the next
+        process are called, same as when processes are started one by one.
+
+        Args:
+            processes (Sequence[jembewf.ProcessMixin]): Processes to whome steps will belong
+            state (jembewf.State): State instance for wichin we create the steps
+
+        Returns:
+            List[jembewf.StepMixin]: Created steps in the order of processes
+        """
+        jwf = get_jembewf()
+        with jwf.span(
+            "step.create",
+            flow=processes[0].flow_name if processes else None,
+            state=state.name,
+            count=len(processes),
+        ):
+            steps = cls._insert_steps([(process, state, None) for process in processes])
+            process_ids: Set[int] = set()
+            for step in steps:
+                auto_steps: Deque["jembewf.StepMixin"] = deque()
+                step._activate(auto_steps)
+                if auto_steps:
+                    cls._proceed_auto_steps(auto_steps, check_is_running=False)
+                    process_ids.add(step.process_id)
+            if process_ids:
+                jwf.db.session.flush()
+                jwf.process_model.update_is_running(process_ids)
+        return steps
+
+    @classmethod
+    def _create(
+        cls,
+        process: "jembewf.ProcessMixin",
+        state: "jembewf.State",
+        auto_steps: Deque["jembewf.StepMixin"],
+        prev_step: Optional["jembewf.StepMixin"] = None,
+        transition_callback: Optional["jembewf.TransitionCallback"] = None,
+        **step_vars,
+    ) -> "jembewf.StepMixin":
+        """Creates step and appends it to auto_steps if it needs to auto proceed
+
+        Step of the join state is returned inactive while it waits for other
+        branches, only transition callback is called for such step.
+        """
+        jwf = get_jembewf()
+        with jwf.span("step.create", flow=process.flow_name, state=state.name):
+            if state.join and prev_step is not None:
+                step = cls._arrive(
+                    process, state, prev_step, transition_callback.transition
+                )
+                if not step.is_active:
+                    step._transit(transition_callback)
+                    return step
+            else:
+                step = cls._build(process, state, prev_step, **step_vars)
+                jwf.db.session.add(step)
+            step._activate(auto_steps, transition_callback)
+        return step
+
+    @classmethod
+    def _arrive(
+        cls,
+        process: "jembewf.ProcessMixin",
+        state: "jembewf.State",
+        prev_step: "jembewf.StepMixin",
+        transition: "jembewf.Transition",
+    ) -> "jembewf.StepMixin":
+        """Counts arrival of a branch to the join state and returns the join step
+
+        Arrivals are counted in join_arrivals of one inactive step of the state
+        waiting for the other branches, so every arrival is one lookup of that
+        step and one increment. Names of arrived transitions are kept in
+        join_transitions and a transition that already arrived (branch that
+        looped back) is not counted again. When all transitions leading to the
+        state arrived the step is activated, otherwise it stays inactive.
+        Process row is locked with SELECT ... FOR UPDATE so concurrent
+        arrivals to the same process are counted one after another.
+        """
         jwf = get_jembewf()
-        step = jwf.step_model()
+        session = jwf.db.session
+        if process.id is None:
+            session.flush()
+        process_model = jwf.process_model
+        session.execute(
+            sa.select(process_model.id)
+            .where(process_model.id == process.id)
+            .with_for_update()
+        )
+        step = session.scalars(
+            sa.select(cls)
+            .where(
+                cls.process_id == process.id,
+                cls.state_name == state.name,
+                cls.join_arrivals < state.join_count,
+            )
+            .limit(1)
+        ).first()
+        if step is None:
+            step = cls()
+            step.state_name = state.name
+            step.process = process
+            step.variables = {}
+            step.is_active = False
+            step.is_last_step = state.is_end
+            step.started_at = datetime.utcnow()
+            step.prev_step = prev_step
+            step.join_arrivals = 0
+            step.join_transitions = []
+            session.add(step)
+        join_transitions = step.join_transitions or []
+        if transition.name in join_transitions:
+            return step
+        step.join_transitions = [*join_transitions, transition.name]
+        step.join_arrivals += 1
+        if step.join_arrivals < state.join_count:
+            return step
+
+        step.is_active = True
+        step.started_at = datetime.utcnow()
+        if state.timed_transitions:
+            step.due_at = state.next_due_at(step)
+        if state.event_transitions:
+            jwf.subscription_model.subscribe([step])
+        return step
+
+    @classmethod
+    def _build(
+        cls,
+        process: "jembewf.ProcessMixin",
+        state: "jembewf.State",
+        prev_step: Optional["jembewf.StepMixin"] = None,
+        **step_vars,
+    ) -> "jembewf.StepMixin":
+        """Creates step instance without calling any callback"""
+        step = get_jembewf().step_model()
         step.state_name = state.name
         step.process = process
         step.variables = step_vars
+        step.is_active = True
+        step.started_at = datetime.utcnow()
         if prev_step:
             step.prev_step = prev_step
-        step.is_last_step = len(state.transitions) == 0
+        step.is_last_step = state.is_end
+        if state.timed_transitions:
+            step.due_at = state.next_due_at(step)
+        if state.event_transitions:
+            get_jembewf().subscription_model.subscribe([step])
+        return step
+
+    def _activate(
+        self,
+        auto_steps: Deque["jembewf.StepMixin"],
+        transition_callback: Optional["jembewf.TransitionCallback"] = None,
+    ):
+        """Calls callbacks of newly created step and ends it or queue it to auto proceed"""
+        self._transit(transition_callback)
+        with self._callback_span(self.callback, "callback"):
+            ensure_sync(self.callback.callback(), self.callback)
+        self._settle(auto_steps)
 
-        jwf.db.session.add(step)
+    async def _aactivate(
+        self, transition_callback: Optional["jembewf.TransitionCallback"] = None
+    ):
+        """Awaits callbacks of newly created step"""
+        await self._atransit(transition_callback)
+        with self._callback_span(self.callback, "callback"):
+            await maybe_await(self.callback.callback())
 
+    def _transit(self, transition_callback: Optional["jembewf.TransitionCallback"]):
+        """Calls callback of the transition that leads to this step"""
         if transition_callback:
-            transition_callback.callback(step)
+            with self._callback_span(transition_callback, "callback"):
+                ensure_sync(transition_callback.callback(self), transition_callback)
 
-        step.callback.callback()
+    async def _atransit(
+        self, transition_callback: Optional["jembewf.TransitionCallback"]
+    ):
+        """Awaits callback of the transition that leads to this step"""
+        if transition_callback:
+            with self._callback_span(transition_callback, "callback"):
+                await maybe_await(transition_callback.callback(self))
 
-        if step.is_last_step:
-            step.is_active = False
-            step.ended_at = datetime.utcnow()
-            jwf.db.session.add(step)
-        elif step.state.auto_proceed:
-            step.proceed()
+    def _callback_span(self, callback: Any, method: str) -> ContextManager:
+        """Returns span around the method of state or transition callback"""
+        jwf = get_jembewf()
+        if jwf.instrumentation is None:
+            return NO_SPAN
+        return jwf.span(
+            "callback",
+            flow=self.process.flow_name,
+            state=self.state_name,
+            callback=type(callback).__name__,
+            method=method,
+        )
 
-        return step
+    def _settle(self, auto_steps: Deque["jembewf.StepMixin"]):
+        """Ends last step or queue it to auto proceed after its callbacks are called"""
+        jwf = get_jembewf()
+        if jwf.metrics is not None:
+            jwf.metrics.step_started(self)
+        if self.is_last_step:
+            self.is_active = False
+            self.ended_at = datetime.utcnow()
+            jwf.db.session.add(self)
+        elif self.state.auto_proceed:
+            auto_steps.append(self)
+        elif jwf.notifier is not None:
+            jwf.notifier.step_activated(self)
+
+    @classmethod
+    def _insert_steps(
+        cls,
+        steps_to_insert: Sequence[
+            Tuple[
+                "jembewf.ProcessMixin",
+                "jembewf.State",
+                Optional["jembewf.StepMixin"],
+            ]
+        ],
+    ) -> List["jembewf.StepMixin"]:
+        """Inserts steps with one multi-row INSERT ... RETURNING statement
+
+        Args:
+            steps_to_insert: process, state and previous step of every step
+
+        Returns:
+            List[jembewf.StepMixin]: Inserted steps in the order of steps_to_insert
+        """
+        if not steps_to_insert:
+            return []
+        jwf = get_jembewf()
+        jwf.db.session.flush()
+        steps = list(
+            jwf.db.session.scalars(
+                sa.insert(jwf.step_model).returning(
+                    jwf.step_model, sort_by_parameter_order=True
+                ),
+                [
+                    {
+                        "process_id": process.id,
+                        "state_name": state.name,
+                        "prev_step_id": prev_step.id if prev_step else None,
+                        "variables": {},
+                        "is_last_step": state.is_end,
+                    }
+                    for process, state, prev_step in steps_to_insert
+                ],
+            )
+        )
+
+        for step, (process, state, prev_step) in zip(steps, steps_to_insert):
+            # returned instance can be left in session by rolled back insert
+            # with the same id (SQLite reuses ids), so it is reset to new step
+            set_committed_value(step, "process", process)
+            set_committed_value(step, "prev_step", prev_step)
+            step.__dict__.pop("_jwf_callback", None)
+            if state.timed_transitions:
+                step.due_at = state.next_due_at(step)
+        subscribed = [step for step in steps if step.state.event_transitions]
+        if subscribed:
+            jwf.subscription_model.subscribe(subscribed)
+
+        # add inserted steps to processes with loaded steps
+        loaded_steps: Dict[int, Tuple["jembewf.ProcessMixin", list]] = {}
+        for step, (process, _, _) in zip(steps, steps_to_insert):
+            if process.steps_loaded:
+                loaded_steps.setdefault(id(process), (process, list(process.steps)))[
+                    1
+                ].append(step)
+        for process, process_steps in loaded_steps.values():
+            set_committed_value(process, "steps", process_steps)
+        return steps
+
+    @classmethod
+    def proceed_steps(
+        cls, steps: Iterable["jembewf.StepMixin"]
+    ) -> List["jembewf.StepMixin"]:
+        """Proceeds many steps, possibly from different processes
+
+        Steps are proceeded in rounds: transitions of all steps are evaluated,
+        new steps are inserted with one multi-row INSERT and then their callbacks
+        are called. Auto steps created in a round are proceeded in the next round.
+        Unlike calling proceed on every step, is_running of the processes is
+        not checked after every step but updated for all processes at the end
+        with one set-based UPDATE (see ProcessMixin.update_is_running).
+
+        Returns:
+            List[jembewf.StepMixin]: Steps that proceeded
+        """
+        jwf = get_jembewf()
+        steps = list(steps)
+        with jwf.span("step.proceed", count=len(steps)):
+            auto_steps: Deque["jembewf.StepMixin"] = deque()
+            process_ids: Set[int] = set()
+            proceeded = cls._proceed_round(steps, auto_steps, process_ids)
+            cls._proceed_auto_rounds(auto_steps, process_ids)
+
+            jwf.db.session.flush()
+            jwf.process_model.update_is_running(process_ids)
+        return proceeded
+
+    @classmethod
+    def _proceed_round(
+        cls,
+        steps: Iterable["jembewf.StepMixin"],
+        auto_steps: Deque["jembewf.StepMixin"],
+        process_ids: Set[int],
+    ) -> List["jembewf.StepMixin"]:
+        """Proceeds steps with every transition that can proceed
+
+        Appends created auto steps to auto_steps and ids of the processes
+        of proceeded steps to process_ids.
+        """
+        proceeded = []
+        moves = []
+        for step, transition_callbacks in cls._evaluate_steps(steps):
+            if transition_callbacks:
+                proceeded.append(step)
+                moves.extend((step, callback) for callback in transition_callbacks)
+
+        new_steps = cls._insert_steps(
+            [
+                (step.process, callback.to_state, step)
+                for step, callback in moves
+                if not callback.to_state.join
+            ]
+        )
+        for (_, transition_callback), new_step in zip(
+            [move for move in moves if not move[1].to_state.join], new_steps
+        ):
+            new_step._activate(auto_steps, transition_callback)
+        for step, transition_callback in moves:
+            if transition_callback.to_state.join:
+                joined = cls._arrive(
+                    step.process,
+                    transition_callback.to_state,
+                    step,
+                    transition_callback.transition,
+                )
+                if joined.is_active:
+                    joined._activate(auto_steps, transition_callback)
+                else:
+                    joined._transit(transition_callback)
+
+        for step in proceeded:
+            step._end()
+            process_ids.add(step.process_id)
+        return proceeded
+
+    @classmethod
+    def _evaluate_steps(
+        cls, steps: Iterable["jembewf.StepMixin"]
+    ) -> List[Tuple["jembewf.StepMixin", List["jembewf.TransitionCallback"]]]:
+        """Evaluates transitions of many active steps
+
+        Steps are grouped by transition and TransitionCallback.can_proceed_batch
+        is called once per transition, falling back to can_proceed of every
+        step when can_proceed_batch returns None.
+
+        Returns:
+            List[Tuple[jembewf.StepMixin, List[jembewf.TransitionCallback]]]:
+                every active step with callbacks of the transitions that can proceed,
+                in order of steps and their transitions
+        """
+        steps = [s for s in steps if s.is_active and not s.is_last_step]
+        now = datetime.utcnow()
+        can_proceed: Dict[Tuple[int, str], bool] = {}
+        steps_by_transition: Dict[str, List[int]] = {}
+        for position, step in enumerate(steps):
+            for trans in step.state.direct_transitions:
+                if trans.is_timed and not trans.check_due(step, now):
+                    can_proceed[(position, trans.name)] = False
+                else:
+                    steps_by_transition.setdefault(trans.name, []).append(position)
+
+        for transition_name, positions in steps_by_transition.items():
+            trans = steps[positions[0]].state.get_transition(transition_name)
+            results = trans.callback.can_proceed_batch(
+                trans, [steps[position] for position in positions]
+            )
+            if results is None:
+                continue
+            if len(results) != len(positions):
+                raise Exception(
+                    f"{trans.callback.__name__}.can_proceed_batch returned "
+                    f"{len(results)} results for {len(positions)} steps."
+                )
+            for position, result in zip(positions, results):
+                can_proceed[(position, transition_name)] = bool(result)
+
+        candidates = []
+        unchecked = []
+        for position, step in enumerate(steps):
+            transition_callbacks = []
+            for trans in step.state.direct_transitions:
+                batch_result = can_proceed.get((position, trans.name))
+                if batch_result is False:
+                    continue
+                transition_callback = trans.callback(trans, step)
+                transition_callbacks.append(transition_callback)
+                if batch_result is None:
+                    unchecked.append(transition_callback)
+            candidates.append((step, transition_callbacks))
+
+        cannot_proceed = {
+            id(transition_callback)
+            for transition_callback, result in zip(
+                unchecked, cls._check_can_proceed(unchecked)
+            )
+            if not result
+        }
+        return [
+            (step, [tc for tc in transition_callbacks if id(tc) not in cannot_proceed])
+            for step, transition_callbacks in candidates
+        ]
+
+    @staticmethod
+    def _check_can_proceed(
+        transition_callbacks: Sequence["jembewf.TransitionCallback"],
+    ) -> List[Union[bool, "jembewf.CanProceed"]]:
+        """Returns result of can_proceed of every transition callback
+
+        Transitions whose timer is not due yet can't proceed and their
+        can_proceed is not called.
+        When JembeWF.executor is set, tasks returned by can_proceed_task are
+        submited to the executor first and other callbacks are checked on this
+        thread while the tasks are running.
+        """
+        now = datetime.utcnow()
+        results: List[Union[bool, "jembewf.CanProceed"]] = [
+            tc.transition.check_due(tc.from_step, now) for tc in transition_callbacks
+        ]
+        due = [position for position, result in enumerate(results) if result]
+
+        executor = get_jembewf().executor
+        futures = {}
+        if executor is not None and len(due) > 1:
+            for position in due:
+                task = transition_callbacks[position].can_proceed_task()
+                if task:
+                    futures[position] = executor.submit(task[0], *task[1])
+        for position in due:
+            transition_callback = transition_callbacks[position]
+            if position not in futures:
+                with transition_callback.from_step._callback_span(
+                    transition_callback, "can_proceed"
+                ):
+                    results[position] = ensure_sync(
+                        transition_callback.can_proceed(), transition_callback
+                    )
+        for position, future in futures.items():
+            results[position] = future.result()
+        return results
+
+    @classmethod
+    def _proceed_auto_rounds(
+        cls, auto_steps: Deque["jembewf.StepMixin"], process_ids: Set[int]
+    ):
+        """Proceeds queued auto steps in rounds until the queue is empty
+
+        Same as _proceed_auto_steps but steps created in one round are inserted
+        together. At most JembeWF.max_auto_steps steps are proceeded.
+        """
+        jwf = get_jembewf()
+        proceeded = 0
+        while auto_steps:
+            count = len(auto_steps)
+            if jwf.max_auto_steps is not None:
+                count = min(count, jwf.max_auto_steps - proceeded)
+                if count <= 0:
+                    break
+            proceeded += count
+            cls._proceed_round(
+                [auto_steps.popleft() for _ in range(count)], auto_steps, process_ids
+            )
+
+    @classmethod
+    def _proceed_auto_steps(
+        cls,
+        auto_steps: Union[Iterable["jembewf.StepMixin"], Generator],
+        check_is_running: bool = True,
+    ) -> Any:
+        """Proceeds auto steps depth-first and returns result of auto_steps generator
+
+        Proceeding of every step is a generator (see _proceeding) kept on a stack
+        instead of proceeding recursively, so long chains or loops of auto states
+        don't grow the call stack while steps that follow a step are still
+        proceeded before its next transition is checked. When more than
+        JembeWF.max_auto_steps steps are proceeded the rest of the auto steps are
+        left active and will be proceeded by the next call to proceed.
+        """
+        jwf = get_jembewf()
+        proceeded = 0
+        result = None
+        stack = [iter(auto_steps)]
+        while stack:
+            try:
+                step = next(stack[-1])
+            except StopIteration as stop:
+                stack.pop()
+                result = stop.value
+                continue
+            if jwf.max_auto_steps is not None and proceeded >= jwf.max_auto_steps:
+                continue
+            stack.append(step._proceeding(check_is_running=check_is_running))
+            proceeded += 1
+            # Steps reference previous steps, so flush sorts pending steps
+            # one by one, flushing periodically keeps that sort small
+            if proceeded % AUTO_STEPS_FLUSH_INTERVAL == 0:
+                jwf.db.session.flush()
+        return result
 
     def proceed(
         self,
@@ -152,34 +709,277 @@ class StepMixin:
             Union[bool, jembewf.CanProceed]: Returns True if process can proceed or
                 CanProceed instanace with concated reasons if process can't proceed.
         """
+        return self.proceed_transitions(
+            [transition] if transition else None, **transition_params
+        )
+
+    def proceed_transitions(
+        self,
+        transitions: Optional[Sequence["jembewf.Transition"]] = None,
+        **transition_params
+    ) -> Union[bool, "jembewf.CanProceed"]:
+        """Proceed process with transitions from this step
+
+        Same as proceed but with many transitions, used by jwf.signal to proceed
+        with all transitions waiting on the event.
+        If transitions is None than proceed with every transition on this step
+        that doesn't wait on event.
+        """
+        with get_jembewf().span(
+            "step.proceed",
+            flow=self.process.flow_name,
+            state=self.state_name,
+            step_id=self.id,
+        ):
+            return self._proceed_auto_steps(
+                self._proceeding(transitions, **transition_params)
+            )
+
+    def _proceeding(
+        self,
+        transitions: Optional[Sequence["jembewf.Transition"]] = None,
+        check_is_running: bool = True,
+        **transition_params,
+    ) -> Generator["jembewf.StepMixin", None, Union[bool, "jembewf.CanProceed"]]:
+        """Proceed with transitions yielding created auto steps
+
+        Auto step is yielded as soon as it is created, before the next transition
+        is checked, so _proceed_auto_steps can proceed it first.
+        Returns same as proceed.
+        When check_is_running is False caller is responsible for updating
+        is_running of the process.
+        """
         # check if this is not last step and is active
         if self.is_last_step or not self.is_active:
             return False
 
-        if transition and transition not in self.state.transitions:
-            raise ValueError(
-                f"Transition '{transition}' is not transition from state '{self.state}'"
-            )
-        transitions = [transition] if transition else self.state.transitions
-
+        transitions = self._get_transitions(transitions)
         proceeded = False
         cannot_proceed = CanProceed(False)
-        for trans in transitions:
-            transition_callback = trans.callback(trans, self, **transition_params)
-            if can_proceed := transition_callback.can_proceed():
-                self.create(self.process, trans.to_state, self, transition_callback)
-                proceeded = True
-            else:
+        for transition_callback, can_proceed in self._evaluate_transitions(
+            transitions, **transition_params
+        ):
+            if not can_proceed:
                 cannot_proceed.append_reason(can_proceed)
+                continue
+            auto_steps: Deque["jembewf.StepMixin"] = deque()
+            self._create(
+                self.process,
+                transition_callback.to_state,
+                auto_steps,
+                self,
+                transition_callback,
+            )
+            proceeded = True
+            yield from auto_steps
 
-        if proceeded:
-            self.is_active = False
-            self.ended_at = datetime.utcnow()
-            jwf = get_jembewf()
-            jwf.db.session.add(self)
+        if not proceeded:
+            return cannot_proceed
+
+        self._end()
+        if check_is_running:
             self.process.check_is_running()
+        return True
+
+    async def aproceed(
+        self,
+        transition: Optional["jembewf.Transition"] = None,
+        **transition_params
+    ) -> Union[bool, "jembewf.CanProceed"]:
+        """Proceed process with transition from this step awaiting async callbacks
+
+        Same as proceed but can_proceed of all transitions are awaited concurrently
+        and so are the callbacks of the steps created by them. Auto steps are
+        proceeded level by level, callbacks of the same level concurrently.
+        Steps are added to the session in order of transitions, between awaits,
+        so writes to the database stay ordered.
+
+        Returns:
+            Union[bool, jembewf.CanProceed]: Returns True if process can proceed or
+                CanProceed instanace with concated reasons if process can't proceed.
+        """
+        with get_jembewf().span(
+            "step.proceed",
+            flow=self.process.flow_name,
+            state=self.state_name,
+            step_id=self.id,
+        ):
+            auto_steps: Deque["jembewf.StepMixin"] = deque()
+            (proceeded,) = await self._aproceed_steps(
+                [self],
+                auto_steps,
+                [transition] if transition else None,
+                **transition_params,
+            )
+            await self._aproceed_auto_steps(auto_steps)
+        return proceeded
+
+    @classmethod
+    async def _aproceed_steps(
+        cls,
+        steps: Sequence["jembewf.StepMixin"],
+        auto_steps: Deque["jembewf.StepMixin"],
+        transitions: Optional[Sequence["jembewf.Transition"]] = None,
+        **transition_params,
+    ) -> List[Union[bool, "jembewf.CanProceed"]]:
+        """Async version of _proceed for many steps
+
+        Only can_proceed and callbacks are awaited concurrently: transitions
+        that can proceed are first collected for all steps, then new steps
+        are added to the session one by one, their callbacks are awaited
+        and at the end proceeded steps are ended one by one, so coroutines
+        never use the session at the same time.
+
+        Returns:
+            List[Union[bool, jembewf.CanProceed]]: Results in order of steps
+        """
+        results: List[Union[bool, "jembewf.CanProceed"]] = [False] * len(steps)
+        checking = []
+        for position, step in enumerate(steps):
+            if step.is_last_step or not step.is_active:
+                continue
+            results[position] = CanProceed(False)
+            for trans in step._get_transitions(transitions):
+                transition_callback = trans.callback(trans, step, **transition_params)
+                if due := trans.check_due(step):
+                    checking.append((position, transition_callback))
+                else:
+                    results[position].append_reason(due)
+        checked = await asyncio.gather(
+            *(cls._acheck_can_proceed(tc) for _, tc in checking)
+        )
+
+        session = get_jembewf().db.session
+        proceeded: Dict[int, "jembewf.StepMixin"] = {}
+        activating = []
+        waiting = []
+        for (position, transition_callback), can_proceed in zip(checking, checked):
+            if not can_proceed:
+                if position not in proceeded:
+                    results[position].append_reason(can_proceed)
+                continue
+            step = steps[position]
+            proceeded[position] = step
+            results[position] = True
+            to_state = transition_callback.to_state
+            if to_state.join:
+                new_step = cls._arrive(
+                    step.process, to_state, step, transition_callback.transition
+                )
+                if not new_step.is_active:
+                    waiting.append((new_step, transition_callback))
+                    continue
+            else:
+                new_step = cls._build(step.process, to_state, step)
+                session.add(new_step)
+            activating.append((new_step, transition_callback))
+        await asyncio.gather(
+            *(
+                new_step._aactivate(transition_callback)
+                for new_step, transition_callback in activating
+            ),
+            *(
+                new_step._atransit(transition_callback)
+                for new_step, transition_callback in waiting
+            ),
+        )
 
-        return proceeded if proceeded else cannot_proceed
+        for new_step, _ in activating:
+            new_step._settle(auto_steps)
+        for step in proceeded.values():
+            step._end()
+            step.process.check_is_running()
+        return results
+
+    @staticmethod
+    async def _acheck_can_proceed(
+        transition_callback: "jembewf.TransitionCallback",
+    ) -> Union[bool, "jembewf.CanProceed"]:
+        """Awaits can_proceed or runs can_proceed_task in JembeWF.executor"""
+        executor = get_jembewf().executor
+        task = transition_callback.can_proceed_task() if executor else None
+        if task:
+            return await asyncio.get_running_loop().run_in_executor(
+                executor, task[0], *task[1]
+            )
+        with transition_callback.from_step._callback_span(
+            transition_callback, "can_proceed"
+        ):
+            return await maybe_await(transition_callback.can_proceed())
+
+    @classmethod
+    async def _aproceed_auto_steps(cls, auto_steps: Deque["jembewf.StepMixin"]):
+        """Proceeds queued auto steps level by level, awaiting callbacks concurrently
+
+        At most JembeWF.max_auto_steps steps are proceeded.
+        """
+        jwf = get_jembewf()
+        proceeded = 0
+        while auto_steps:
+            count = len(auto_steps)
+            if jwf.max_auto_steps is not None:
+                count = min(count, jwf.max_auto_steps - proceeded)
+                if count <= 0:
+                    break
+            proceeded += count
+            level = [auto_steps.popleft() for _ in range(count)]
+            await cls._aproceed_steps(level, auto_steps)
+            jwf.db.session.flush()
+
+    def _get_transitions(
+        self, transitions: Optional[Sequence["jembewf.Transition"]] = None
+    ) -> Sequence["jembewf.Transition"]:
+        """Returns provided transitions or transitions that doesn't wait on event
+
+        Raises:
+            ValueError: When transition is not part of this step.
+        """
+        if transitions is None:
+            return self.state.direct_transitions
+        for transition in transitions:
+            if not self.state.owns(transition):
+                raise ValueError(
+                    f"Transition '{transition}' is not transition from state '{self.state}'"
+                )
+        return transitions
+
+    def _evaluate_transitions(
+        self, transitions: Sequence["jembewf.Transition"], **transition_params
+    ) -> Iterator[
+        Tuple["jembewf.TransitionCallback", Union[bool, "jembewf.CanProceed"]]
+    ]:
+        """Yields callback of every transition with result of its can_proceed
+
+        Without JembeWF.executor can_proceed of a transition is called only when
+        the caller is done with the previous transition, same as when
+        transitions are proceeded one by one. With executor can_proceed of all
+        transitions are checked together so their tasks run concurrently.
+        """
+        if get_jembewf().executor is None:
+            for trans in transitions:
+                transition_callback = trans.callback(trans, self, **transition_params)
+                yield transition_callback, self._check_can_proceed(
+                    [transition_callback]
+                )[0]
+            return
+        checked_callbacks = [
+            trans.callback(trans, self, **transition_params) for trans in transitions
+        ]
+        yield from zip(checked_callbacks, self._check_can_proceed(checked_callbacks))
+
+    def _end(self):
+        """Deactivates step after it proceeded"""
+        self.is_active = False
+        self.ended_at = datetime.utcnow()
+        jwf = get_jembewf()
+        jwf.db.session.add(self)
+        if self.state.event_transitions:
+            if self.id is None:
+                # inserts step and its subscriptions so they can be deleted
+                jwf.db.session.flush()
+            jwf.subscription_model.unsubscribe([self.id])
+        if jwf.metrics is not None:
+            jwf.metrics.step_ended(self)
 
     def can_proceed(
         self, transition: Optional["jembewf.Transition"] = None
@@ -203,20 +1003,220 @@ class StepMixin:
             Union[bool, jembewf.CanProceed]: Returns True if process can proceed or
                 CanProceed instanace with concated reasons if process can't proceed.
         """
-        if transition and transition not in self.state.transitions:
-            raise ValueError(
-                f"Transition '{transition}' is not transition from state '{self.state}'"
-            )
-        transitions = [transition] if transition else self.state.transitions
-
+        transitions = self._get_transitions([transition] if transition else None)
         cannot_proceed = CanProceed(False)
-        for trans in transitions:
-            transition_callback = trans.callback(trans, self)
-            if can_proceed := transition_callback.can_proceed():
-                return True
-            cannot_proceed.append_reason(can_proceed)
+        with get_jembewf().span(
+            "step.can_proceed",
+            flow=self.process.flow_name,
+            state=self.state_name,
+            step_id=self.id,
+        ):
+            for trans in transitions:
+                if not (due := trans.check_due(self)):
+                    cannot_proceed.append_reason(due)
+                    continue
+                transition_callback = trans.callback(trans, self)
+                with self._callback_span(transition_callback, "can_proceed"):
+                    can_proceed = ensure_sync(
+                        transition_callback.can_proceed(), transition_callback
+                    )
+                if can_proceed:
+                    return True
+                cannot_proceed.append_reason(can_proceed)
         return cannot_proceed
 
+    @classmethod
+    def compact_flow(cls, flow: "jembewf.Flow", batch_size: int = 100) -> int:
+        """Compacts steps of processes of the flow that have too many old steps
+
+        Processes with more inactive steps of one state than flow.keep_steps are
+        compacted in batches of batch_size processes, each batch is commited.
+
+        Returns:
+            int: Number of deleted steps
+        """
+        if flow.keep_steps is None:
+            return 0
+        return cls.compact_flow_steps(flow.name, flow.keep_steps, batch_size)
+
+    @classmethod
+    def compact_flow_steps(
+        cls, flow_name: str, keep_steps: int, batch_size: int = 100
+    ) -> int:
+        """Same as compact_flow but with flow name, without loading the flow"""
+        jwf = get_jembewf()
+        process = jwf.process_model
+        process_ids = list(
+            jwf.db.session.scalars(
+                sa.select(cls.process_id)
+                .join(process, cls.process_id == process.id)
+                .where(
+                    process.flow_name == flow_name,
+                    cls.is_active == False,
+                    sa.or_(cls.join_arrivals == None, cls.ended_at != None),
+                    cls.compacted_steps == None,
+                )
+                .group_by(cls.process_id, cls.state_name)
+                .having(sa.func.count() > keep_steps)
+                .distinct()
+                .order_by(cls.process_id)
+            )
+        )
+        deleted = 0
+        for start in range(0, len(process_ids), batch_size):
+            try:
+                deleted += cls.compact(
+                    process_ids[start : start + batch_size], keep_steps
+                )
+                jwf.db.session.commit()
+            except Exception:
+                jwf.db.session.rollback()
+                raise
+        return deleted
+
+    @classmethod
+    def compact(cls, process_ids: Iterable[int], keep: int) -> int:
+        """Collapses old inactive steps of the processes into summary steps
+
+        For every state only the last keep inactive steps are left, older ones
+        are merged into one summary step of the state (with compacted_steps
+        count and started_at/ended_at range) and deleted. prev_step of
+        remaining steps that pointed to deleted steps points to the summary step
+        of the same state.
+
+        Returns:
+            int: Number of deleted steps
+        """
+        jwf = get_jembewf()
+        session = jwf.db.session
+        process_ids = list(process_ids)
+        session.flush()
+        rows = session.execute(
+            sa.select(
+                cls.id,
+                cls.process_id,
+                cls.state_name,
+                cls.started_at,
+                cls.ended_at,
+                cls.compacted_steps,
+            )
+            .where(
+                cls.process_id.in_(process_ids),
+                cls.is_active == False,
+                # join steps waiting for other branches are not compacted
+                sa.or_(cls.join_arrivals == None, cls.ended_at != None),
+            )
+            .order_by(cls.id.desc())
+        ).all()
+
+        summaries = {}
+        old_steps: Dict[Tuple[int, str], list] = {}
+        for row in rows:
+            key = (row.process_id, row.state_name)
+            if row.compacted_steps:
+                summaries[key] = row
+            else:
+                old_steps.setdefault(key, []).append(row)
+
+        summary_values = []
+        # summary step id of every deleted step
+        deleted: Dict[int, int] = {}
+        for key, state_steps in old_steps.items():
+            collapsed = state_steps[keep:]
+            if not collapsed:
+                continue
+            summary = summaries.get(key)
+            if summary is None:
+                summary, collapsed = collapsed[0], collapsed[1:]
+                values = {"id": summary.id, "compacted_steps": 1, "prev_step_id": None}
+            else:
+                values = {"id": summary.id, "compacted_steps": summary.compacted_steps}
+            values["compacted_steps"] += len(collapsed)
+            values["started_at"] = min(
+                row.started_at for row in (summary, *collapsed)
+            )
+            values["ended_at"] = max(
+                (row.ended_at for row in (summary, *collapsed) if row.ended_at),
+                default=None,
+            )
+            summary_values.append(values)
+            deleted.update((row.id, summary.id) for row in collapsed)
+        if not summary_values:
+            return 0
+
+        summary_ids = {values["id"] for values in summary_values}
+        # newer steps reference older ones with prev_step_id, so chunks
+        # of steps are deleted from the newest
+        deleted_ids = sorted(deleted, reverse=True)
+        repointed = []
+        for start in range(0, len(deleted_ids), COMPACT_CHUNK_SIZE):
+            repointed.extend(
+                {"id": step_id, "prev_step_id": deleted[prev_step_id]}
+                for step_id, prev_step_id in session.execute(
+                    sa.select(cls.id, cls.prev_step_id).where(
+                        cls.process_id.in_(process_ids),
+                        cls.prev_step_id.in_(
+                            deleted_ids[start : start + COMPACT_CHUNK_SIZE]
+                        ),
+                    )
+                )
+                if step_id not in deleted and step_id not in summary_ids
+            )
+        session.execute(sa.update(cls), summary_values)
+        if repointed:
+            session.execute(sa.update(cls), repointed)
+        for start in range(0, len(deleted_ids), COMPACT_CHUNK_SIZE):
+            session.execute(
+                sa.delete(cls)
+                .where(cls.id.in_(deleted_ids[start : start + COMPACT_CHUNK_SIZE]))
+                .execution_options(synchronize_session=False)
+            )
+
+        # forget deleted steps and reload changed steps of processes in the session
+        compacted = set(process_ids)
+        # (attributes of expired instances are not accessed to not load them)
+        for (_, identity, _), instance in list(session.identity_map.items()):
+            if isinstance(instance, cls):
+                if identity[0] in deleted:
+                    session.expunge(instance)
+                elif instance.__dict__.get("process_id") in compacted:
+                    session.expire(instance)
+            elif isinstance(instance, jwf.process_model) and identity[0] in compacted:
+                session.expire(instance, ["steps"])
+        return len(deleted)
+
+    @classmethod
+    def get_table_args(cls) -> tuple:
+        """Returns indexes used by the queries on active steps
+
+        When model defines its own __table_args__ it should include these by
+        declaring __table_args__ with declared_attr that returns
+        `(*cls.get_table_args(), ...)`.
+        """
+        if not cls.__create_indexes__:
+            return ()
+        return (
+            sa.Index(
+                f"ix_{cls.__tablename__}_process_id_is_active",
+                "process_id",
+                "is_active",
+            ),
+            # partial index, only active steps are indexed
+            sa.Index(
+                f"ix_{cls.__tablename__}_active",
+                "id",
+                postgresql_where=sa.text("is_active"),
+                sqlite_where=sa.text("is_active"),
+            ),
+            # partial index, only active steps waiting on timers are indexed
+            sa.Index(
+                f"ix_{cls.__tablename__}_due_at",
+                "due_at",
+                postgresql_where=sa.text("is_active AND due_at IS NOT NULL"),
+                sqlite_where=sa.text("is_active AND due_at IS NOT NULL"),
+            ),
+        )
+
     @classmethod
     def get_process_table_name(cls) -> str:
         """Returns name of Process table defined in cls.__process_table_name__
@@ -0,0 +1,168 @@
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Set
+import sqlalchemy as sa
+from sqlalchemy.orm import declarative_mixin, declared_attr
+from .helpers import get_jembewf
+
+if TYPE_CHECKING:
+    import jembewf
+
+__all__ = ("SubscriptionMixin",)
+
+
+@declarative_mixin
+class SubscriptionMixin:
+    """Mixin to be applied to Subscription SqlAlchemy model
+
+    Subscription model keep track of active steps waiting on events of their
+    transitions (Transition(..., on="event.name")). Subscriptions are created
+    with the step and deleted when step ends, so jwf.signal finds steps woken
+    by the event with one indexed query.
+
+    SubscriptionMixin should be applied class extended from
+    flask_sqlalchemy.SqlAlchemy().Model who defines model in database
+    and the model should be provided to JembeWF as subscription_model.
+    """
+
+    __step_table_name__: str = "jwf_steps"
+    __step_class_name__: str = "Step"
+
+    __tablename__ = "jwf_subscriptions"
+
+    # set to False in model to not create indexes declared by SubscriptionMixin
+    __create_indexes__: bool = True
+
+    @declared_attr
+    def __table_args__(cls):
+        return cls.get_table_args()
+
+    id = sa.Column(sa.Integer, primary_key=True)
+
+    event = sa.Column(sa.String(250), nullable=False)
+    # correlation key of the event, ex. id of the paid invoice
+    key = sa.Column(sa.String(250))
+    transition_name = sa.Column(sa.String(250), nullable=False)
+
+    @declared_attr
+    def step_id(cls):
+        """Foreign key to Step table"""
+        return sa.Column(
+            sa.Integer,
+            sa.ForeignKey(f"{cls.get_step_table_name()}.id"),
+            nullable=False,
+        )
+
+    @declared_attr
+    def step(cls):
+        """Defines step relationship"""
+        return sa.orm.relationship(
+            cls.get_step_class_name(), foreign_keys=[cls.step_id]
+        )
+
+    @classmethod
+    def subscribe(cls, steps: Sequence["jembewf.StepMixin"]):
+        """Adds subscriptions for event transitions of the steps to the session"""
+        get_jembewf().db.session.add_all(
+            [
+                cls(
+                    step=step,
+                    event=transition.on,
+                    key=transition.event_key(step),
+                    transition_name=transition.name,
+                )
+                for step in steps
+                for transition in step.state.event_transitions
+            ]
+        )
+
+    @classmethod
+    def unsubscribe(cls, step_ids: Sequence[int]):
+        """Deletes subscriptions of the steps"""
+        if step_ids:
+            get_jembewf().db.session.execute(
+                sa.delete(cls).where(cls.step_id.in_(step_ids))
+            )
+
+    @classmethod
+    def signal(cls, event: str, key: Optional[Any] = None, **params) -> Set[int]:
+        """Proceeds active steps waiting on the event
+
+        When key is provided only steps subscribed with the same key are proceeded,
+        otherwise all steps waiting on the event are proceeded.
+        params are passed to the transition callbacks.
+        Steps are locked with SELECT ... FOR UPDATE SKIP LOCKED, so steps
+        already being proceeded by concurrent signal are not proceeded twice.
+
+        Returns:
+            Set[int]: Ids of the processes that proceeded to new steps
+        """
+        jwf = get_jembewf()
+        step = jwf.step_model
+        query = (
+            jwf.db.session.query(step, cls.transition_name)
+            .join(cls, cls.step_id == step.id)
+            .filter(cls.event == event, step.is_active == True)
+        )
+        if key is not None:
+            query = query.filter(cls.key == str(key))
+
+        transitions: Dict[int, List[str]] = {}
+        steps = {}
+        for subscribed_step, transition_name in query.order_by(
+            step.id, cls.id
+        ).with_for_update(of=step, skip_locked=True):
+            steps[subscribed_step.id] = subscribed_step
+            transitions.setdefault(subscribed_step.id, []).append(transition_name)
+
+        process_ids = set()
+        for step_id, subscribed_step in steps.items():
+            state = subscribed_step.state
+            if subscribed_step.proceed_transitions(
+                [state.get_transition(name) for name in transitions[step_id]],
+                **params,
+            ):
+                process_ids.add(subscribed_step.process_id)
+        return process_ids
+
+    @classmethod
+    def get_table_args(cls) -> tuple:
+        """Returns indexes used to find subscriptions of the event
+
+        When model defines its own __table_args__ it should include these by
+        declaring __table_args__ with declared_attr that returns
+        `(*cls.get_table_args(), ...)`.
+        """
+        if not cls.__create_indexes__:
+            return ()
+        return (
+            sa.Index(f"ix_{cls.__tablename__}_event_key", "event", "key"),
+            sa.Index(f"ix_{cls.__tablename__}_step_id", "step_id"),
+        )
+
+    @classmethod
+    def get_step_table_name(cls) -> str:
+        """Returns name of Step table defined in cls.__step_table_name__
+
+        It's used to create relationship between subscriptions and steps.
+        """
+        try:
+            return cls.__step_table_name__
+        except AttributeError as err:
+            raise AttributeError(
+                f"Attribute __step_table_name__ for '{cls.__name__}' is not defined"
+            ) from err
+
+    @classmethod
+    def get_step_class_name(cls) -> str:
+        """Returns name of Step class defined in cls.__step_class_name__
+
+        It's used to create relationship between subscriptions and steps.
+        """
+        try:
+            return cls.__step_class_name__
+        except AttributeError as err:
+            raise AttributeError(
+                f"Attribute __step_class_name__ for '{cls.__name__}' is not defined"
+            ) from err
+
+    def __repr__(self):
+        return f"<Subscription #{self.id}: '{self.event}' key '{self.key}' of step #{self.step_id}>"
@@ -1,10 +1,22 @@
-from typing import TYPE_CHECKING, Optional, Type, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    Union,
+)
+from datetime import datetime, timedelta
 from hashlib import md5
+from .helpers import CanProceed
 
 if TYPE_CHECKING:
     import jembewf
 
-__all__ = ("Transition", "TransitionCallback")
+__all__ = ("Transition", "TransitionCallback", "AsyncTransitionCallback")
 
 
 class TransitionCallback:
@@ -17,7 +29,7 @@ class TransitionCallback:
         self, transition: "jembewf.Transition", from_step: "jembewf.StepMixin", **params
     ):
         self.from_step = from_step
-        self.process:"jembewf.ProcessMixin" = from_step.process
+        self.process: "jembewf.ProcessMixin" = from_step.process
 
         self.transition = transition
         self.from_state = transition.from_state
@@ -50,10 +62,71 @@ class TransitionCallback:
         """
         return True
 
+    def can_proceed_task(
+        self,
+    ) -> Optional[
+        Tuple[Callable[..., Union[bool, "jembewf.CanProceed"]], Tuple[Any, ...]]
+    ]:
+        """Returns function and arguments that check if a transition can proceed
+
+        Override this method to evaluate CPU heavy checks in JembeWF.executor
+        (thread or process pool) in parallel with checks of other transitions.
+        Function and arguments must be picklable when process pool is used, so
+        pass plain data (ex. process variables) instead of steps and processes.
+        Default returns None which means that can_proceed is called on the
+        session thread.
+
+        Returns:
+            Optional[Tuple[Callable, Tuple]]: None to use can_proceed, otherwise
+                function returning same as can_proceed and its arguments.
+        """
+        return None
+
+    @classmethod
+    def can_proceed_batch(
+        cls, transition: "jembewf.Transition", steps: Sequence["jembewf.StepMixin"]
+    ) -> Optional[List[Union[bool, "jembewf.CanProceed"]]]:
+        """Check if a transition can proceed from many steps at once
+
+        Override this method to check conditions of many steps with one
+        SQL query or one comparison over column array instead of calling
+        can_proceed for every step. Called by StepMixin.proceed_steps
+        (used by proceed_many and Runner). Default returns None which means
+        that can_proceed of every step callback is used.
+
+        Args:
+            transition (jembewf.Transition): Transition that is checked
+            steps (Sequence[jembewf.StepMixin]): Active steps of the from_state
+
+        Returns:
+            Optional[List[Union[bool, jembewf.CanProceed]]]: None to use can_proceed,
+                otherwise list with result of can_proceed for every step
+                in the same order as steps.
+        """
+        return None
+
     def callback(self, to_step: "jembewf.StepMixin"):
         """Called when transiting to the to_state/step"""
 
 
+class AsyncTransitionCallback(TransitionCallback):
+    """TransitionCallback with async can_proceed and callback
+
+    Async methods are awaited by aproceed, proceed raises an exception.
+    """
+
+    async def can_proceed(  # pylint: disable=invalid-overridden-method
+        self,
+    ) -> Union[bool, "jembewf.CanProceed"]:
+        """Check if a transition is ready proceed to next step/state"""
+        return True
+
+    async def callback(  # pylint: disable=invalid-overridden-method
+        self, to_step: "jembewf.StepMixin"
+    ):
+        """Called when transiting to the to_state/step"""
+
+
 class Transition:
     """Defines and configures Transition"""
 
@@ -61,12 +134,42 @@ class Transition:
         self,
         to_state_name: str,
         callback: Optional[Type["jembewf.TransitionCallback"]] = None,
+        after: Optional[timedelta] = None,
+        at: Optional[Callable[["jembewf.StepMixin"], Optional[datetime]]] = None,
+        on: Optional[str] = None,
+        key: Optional[Callable[["jembewf.StepMixin"], Any]] = None,
         **config,
     ) -> None:
+        """
+        Args:
+            to_state_name (str): Name of the state to which transition leads
+            callback (Optional[Type[jembewf.TransitionCallback]]): Business logic
+            after (Optional[timedelta]): Transition can proceed only after this
+                time passed from the start of the step
+            at (Optional[Callable]): Function that returns time (UTC) of the step
+                after which transition can proceed
+            on (Optional[str]): Name of the event on which transition waits,
+                transition proceeds only when event is signaled with jwf.signal
+            key (Optional[Callable]): Function that returns correlation key of
+                the event for the step (ex. id of the invoice), signal with key
+                proceeds only steps with the same key
+        """
+        if after is not None and at is not None:
+            raise Exception(
+                f"Transition to '{to_state_name}' can't have both 'after' and 'at'."
+            )
         self.to_state_name = to_state_name
         self.callback: Type[TransitionCallback] = (
             callback if callback is not None else TransitionCallback
         )
+        if key is not None and on is None:
+            raise Exception(
+                f"Transition to '{to_state_name}' has event 'key' without 'on' event."
+            )
+        self.after = after
+        self.at = at
+        self.on = on
+        self.key = key
         self.config = config
 
         self.flow: "jembewf.Flow"
@@ -77,12 +180,59 @@ class Transition:
 
         self.validate = False
 
-    def attach_to_from_state(self, state: "jembewf.State"):
-        """Attach to the State"""
+    @property
+    def is_timed(self) -> bool:
+        """True when transition waits for 'after' or 'at' time"""
+        return self.after is not None or self.at is not None
+
+    def event_key(self, step: "jembewf.StepMixin") -> Optional[str]:
+        """Returns correlation key of the event for the step"""
+        if self.key is None:
+            return None
+        key = self.key(step)
+        return str(key) if key is not None else None
+
+    def due_at(self, step: "jembewf.StepMixin") -> Optional[datetime]:
+        """Returns time after which transition can proceed from the step
+
+        Returns None when transition doesn't wait.
+        """
+        if self.after is not None:
+            return (step.started_at or datetime.utcnow()) + self.after
+        if self.at is not None:
+            return self.at(step)
+        return None
+
+    def check_due(
+        self, step: "jembewf.StepMixin", now: Optional[datetime] = None
+    ) -> Union[bool, "jembewf.CanProceed"]:
+        """Check if time of the transition has come
+
+        Returns:
+            Union[bool, jembewf.CanProceed]: True when transition doesn't wait or
+                its time has come, otherwise CanProceed with time it is due.
+        """
+        if not self.is_timed:
+            return True
+        due_at = self.due_at(step)
+        if due_at is None or due_at <= (now or datetime.utcnow()):
+            return True
+        return CanProceed(
+            False, f"Transition to '{self.to_state_name}' is due at {due_at}."
+        )
+
+    def attach_to_from_state(
+        self, state: "jembewf.State", transition_id: Optional[int] = None
+    ):
+        """Attach to the State
+
+        transition_id is position of the transition in state.transitions.
+        """
         self.from_state = state
         self.flow = state.flow
         self.to_state = self.flow.states[self.to_state_name]
-        transition_id = state.transitions.index(self)
+        if transition_id is None:
+            transition_id = state.transitions.index(self)
         self.name = md5(
             f"{self.flow.name } -- {self.from_state.name} -- {transition_id}".encode()
         ).hexdigest()
@@ -0,0 +1,183 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import declarative_mixin, declared_attr
+from .helpers import get_jembewf
+from .variables import TRACKED_KEY, is_missing
+
+if TYPE_CHECKING:
+    from flask_sqlalchemy import SQLAlchemy
+    import jembewf
+
+__all__ = ("VariableMixin",)
+
+
+@declarative_mixin
+class VariableMixin:
+    """Mixin to be applied to process Variable SqlAlchemy model
+
+    Variable model keeps process variables one row per variable instead of
+    in process.variables json column, so changing one variable of the process
+    with large variables writes only that variable. Variables are read and
+    written with ProcessMixin.vars.
+
+    VariableMixin should be applied class extended from
+    flask_sqlalchemy.SqlAlchemy().Model who defines model in database
+    and the model should be provided to JembeWF as variable_model.
+    """
+
+    __process_table_name__: str = "jwf_processes"
+
+    __tablename__ = "jwf_process_variables"
+
+    @declared_attr
+    def process_id(cls):
+        """Foreign key to Process table"""
+        return sa.Column(
+            sa.Integer,
+            sa.ForeignKey(f"{cls.get_process_table_name()}.id"),
+            primary_key=True,
+        )
+
+    name = sa.Column(sa.String(250), primary_key=True)
+    value = sa.Column(sa.JSON().with_variant(postgresql.JSONB(), "postgresql"))
+
+    @classmethod
+    def init_db(cls, db: "SQLAlchemy"):
+        """Registers session events writing changed variables, called by JembeWF.init_app"""
+        session_factory = db.session.session_factory
+        sa.event.listen(session_factory, "after_flush_postexec", cls._after_flush)
+        sa.event.listen(session_factory, "after_commit", cls._after_end)
+        sa.event.listen(session_factory, "after_rollback", cls._after_end)
+
+    @classmethod
+    def load(
+        cls, process_id: int, names: Optional[Iterable[str]] = None
+    ) -> Dict[str, Any]:
+        """Returns variables of the process, only ones in names when provided"""
+        query = sa.select(cls.name, cls.value).where(cls.process_id == process_id)
+        if names is not None:
+            query = query.where(cls.name.in_(list(names)))
+        return dict(get_jembewf().db.session.execute(query).all())
+
+    @classmethod
+    def has_value(
+        cls, process_id: sa.ColumnElement, name: str, value: Any
+    ) -> sa.Exists:
+        """Returns EXISTS clause true when process has variable equal to value"""
+        return sa.exists().where(
+            cls.process_id == process_id,
+            cls.name == name,
+            cls.value == sa.bindparam(None, value, type_=cls.value.type),
+        )
+
+    @classmethod
+    def declare_variable_index(
+        cls, flow_name: str, variable: "jembewf.FlowVariable"
+    ) -> sa.Index:
+        """Declares partial index of the values of the variable
+
+        Values are indexed as they are, without cast, so flows declaring
+        variable with the same name share the index.
+        Index is created by db.create_all or JembeWF.create_indexes.
+        """
+        name = f"ix_{cls.__tablename__}_{variable.name}"
+        for index in cls.__table__.indexes:
+            if index.name == name:
+                return index
+        return sa.Index(
+            name,
+            cls.value,
+            postgresql_where=cls.name == variable.name,
+            sqlite_where=cls.name == variable.name,
+        )
+
+    @classmethod
+    def save(
+        cls, connection: sa.engine.Connection, changes: Dict[int, Dict[str, Any]]
+    ):
+        """Writes changed variables of the processes
+
+        changes are assigned values by variable names by process ids.
+        Assigned variables are upserted with one INSERT ... ON CONFLICT DO UPDATE
+        (DELETE and INSERT on databases other than PostgreSQL and SQLite)
+        and deleted variables are deleted.
+        """
+        table = cls.__table__
+        rows: List[Dict[str, Any]] = []
+        for process_id, values in changes.items():
+            deleted = [name for name, value in values.items() if is_missing(value)]
+            if deleted:
+                connection.execute(
+                    table.delete().where(
+                        table.c.process_id == process_id, table.c.name.in_(deleted)
+                    )
+                )
+            rows.extend(
+                {"process_id": process_id, "name": name, "value": value}
+                for name, value in values.items()
+                if not is_missing(value)
+            )
+        if not rows:
+            return
+
+        dialect = {"postgresql": postgresql, "sqlite": sqlite}.get(
+            connection.dialect.name
+        )
+        if dialect is not None:
+            insert = dialect.insert(table)
+            connection.execute(
+                insert.on_conflict_do_update(
+                    index_elements=[table.c.process_id, table.c.name],
+                    set_={"value": insert.excluded.value},
+                ),
+                rows,
+            )
+            return
+        for process_id, values in changes.items():
+            connection.execute(
+                table.delete().where(
+                    table.c.process_id == process_id,
+                    table.c.name.in_(list(values.keys())),
+                )
+            )
+        connection.execute(table.insert(), rows)
+
+    @classmethod
+    def _after_flush(cls, session: sa.orm.Session, flush_context):
+        tracked = session.info.get(TRACKED_KEY)
+        if not tracked:
+            return
+        changes = {}
+        written = []
+        for variables in tracked.values():
+            if variables._changed:  # pylint: disable=protected-access
+                identity = sa.inspect(variables.process).identity
+                if identity is not None:
+                    changes[identity[0]] = variables.changes()
+                    written.append(variables)
+        if changes:
+            cls.save(session.connection(), changes)
+            for variables in written:
+                variables.flushed()
+
+    @classmethod
+    def _after_end(cls, session: sa.orm.Session, *args):
+        for variables in session.info.pop(TRACKED_KEY, {}).values():
+            variables.expire()
+
+    @classmethod
+    def get_process_table_name(cls) -> str:
+        """Returns name of Process table defined in cls.__process_table_name__
+
+        It's used to create foreign key of variables to processes.
+        """
+        try:
+            return cls.__process_table_name__
+        except AttributeError as err:
+            raise AttributeError(
+                f"Attribute __process_table_name__ for '{cls.__name__}' is not defined"
+            ) from err
+
+    def __repr__(self):
+        return f"<Variable '{self.name}' of process #{self.process_id}>"
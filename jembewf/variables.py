@@ -0,0 +1,180 @@
+from typing import TYPE_CHECKING, Any, Dict, Iterator, MutableMapping, Optional
+from dataclasses import dataclass
+from sqlalchemy.orm import object_session
+from sqlalchemy.orm.attributes import flag_dirty
+import sqlalchemy as sa
+from .helpers import get_jembewf
+
+if TYPE_CHECKING:
+    import jembewf
+
+__all__ = ("FlowVariable", "ProcessVariables")
+
+# session.info key of process variables loaded or changed in the transaction
+TRACKED_KEY = "jembewf_variables"
+
+# marks variable known to not exist (deleted or not found in database)
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class FlowVariable:
+    """Typed process variable declared with Flow.variable"""
+
+    name: str
+    # values must be instances of the type, None to accept any value
+    type: Optional[type] = None
+    # returned when process doesn't have the variable
+    default: Any = None
+    # create index used by find_processes to find processes by the variable
+    index: bool = False
+
+    def check(self, value: Any) -> Any:
+        """Returns value when it is of the declared type
+
+        None is accepted for every type and int is converted to float.
+
+        Raises:
+            ValueError: When value is not of the declared type
+        """
+        if self.type is None or value is None or isinstance(value, self.type):
+            return value
+        if self.type is float and isinstance(value, int) and not isinstance(value, bool):
+            return float(value)
+        raise ValueError(
+            f"Variable '{self.name}' must be {self.type.__name__}, "
+            f"not {type(value).__name__}."
+        )
+
+
+class ProcessVariables(MutableMapping[str, Any]):
+    """Variables of the process, returned by ProcessMixin.vars
+
+    Without variable_model variables are kept in process.variables json column.
+    With JembeWF(variable_model=...) every variable is a row of the variable
+    table: variables are loaded one by one when they are read (or all at once
+    when iterated) and only assigned or deleted variables are written when
+    session is flushed.
+
+    Values of declared variables (Flow.variable) are checked against
+    their type and missing ones return declared default.
+    Changes inside of the mutable values are not tracked, assign changed
+    value back to save it.
+    """
+
+    def __init__(self, process: "jembewf.ProcessMixin"):
+        self.process = process
+        # values read from database or assigned, _MISSING for absent variables
+        self._values: Dict[str, Any] = {}
+        # all variables are loaded
+        self._loaded = False
+        # names of assigned and deleted variables waiting for flush
+        self._changed: Dict[str, None] = {}
+
+    def __getitem__(self, name: str) -> Any:
+        model = get_jembewf().variable_model
+        if model is None:
+            variables = self.process.variables or {}
+            value = variables.get(name, _MISSING)
+        else:
+            if name not in self._values and not self._is_new():
+                self._track()
+                if not self._loaded:
+                    self._values[name] = model.load(self.process.id, [name]).get(
+                        name, _MISSING
+                    )
+            value = self._values.get(name, _MISSING)
+        if value is not _MISSING:
+            return value
+        declared = self.process.flow.variables.get(name)
+        if declared is not None:
+            return declared.default
+        raise KeyError(name)
+
+    def __setitem__(self, name: str, value: Any):
+        declared = self.process.flow.variables.get(name)
+        if declared is not None:
+            value = declared.check(value)
+        if get_jembewf().variable_model is None:
+            if self.process.variables is None:
+                self.process.variables = {}
+            self.process.variables[name] = value
+            return
+        self._values[name] = value
+        self._changed[name] = None
+        self._track(changed=True)
+
+    def __delitem__(self, name: str):
+        if get_jembewf().variable_model is None:
+            del self.process.variables[name]
+            return
+        if name not in self:
+            raise KeyError(name)
+        self._values[name] = _MISSING
+        self._changed[name] = None
+        self._track(changed=True)
+
+    def __contains__(self, name: object) -> bool:
+        if get_jembewf().variable_model is None:
+            return name in (self.process.variables or {})
+        try:
+            self[name]  # pylint: disable=pointless-statement
+        except KeyError:
+            return False
+        return self._values.get(name, _MISSING) is not _MISSING
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._load())
+
+    def __len__(self) -> int:
+        return len(self._load())
+
+    def __repr__(self):
+        return f"<ProcessVariables of process #{self.process.id}: {self._load()!r}>"
+
+    def changes(self) -> Dict[str, Any]:
+        """Returns assigned variables waiting for flush, _MISSING for deleted"""
+        return {name: self._values[name] for name in self._changed}
+
+    def flushed(self):
+        """Forgets written changes, called after changes are flushed"""
+        self._changed.clear()
+
+    def expire(self):
+        """Forgets loaded values, called after commit and rollback"""
+        self._values.clear()
+        self._changed.clear()
+        self._loaded = False
+
+    def _load(self) -> Dict[str, Any]:
+        """Loads all variables of the process"""
+        model = get_jembewf().variable_model
+        if model is None:
+            return dict(self.process.variables or {})
+        if not self._loaded:
+            if not self._is_new():
+                self._track()
+                loaded = model.load(self.process.id)
+                loaded.update(self._values)
+                self._values = loaded
+            self._loaded = True
+        return {
+            name: value for name, value in self._values.items() if value is not _MISSING
+        }
+
+    def _is_new(self) -> bool:
+        """True when process is not inserted, so it has no variables in database"""
+        return sa.inspect(self.process).key is None
+
+    def _track(self, changed: bool = False):
+        """Registers variables in session to be written and expired with it"""
+        session = object_session(self.process) or get_jembewf().db.session()
+        session.info.setdefault(TRACKED_KEY, {})[id(self)] = self
+        if changed and sa.inspect(self.process).persistent:
+            # flushes process even when none of its columns changed
+            flag_dirty(self.process)
+
+
+def is_missing(value: Any) -> bool:
+    """True when value marks deleted variable"""
+    return value is _MISSING
@@ -28,6 +28,15 @@ pytest_plugins = ["pytest-flask-sqlalchemy"]
 @pytest.fixture
 def database(request):
     """Create a Postgres database for the tests, and drop it when the tests are done"""
+    url = sa.engine.url.make_url(DB_CONN)
+    if url.get_backend_name() != "postgresql":
+        # other databases (e.g. sqlite:////tmp/jembewf_test.db) are used as they are
+        yield
+        if url.get_backend_name() == "sqlite" and url.database:
+            if os.path.exists(url.database):
+                os.remove(url.database)
+        return
+
     pg_host = DB_OPTS.get("host")
     pg_port = DB_OPTS.get("port")
     pg_user = DB_OPTS.get("username")
@@ -0,0 +1,23 @@
+"""Flows registered with JembeWF.add_lazy in test_definitions"""
+from jembewf import Flow, State, StateCallback, Transition
+
+
+class ArriveCallback(StateCallback):
+    """Record arrival to the state"""
+
+    arrived = []
+
+    def callback(self):
+        self.arrived.append(self.state.name)
+
+
+flow1 = (
+    Flow("flow1")
+    .add(State("a", ArriveCallback).add(Transition("b")).auto(), State("b"))
+    .start_with("a")
+)
+
+
+def make_flow2():
+    """Returns flow2"""
+    return Flow("flow2").add(State("a")).start_with("a")
@@ -0,0 +1,19 @@
+import pytest
+from jembewf.bench import FLOWS, run
+
+
+@pytest.mark.parametrize("many", [False, True])
+@pytest.mark.parametrize("flow_name", list(FLOWS))
+def test_bench_run(flow_name, many):
+    """Test benchmark harness drives all processes until they end"""
+    steps_per_process = {"linear": 3, "fan_out": 4, "diamond": 5, "auto_chain": 3}
+    result = run(flow_name, "sqlite://", processes=5, size=3, many=many)
+    assert result.database == "sqlite"
+    assert result.steps == 5 * steps_per_process[flow_name]
+    assert result.statements > 0
+    assert result.sql_per_step > 0
+    assert result.steps_per_second > 0
+    assert result.start_latencies
+    assert "steps/s" in str(result)
+    assert result.as_dict()["steps"] == result.steps
+    assert result.peak_memory > 0
@@ -58,3 +58,57 @@ def test_set_process_model_attributes(app, app_ctx, _db):
         assert my_data.id is not None
         assert process.my_data_id == my_data.id
         assert process.variables == {"other_data": "other"}
+
+
+def test_model_indexes(app, app_ctx, _db):
+    """Test indexes declared by mixins, opting out and creating missing indexes"""
+    jwf = JembeWF()
+
+    class Process(jembewf.ProcessMixin, _db.Model):
+        """Process"""
+
+    class Step(jembewf.StepMixin, _db.Model):
+        """Step"""
+
+        __create_indexes__ = False
+
+    assert {index.name for index in Process.__table__.indexes} == {
+        "ix_jwf_processes_flow_name_is_running"
+    }
+    assert not Step.__table__.indexes
+
+    with app_ctx:
+        _db.create_all()
+
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        assert jwf.create_indexes() == []
+        next(iter(Process.__table__.indexes)).drop(_db.engine)
+        assert jwf.create_indexes() == ["ix_jwf_processes_flow_name_is_running"]
+
+
+def test_flow_graph():
+    """Test compiled flow graph and transition lookup by name"""
+    to_end = Transition("end")
+    flow = (
+        Flow("flow")
+        .add(
+            State("start").add(Transition("middle"), to_end),
+            State("middle").add(Transition("end")).auto(),
+            State("end"),
+        )
+        .start_with("start")
+    )
+
+    graph = flow.graph
+    assert graph.state_names == ("start", "middle", "end")
+    assert graph.state_ids["end"] == 2
+    assert graph.in_degree == (0, 1, 2)
+    assert graph.transitions[to_end.name] is to_end
+
+    start = flow.states["start"]
+    assert start.get_transition(to_end.name) is to_end
+    assert start.has_transition(to_end.name)
+    assert start.owns(to_end)
+    assert not flow.states["middle"].owns(to_end)
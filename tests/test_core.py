@@ -1,3 +1,14 @@
+import asyncio
+import gzip
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.ext.compiler import compiles
 from jembewf import (
     JembeWF,
     Flow,
@@ -6,6 +17,15 @@ from jembewf import (
     StateCallback,
     Transition,
     TransitionCallback,
+    AsyncStateCallback,
+    AsyncTransitionCallback,
+    Runner,
+    Scheduler,
+    SubscriptionMixin,
+    VariableMixin,
+    InProcessNotifier,
+    Instrumentation,
+    PostgresNotifier,
     get_jembewf,
 )
 import jembewf
@@ -187,3 +207,1327 @@ def test_demo_flow_definition(app, _db, process_step):
 
     with app.test_request_context():
         assert jwf == get_jembewf()
+
+
+def test_start_many(app, app_ctx, _db, process_step):
+    """Test starting many processes in batches with callbacks and auto states"""
+    Process, Step = process_step
+    jwf = JembeWF()
+    arrived = []
+
+    class ArriveCallback(StateCallback):
+        """Record arrival to the state"""
+
+        def callback(self):
+            arrived.append((self.process.variables["number"], self.state.name))
+
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("state1", ArriveCallback).add(Transition("state2")).auto(),
+            State("state2", ArriveCallback).add(Transition("state3")),
+            State("state3", ArriveCallback),
+        )
+        .start_with("state1")
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        processes = jwf.start_many(
+            "flow1", ({"number": i} for i in range(5)), batch_size=2
+        )
+        jwf.db.session.commit()
+
+        assert [p.variables["number"] for p in processes] == [0, 1, 2, 3, 4]
+        assert all(p.id is not None and p.is_running for p in processes)
+        assert [state_name for _, state_name in arrived] == ["state1", "state2"] * 5
+        for process in processes:
+            assert [s.state_name for s in process.current_steps()] == ["state2"]
+
+        for process in processes:
+            process.proceed()
+        assert all(p.is_running is False for p in processes)
+
+
+def test_start_many_can_start(app, app_ctx, _db, process_step):
+    """Test can_start is checked once on every inserted process, batch by batch"""
+    Process, Step = process_step
+    jwf = JembeWF()
+    checked = []
+    started = []
+
+    class Flow1Callback(FlowCallback):
+        """Allows only processes with number lower than 3"""
+
+        def can_start(self):
+            checked.append(self.process)
+            return self.process.variables["number"] < 3
+
+        def callback(self):
+            started.append(self.process)
+
+    jwf.add(Flow("flow1", Flow1Callback).add(State("state1")).start_with("state1"))
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        processes = jwf.start_many(
+            "flow1", ({"number": i} for i in range(3)), batch_size=2
+        )
+        assert checked == processes
+        assert started == processes
+
+        checked.clear()
+        with pytest.raises(jembewf.CantStartProcess):
+            jwf.start_many("flow1", ({"number": i} for i in range(5)), batch_size=2)
+        assert [p.variables["number"] for p in checked] == [0, 1, 2, 3]
+        jwf.db.session.commit()
+        assert sorted(
+            p.variables["number"] for p in jwf.db.session.scalars(sa.select(Process))
+        ) == [0, 0, 1, 1, 2]
+
+
+def test_runner(app, app_ctx, _db, process_step):
+    """Test proceeding processes with Runner in batches"""
+    Process, Step = process_step
+    jwf = JembeWF()
+
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("state1").add(Transition("state2")),
+            State("state2").add(Transition("state3")),
+            State("state3"),
+        )
+        .start_with("state1")
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        processes = jwf.start_many("flow1", ({} for _ in range(5)))
+        jwf.db.session.commit()
+
+        runner = Runner(batch_size=2)
+        assert runner.run_once() == 5
+        assert runner.stats.batches == 4
+        assert runner.stats.claimed_steps == 5
+        assert all(p.is_running for p in processes)
+
+        runner.run(max_passes=1)
+        assert runner.stats.proceeded_steps == 10
+        assert all(p.is_running is False for p in processes)
+        assert runner.run_once() == 0
+
+    result = app.test_cli_runner().invoke(args=["jembewf", "run", "--once"])
+    assert result.exit_code == 0
+    assert "proceeded=0" in result.output
+
+
+def test_update_is_running_concurrently(app, app_ctx, _db, process_step):
+    """Test ending process whose last steps end in concurrent transactions"""
+    Process, Step = process_step
+    if _db.engine.dialect.name != "postgresql":
+        pytest.skip("requires row locks of PostgreSQL")
+    jwf = JembeWF()
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("a").add(Transition("c")),
+            State("b").add(Transition("c")),
+            State("c"),
+        )
+        .start_with("a", "b")
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        process = jwf.start("flow1")
+        jwf.db.session.commit()
+        process_id = process.id
+
+    ended = threading.Event()
+    updating = threading.Event()
+
+    def end_b():
+        with app.app_context():
+            (step,) = Step.query.filter_by(process_id=process_id, state_name="b")
+            step._end()  # pylint: disable=protected-access
+            jwf.db.session.flush()
+            ended.set()
+            updating.wait()
+            # waits for the lock of the other transaction and sees its ended step
+            assert Process.update_is_running([process_id]) == [process_id]
+            jwf.db.session.commit()
+
+    thread = threading.Thread(target=end_b)
+    with app.app_context():
+        (step,) = Step.query.filter_by(process_id=process_id, state_name="a")
+        step._end()  # pylint: disable=protected-access
+        jwf.db.session.flush()
+        thread.start()
+        ended.wait()
+        # step of the other transaction is not commited yet
+        assert Process.update_is_running([process_id]) == []
+        updating.set()
+        time.sleep(0.2)
+        jwf.db.session.commit()
+    thread.join()
+
+    with app_ctx:
+        jwf.db.session.refresh(process)
+        assert process.is_running is False
+
+
+def test_proceed_many(app, app_ctx, _db, process_step):
+    """Test proceeding many processes with batched steps and process updates"""
+    Process, Step = process_step
+    jwf = JembeWF()
+
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("state1").add(Transition("state2")),
+            State("state2").add(Transition("state3")).auto(),
+            State("state3"),
+        )
+        .start_with("state1"),
+        Flow("flow2")
+        .add(
+            State("state1").add(Transition("state2")),
+            State("state2").add(Transition("state3")),
+            State("state3"),
+        )
+        .start_with("state1"),
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        processes1 = jwf.start_many("flow1", ({} for _ in range(3)))
+        processes2 = jwf.start_many("flow2", ({} for _ in range(2)))
+        jwf.db.session.commit()
+
+        assert jwf.proceed_many([p.id for p in processes1 + processes2]) == {
+            p.id for p in processes1 + processes2
+        }
+        jwf.db.session.commit()
+        for process in processes1:
+            assert process.is_running is False
+            assert process.ended_at is not None
+            assert [s.state_name for s in process.steps] == [
+                "state1",
+                "state2",
+                "state3",
+            ]
+            assert process.steps[2].prev_step == process.steps[1]
+        assert all(p.is_running for p in processes2)
+
+        assert jwf.proceed_many(Process.query.filter_by(flow_name="flow2")) == {
+            p.id for p in processes2
+        }
+        assert all(p.is_running is False for p in processes2)
+        assert jwf.proceed_many(sa.select(Process.id)) == set()
+
+
+def test_can_proceed_batch(app, app_ctx, _db, process_step):
+    """Test evaluating transition of many steps with can_proceed_batch"""
+    Process, Step = process_step
+    jwf = JembeWF()
+    batches = []
+
+    class AmountCallback(TransitionCallback):
+        """Proceed only processes with amount greater than 10"""
+
+        @classmethod
+        def can_proceed_batch(cls, transition, steps):
+            batches.append(len(steps))
+            return [s.process.variables["amount"] > 10 for s in steps]
+
+        def can_proceed(self):
+            raise Exception("can_proceed should not be called")
+
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("state1").add(
+                Transition("state2", AmountCallback), Transition("state3")
+            ),
+            State("state2"),
+            State("state3"),
+        )
+        .start_with("state1")
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        processes = jwf.start_many("flow1", ({"amount": a} for a in (5, 20, 30)))
+        jwf.db.session.commit()
+        jwf.proceed_many([p.id for p in processes])
+
+        assert batches == [3]
+        assert [sorted(s.state_name for s in p.last_steps()) for p in processes] == [
+            ["state3"],
+            ["state2", "state3"],
+            ["state2", "state3"],
+        ]
+
+
+def test_aproceed(app, app_ctx, _db, process_step):
+    """Test awaiting async callbacks of fanned out transitions concurrently"""
+    Process, Step = process_step
+    jwf = JembeWF()
+    arrived = []
+
+    class SlowStateCallback(AsyncStateCallback):
+        """Wait on slow service before arriving to the state"""
+
+        async def callback(self):
+            await asyncio.sleep(0.2)
+            arrived.append(self.state.name)
+
+    class SlowTransitionCallback(AsyncTransitionCallback):
+        """Wait on slow service before proceeding"""
+
+        async def can_proceed(self):
+            await asyncio.sleep(0.2)
+            return self.to_state.name != "state4"
+
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("state1").add(
+                Transition("state2", SlowTransitionCallback),
+                Transition("state3", SlowTransitionCallback),
+                Transition("state4", SlowTransitionCallback),
+            ),
+            State("state2", SlowStateCallback).add(Transition("end")).auto(),
+            State("state3", SlowStateCallback).add(Transition("end")).auto(),
+            State("state4", SlowStateCallback),
+            State("end", SlowStateCallback),
+        )
+        .start_with("state1")
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        process = jwf.start("flow1")
+        with pytest.raises(Exception):
+            process.proceed()
+
+        start = time.perf_counter()
+        assert asyncio.run(process.aproceed()) is True
+        # can_proceed, state callbacks and auto steps of both branches
+        assert time.perf_counter() - start < 1.0
+        assert sorted(arrived) == ["end", "end", "state2", "state3"]
+        assert [s.state_name for s in process.steps[:3]] == [
+            "state1",
+            "state2",
+            "state3",
+        ]
+        assert process.is_running is False
+
+
+def test_join(app, app_ctx, _db, process_step):
+    """Test join state waiting for all transitions leading to it"""
+    Process, Step = process_step
+    jwf = JembeWF()
+    arrived = []
+
+    class ArriveCallback(StateCallback):
+        """Record arrival to the state"""
+
+        def callback(self):
+            arrived.append((self.process.id, self.state.name))
+
+    transited = []
+
+    class JoinTransitionCallback(TransitionCallback):
+        """Record transition to the join step"""
+
+        def callback(self, to_step):
+            transited.append((self.from_step.state_name, to_step, to_step.is_active))
+
+    with pytest.raises(ValueError):
+        State("join", join="any")
+
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("start").add(Transition("a"), Transition("b")).auto(),
+            State("a").add(Transition("join", JoinTransitionCallback)),
+            State("b").add(Transition("join", JoinTransitionCallback)),
+            State("join", ArriveCallback, join="all").add(Transition("end")),
+            State("end"),
+        )
+        .start_with("start"),
+        Flow("flow2")
+        .add(
+            State("start").add(Transition("a"), Transition("b")),
+            State("a").add(Transition("join")).auto(),
+            State("b").add(Transition("join")).auto(),
+            State("join", ArriveCallback, join="all"),
+        )
+        .start_with("start"),
+        Flow("flow3")
+        .add(
+            State("a").add(Transition("join"), Transition("a")),
+            State("b").add(Transition("join")),
+            State("join", ArriveCallback, join="all"),
+        )
+        .start_with("a", "b"),
+    )
+    jwf.init_app(app, _db, Process, Step)
+    assert jwf.flows["flow1"].states["join"].join_count == 2
+
+    with app_ctx:
+        process = jwf.start("flow1")
+        jwf.db.session.commit()
+        step_a, step_b = process.current_steps()
+        assert step_a.proceed() is True
+        jwf.db.session.commit()
+        assert arrived == []
+        assert process.is_running is True
+        assert sorted(s.state_name for s in process.current_steps()) == ["b"]
+        # transition callback of waiting branch gets the inactive join step
+        ((from_state, waiting_step, is_active),) = transited
+        assert from_state == "a" and is_active is False
+
+        assert step_b.proceed() is True
+        jwf.db.session.commit()
+        assert arrived == [(process.id, "join")]
+        (join_step,) = process.current_steps()
+        assert join_step.state_name == "join"
+        assert join_step.join_arrivals == 2
+        assert transited[1] == ("b", join_step, True)
+        assert waiting_step is join_step
+        assert Step.query.filter_by(process_id=process.id, state_name="join").count() == 1
+        assert join_step.proceed() is True
+        assert process.is_running is False
+
+        arrived.clear()
+        processes = jwf.start_many("flow2", ({} for _ in range(3)))
+        jwf.db.session.commit()
+        jwf.proceed_many([p.id for p in processes])
+        jwf.db.session.commit()
+        assert sorted(arrived) == sorted((p.id, "join") for p in processes)
+        assert all(p.is_running is False for p in processes)
+
+        arrived.clear()
+        process = jwf.start("flow2")
+        jwf.db.session.commit()
+        assert asyncio.run(process.aproceed()) is True
+        jwf.db.session.commit()
+        assert arrived == [(process.id, "join")]
+        assert process.is_running is False
+
+        # branch that loops back arrives to the join again, join still waits
+        # for the other branch
+        arrived.clear()
+        process = jwf.start("flow3")
+        jwf.db.session.commit()
+        step_a, step_b = process.current_steps()
+        assert step_a.proceed() is True
+        (step_a,) = [s for s in process.current_steps() if s.state_name == "a"]
+        assert step_a.proceed() is True
+        jwf.db.session.commit()
+        assert arrived == []
+        (join_step,) = Step.query.filter_by(process_id=process.id, state_name="join")
+        assert join_step.join_transitions == [
+            jwf.flows["flow3"].states["a"].transitions[0].name
+        ]
+        assert step_b.proceed() is True
+        jwf.db.session.commit()
+        assert arrived == [(process.id, "join")]
+        assert join_step.join_arrivals == 2
+
+
+def test_executor(app, app_ctx, _db, process_step):
+    """Test checking guards of fanned-out transitions in executor"""
+    Process, Step = process_step
+    threads = set()
+
+    def is_even(number):
+        threads.add(threading.current_thread().name)
+        return number % 2 == 0
+
+    class EvenCallback(TransitionCallback):
+        """Proceed to states with even number"""
+
+        def can_proceed_task(self):
+            return is_even, (int(self.to_state.name[5:]),)
+
+    executor = ThreadPoolExecutor(2, thread_name_prefix="guard")
+    jwf = JembeWF(executor=executor)
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("state0").add(
+                *(Transition(f"state{i}", EvenCallback) for i in range(1, 5)),
+                Transition("state5"),
+            ),
+            *(State(f"state{i}") for i in range(1, 6)),
+        )
+        .start_with("state0")
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        process = jwf.start("flow1")
+        assert process.proceed() is True
+        assert [s.state_name for s in process.steps[1:]] == [
+            "state2",
+            "state4",
+            "state5",
+        ]
+        assert threads and all(t.startswith("guard") for t in threads)
+    executor.shutdown()
+
+
+def test_timed_transitions(app, app_ctx, _db, process_step):
+    """Test proceeding timed transitions with Scheduler"""
+    Process, Step = process_step
+    jwf = JembeWF()
+
+    def deadline(step):
+        return datetime.fromisoformat(step.process.variables["deadline"])
+
+    refused = []
+
+    class RefuseOnceCallback(TransitionCallback):
+        """Refuse to proceed the first time"""
+
+        def can_proceed(self):
+            if not refused:
+                refused.append(self.from_step.id)
+                return False
+            return True
+
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("waiting").add(Transition("escalated", at=deadline)),
+            State("escalated").add(Transition("closed", after=timedelta(days=3))),
+            State("closed"),
+        )
+        .start_with("waiting"),
+        Flow("flow2")
+        .add(
+            State("waiting").add(Transition("closed", RefuseOnceCallback, at=deadline)),
+            State("closed"),
+        )
+        .start_with("waiting"),
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        past = datetime.utcnow() - timedelta(hours=1)
+        future = datetime.utcnow() + timedelta(hours=1)
+        process1 = jwf.start("flow1", deadline=past.isoformat())
+        process2 = jwf.start("flow1", deadline=future.isoformat())
+        jwf.db.session.commit()
+
+        assert process1.current_steps()[0].due_at == past
+        can_proceed = process2.current_steps()[0].proceed()
+        assert not can_proceed and "due at" in can_proceed.reason
+
+        scheduler = Scheduler()
+        assert scheduler.run_due() == 1
+        assert scheduler.run_due() == 0
+        step = process1.current_steps()[0]
+        assert step.state_name == "escalated"
+        assert step.due_at == step.started_at + timedelta(days=3)
+        assert process2.current_steps()[0].state_name == "waiting"
+        assert scheduler.next_due_at() == future
+
+        # due transition refused by guard is retried after retry_delay
+        process3 = jwf.start("flow2", deadline=datetime.utcnow().isoformat())
+        jwf.db.session.commit()
+        now = datetime.utcnow()
+        assert scheduler.run_due(now) == 0
+        step = process3.current_steps()[0]
+        assert refused == [step.id]
+        assert step.due_at == now + timedelta(seconds=scheduler.retry_delay)
+        assert scheduler.run_due(now + timedelta(seconds=30)) == 0
+        assert scheduler.run_due(step.due_at) == 1
+        assert process3.is_running is False
+
+    result = app.test_cli_runner().invoke(args=["jembewf", "schedule", "--once"])
+    assert result.exit_code == 0
+
+
+def test_signal(app, app_ctx, _db, process_step):
+    """Test proceeding only steps waiting on signaled event"""
+    Process, Step = process_step
+    paid = []
+
+    class Subscription(SubscriptionMixin, _db.Model):
+        """Subscription"""
+
+    class PaidCallback(TransitionCallback):
+        """Record amount of paid invoice"""
+
+        def callback(self, to_step):
+            paid.append((self.process.variables["invoice"], self.params["amount"]))
+
+    def flow():
+        return (
+            Flow("flow1")
+            .add(
+                State("waiting").add(
+                    Transition(
+                        "paid",
+                        PaidCallback,
+                        on="invoice.paid",
+                        key=lambda step: step.process.variables["invoice"],
+                    ),
+                    Transition("cancelled", on="invoice.cancelled"),
+                ),
+                State("paid"),
+                State("cancelled"),
+            )
+            .start_with("waiting")
+        )
+
+    with pytest.raises(Exception):
+        JembeWF().add(flow()).init_app(app, _db, Process, Step)
+
+    jwf = JembeWF(subscription_model=Subscription)
+    jwf.add(
+        flow(),
+        Flow("flow2")
+        .add(
+            State("waiting")
+            .add(Transition("cancelled", on="invoice.cancelled"), Transition("paid"))
+            .auto(),
+            State("paid"),
+            State("cancelled"),
+        )
+        .start_with("waiting"),
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        _db.create_all()
+        process1 = jwf.start("flow1", invoice=1)
+        process2 = jwf.start("flow1", invoice=2)
+        jwf.db.session.commit()
+        assert Subscription.query.count() == 4
+
+        assert not process1.proceed()
+        assert jwf.signal("invoice.paid", key=1, amount=10) == {process1.id}
+        assert paid == [(1, 10)]
+        assert [s.state_name for s in process1.last_steps()] == ["paid"]
+        assert process1.is_running is False
+        assert Subscription.query.count() == 2
+
+        assert jwf.signal("invoice.paid", key=1, amount=10) == set()
+        assert jwf.signal("invoice.cancelled") == {process2.id}
+        assert [s.state_name for s in process2.last_steps()] == ["cancelled"]
+        assert Subscription.query.count() == 0
+
+        # step proceeded before it was flushed leaves no subscriptions
+        process3 = jwf.start("flow2")
+        jwf.db.session.commit()
+        assert process3.is_running is False
+        assert Subscription.query.count() == 0
+
+
+@pytest.mark.parametrize("notifier_class", [InProcessNotifier, PostgresNotifier])
+def test_notifier(app, app_ctx, _db, process_step, notifier_class):
+    """Test notifying listeners about commited steps and ended processes"""
+    Process, Step = process_step
+    if notifier_class is PostgresNotifier and _db.engine.dialect.name != "postgresql":
+        pytest.skip("requires LISTEN/NOTIFY of PostgreSQL")
+    notifier = notifier_class()
+    jwf = JembeWF(notifier=notifier)
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("state1").add(Transition("state2")),
+            State("state2").add(Transition("state3")).auto(),
+            State("state3"),
+        )
+        .start_with("state1")
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx, notifier.listener() as listener:
+        process = jwf.start("flow1")
+        jwf.db.session.flush()
+        assert listener.wait(0.1) == []
+        jwf.db.session.commit()
+        assert listener.wait(1) == [
+            {
+                "type": "step",
+                "id": process.steps[0].id,
+                "process_id": process.id,
+                "flow": "flow1",
+                "state": "state1",
+            }
+        ]
+
+        process.proceed()
+        jwf.db.session.commit()
+        assert listener.wait(1) == [{"type": "process_ended", "id": process.id}]
+
+        jwf.start("flow1")
+        jwf.db.session.flush()
+        jwf.db.session.rollback()
+        assert listener.wait(0.1) == []
+
+
+def test_instrumentation(app, app_ctx, _db, process_step):
+    """Test spans around create, proceed, can_proceed and callbacks"""
+    Process, Step = process_step
+
+    class Guard(TransitionCallback):
+        def can_proceed(self):
+            return True
+
+    class Arrived(StateCallback):
+        def callback(self):
+            pass
+
+    spans = []
+    jwf = JembeWF(instrumentation=Instrumentation(spans.append))
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("state1").add(Transition("state2", Guard)),
+            State("state2", Arrived),
+        )
+        .start_with("state1")
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        process = jwf.start("flow1")
+        jwf.db.session.commit()
+        assert [span.name for span in spans] == [
+            "callback",
+            "callback",
+            "callback",
+            "step.create",
+            "process.create",
+        ]
+        assert spans[-1].attributes == {"flow": "flow1"}
+        assert spans[-1].duration >= spans[-2].duration > 0
+        assert spans[-2].parent is spans[-1]
+        assert spans[-1].parent is None
+
+        spans.clear()
+        assert process.steps[0].can_proceed()
+        assert [(span.name, span.attributes.get("method")) for span in spans] == [
+            ("callback", "can_proceed"),
+            ("step.can_proceed", None),
+        ]
+        assert spans[0].attributes["callback"] == "Guard"
+
+        spans.clear()
+        jwf.db.session.expire_all()
+        assert process.proceed()
+        by_name = {}
+        for span in spans:
+            by_name.setdefault(span.name, []).append(span)
+        assert by_name["process.proceed"][0].attributes == {
+            "flow": "flow1",
+            "process_id": process.id,
+        }
+        assert [
+            span.attributes["callback"]
+            for span in by_name["callback"]
+            if span.attributes["method"] == "callback"
+        ] == ["Guard", "Arrived"]
+        step_proceed = by_name["step.proceed"][0]
+        assert step_proceed.attributes["state"] == "state1"
+        assert step_proceed.parent is by_name["process.proceed"][0]
+        assert not process.is_running
+        # active steps are loaded by process.proceed, step2 is inserted and step1
+        # updated by the flush before check_is_running query in step.proceed
+        assert by_name["process.proceed"][0].statements == 4
+        assert (step_proceed.statements, step_proceed.rows) == (3, 2)
+
+        # process is updated when session is flushed on commit
+        with jwf.span("commit") as span:
+            jwf.db.session.commit()
+        assert (span.statements, span.rows) == (1, 1)
+
+        process = jwf.start("flow1")
+        jwf.db.session.commit()
+        spans.clear()
+        assert asyncio.run(process.aproceed()) is True
+        assert spans[-1].name == "process.proceed"
+        assert spans[-1].attributes == {
+            "flow": "flow1",
+            "process_id": process.id,
+            "count": 1,
+        }
+
+
+def test_metrics(app, app_ctx, _db, process_step):
+    """Test metrics maintained incrementally and exposed on Flask endpoint"""
+    Process, Step = process_step
+    metrics = jembewf.Metrics()
+    jwf = JembeWF(metrics=metrics)
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("state1").add(Transition("state2")),
+            State("state2").add(Transition("state3")).auto(),
+            State("state3"),
+        )
+        .start_with("state1")
+    )
+    jwf.init_app(app, _db, Process, Step)
+    client = app.test_client()
+
+    with app_ctx:
+        processes = [jwf.start("flow1") for _ in range(3)]
+        jwf.db.session.commit()
+
+        body = client.get("/metrics").get_data(as_text=True)
+        assert 'jembewf_running_processes{flow="flow1"} 3\n' in body
+        assert 'jembewf_active_steps{flow="flow1",state="state1"} 3\n' in body
+        assert 'jembewf_processes_started_total{flow="flow1"} 3\n' in body
+
+        processes[0].proceed()
+        jwf.db.session.commit()
+        jwf.start("flow1")
+        jwf.db.session.rollback()
+
+        statements = []
+
+        def count_statement(*_):
+            statements.append(1)
+
+        sa.event.listen(jwf.db.engine, "before_cursor_execute", count_statement)
+        body = client.get("/metrics").get_data(as_text=True)
+        sa.event.remove(jwf.db.engine, "before_cursor_execute", count_statement)
+        assert statements == []
+
+        assert 'jembewf_running_processes{flow="flow1"} 2\n' in body
+        assert 'jembewf_active_steps{flow="flow1",state="state1"} 2\n' in body
+        assert 'jembewf_active_steps{flow="flow1",state="state2"} 0\n' in body
+        assert 'jembewf_processes_ended_total{flow="flow1"} 1\n' in body
+        assert 'jembewf_steps_started_total{flow="flow1",state="state3"} 1\n' in body
+        assert (
+            'jembewf_state_duration_seconds_bucket{flow="flow1",state="state1",'
+            'le="+Inf"} 1\n'
+        ) in body
+        assert 'jembewf_state_duration_seconds_count{flow="flow1",state="state2"} 1' in body
+
+        # processes ended with proceed_many are counted too
+        jwf.proceed_many([process.id for process in processes[1:]])
+        jwf.db.session.commit()
+        body = metrics.render()
+        assert 'jembewf_running_processes{flow="flow1"} 0\n' in body
+        assert 'jembewf_processes_ended_total{flow="flow1"} 3\n' in body
+        assert 'jembewf_active_steps{flow="flow1",state="state1"} 0\n' in body
+
+
+def test_archive(app, app_ctx, _db, process_step, tmp_path):
+    """Test moving ended processes and their steps to archive tables and file"""
+    Process, Step = process_step
+    jwf = JembeWF()
+    jwf.add(
+        Flow("flow1")
+        .add(State("state1").add(Transition("state2")), State("state2"))
+        .start_with("state1")
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        processes = [jwf.start("flow1", number=i) for i in range(4)]
+        for process in processes[:3]:
+            process.proceed()
+        long_ago = datetime.utcnow() - timedelta(days=40)
+        processes[0].ended_at = long_ago
+        processes[1].ended_at = long_ago
+        jwf.db.session.commit()
+        process_ids = [process.id for process in processes]
+
+        archiver = jembewf.Archiver(older_than=timedelta(days=30), batch_size=1)
+        assert archiver.run() == 2
+        assert (archiver.archived_processes, archiver.archived_steps) == (2, 4)
+        jwf.db.session.expunge_all()
+        assert sorted(id for (id,) in jwf.db.session.query(Process.id)) == (
+            process_ids[2:]
+        )
+        process_archive, step_archive = archiver.get_archive_tables()
+        assert sorted(
+            jwf.db.session.scalars(sa.select(process_archive.c.id))
+        ) == process_ids[:2]
+        assert jwf.db.session.execute(
+            sa.select(sa.func.count()).select_from(step_archive)
+        ).scalar() == 4
+
+        path = str(tmp_path / "archive.jsonl.gz")
+        archiver = jembewf.Archiver(older_than=timedelta(0), path=path)
+
+        def failed_commit():
+            raise Exception("commit failed")
+
+        # batch whose commit failed is not written to archive
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setattr(jwf.db.session, "commit", failed_commit)
+            with pytest.raises(Exception):
+                archiver.run()
+        assert not os.path.exists(path) and not os.path.exists(archiver.pending_path)
+        jwf.db.session.expunge_all()
+        assert jwf.db.session.get(Process, process_ids[2]) is not None
+
+        # commited batch of other archiver is left alone while it holds its lock
+        stopped = jembewf.Archiver(older_than=timedelta(0), path=path)
+        stopped.archive(stopped.claim(datetime.utcnow()))
+        jwf.db.session.commit()
+        assert stopped.pending_path != archiver.pending_path
+        assert archiver.run() == 0
+        assert not os.path.exists(path) and os.path.exists(stopped.pending_path)
+        # and appended by the next run once that archiver is stopped
+        stopped._pending_file.close()  # pylint: disable=protected-access
+        assert archiver.run() == 0
+        assert not os.path.exists(stopped.pending_path)
+        with gzip.open(path, "rt") as archive_file:
+            records = [json.loads(line) for line in archive_file]
+        assert [record["process"]["id"] for record in records] == [process_ids[2]]
+        assert records[0]["process"]["variables"] == {"number": 2}
+        assert [step["state_name"] for step in records[0]["steps"]] == [
+            "state1",
+            "state2",
+        ]
+        # running process is never archived
+        assert [id for (id,) in jwf.db.session.query(Process.id)] == [process_ids[3]]
+
+
+def test_variables(app, app_ctx, _db, process_step):
+    """Test declared process variables saved one row per variable"""
+    Process, Step = process_step
+
+    class Variable(VariableMixin, _db.Model):
+        """Process variable"""
+
+    class CountCallback(StateCallback):
+        """Count arrivals to the state"""
+
+        def callback(self):
+            self.process.vars["counter"] += 1
+
+    def flow():
+        return (
+            Flow("flow1")
+            .variable("counter", int, default=0)
+            .variable("customer", str)
+            .add(
+                State("state1", CountCallback).add(Transition("state1")),
+            )
+            .start_with("state1")
+        )
+
+    with app_ctx:
+        # without variable model variables are kept in json column
+        jwf = JembeWF()
+        jwf.add(flow())
+        app.extensions.pop("jembewf", None)
+        jwf.init_app(app, _db, Process, Step)
+        process = jwf.start("flow1", customer="c1", note="x")
+        assert process.variables == {"customer": "c1", "note": "x", "counter": 1}
+        assert process.vars["counter"] == 1
+        with pytest.raises(ValueError):
+            jwf.start("flow1", customer=1)
+        jwf.db.session.rollback()
+
+        jwf = JembeWF(variable_model=Variable)
+        jwf.add(flow())
+        app.extensions.pop("jembewf")
+        jwf.init_app(app, _db, Process, Step)
+        _db.create_all()
+
+        process = jwf.start("flow1", customer="c1", note="x")
+        jwf.db.session.commit()
+        assert process.variables == {}
+        assert dict(process.vars) == {"customer": "c1", "note": "x", "counter": 1}
+
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement.split()[0:3])
+
+        engine = jwf.db.engine
+        sa.event.listen(engine, "after_cursor_execute", record)
+        process.proceed()
+        jwf.db.session.commit()
+        sa.event.remove(engine, "after_cursor_execute", record)
+        # only changed variable is written, process row is not updated
+        assert ["INSERT", "INTO", "jwf_process_variables"] in statements
+        assert not any(
+            statement[:2] == ["UPDATE", "jwf_processes"] for statement in statements
+        )
+        assert Variable.query.filter_by(process_id=process.id).count() == 3
+        assert process.vars["counter"] == 2
+        assert process.vars.get("missing") is None
+
+        del process.vars["note"]
+        process.vars["customer"] = None
+        with pytest.raises(ValueError):
+            process.vars["counter"] = "3"
+        jwf.db.session.commit()
+        process_id = process.id
+        jwf.db.session.expunge_all()
+        process = jwf.db.session.get(Process, process_id)
+        assert dict(process.vars) == {"customer": None, "counter": 2}
+
+        processes = jwf.start_many("flow1", ({"customer": f"c{i}"} for i in range(3)))
+        jwf.db.session.rollback()
+        processes = jwf.start_many("flow1", ({"customer": f"c{i}"} for i in range(3)))
+        jwf.db.session.commit()
+        assert [p.vars["customer"] for p in processes] == ["c0", "c1", "c2"]
+        assert [p.vars["counter"] for p in processes] == [1, 1, 1]
+
+
+class Explain(sa.sql.expression.Executable, sa.sql.expression.ClauseElement):
+    """EXPLAIN of the statement"""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain)
+def _compile_explain(element, compiler, **kw):
+    return "EXPLAIN " + compiler.process(element.statement, **kw)
+
+
+def test_find_processes(app, app_ctx, _db, process_step):
+    """Test finding processes by variables using declared variable indexes"""
+    Process, Step = process_step
+
+    class Variable(VariableMixin, _db.Model):
+        """Process variable"""
+
+    def flow(name, type_):
+        return (
+            Flow(name)
+            .variable("customer_id", type_, index=True)
+            .add(State("state1").add(Transition("state2")), State("state2"))
+            .start_with("state1")
+        )
+
+    with app_ctx:
+        _db.create_all()
+        for variable_model in (None, Variable):
+            jwf = JembeWF(variable_model=variable_model)
+            # flow2 stores values that can't be cast to int of flow1
+            jwf.add(flow("flow1", int), flow("flow2", str))
+            app.extensions.pop("jembewf", None)
+            jwf.init_app(app, _db, Process, Step)
+            assert jwf.create_indexes() == (
+                [
+                    "ix_jwf_processes_flow1_variables_customer_id",
+                    "ix_jwf_processes_flow2_variables_customer_id",
+                ]
+                if variable_model is None
+                else ["ix_jwf_process_variables_customer_id"]
+            )
+            other = jwf.start("flow2", customer_id="c-1")
+
+            processes = [
+                jwf.start("flow1", customer_id=i % 3, note=str(i)) for i in range(6)
+            ]
+            processes[0].proceed()
+            jwf.db.session.commit()
+
+            assert sorted(p.id for p in jwf.find_processes("flow1", customer_id=0)) == [
+                processes[0].id,
+                processes[3].id,
+            ]
+            assert jwf.find_processes("flow1", customer_id=0).filter_by(
+                is_running=True
+            ).all() == [processes[3]]
+            assert jwf.find_processes("flow1", customer_id=1, note="4").all() == [
+                processes[4]
+            ]
+            with pytest.raises(ValueError):
+                jwf.find_processes("flow1", customer_id="1")
+            assert jwf.find_processes("flow2", customer_id="c-1").all() == [other]
+
+            if jwf.db.engine.dialect.name == "postgresql":
+                jwf.db.session.execute(sa.text("SET LOCAL enable_seqscan = off"))
+                plan = "\n".join(
+                    jwf.db.session.execute(
+                        Explain(jwf.find_processes("flow1", customer_id=1).statement)
+                    ).scalars()
+                )
+                assert (
+                    "ix_jwf_processes_flow1_variables_customer_id"
+                    if variable_model is None
+                    else "ix_jwf_process_variables_customer_id"
+                ) in plan
+            jwf.db.session.rollback()
+            jwf.db.session.execute(sa.delete(Variable))
+            jwf.db.session.execute(sa.delete(Step))
+            jwf.db.session.execute(sa.delete(Process))
+            jwf.db.session.commit()
+
+
+def test_compact_steps(app, app_ctx, _db, process_step):
+    """Test collapsing old steps of looping process into summary steps"""
+    Process, Step = process_step
+    jwf = JembeWF()
+    jwf.add(
+        Flow("loop")
+        .add(
+            State("poll").add(Transition("wait")),
+            State("wait").add(Transition("poll")),
+        )
+        .start_with("poll")
+        .compact_steps(keep=2),
+        Flow("flow1")
+        .add(
+            State("poll").add(Transition("wait")),
+            State("wait").add(Transition("poll")),
+        )
+        .start_with("poll"),
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    def proceed(process, times):
+        for _ in range(times):
+            process.proceed()
+        jwf.db.session.commit()
+
+    def states(process):
+        return [
+            (step.state_name, step.compacted_steps, step.is_active)
+            for step in sorted(process.steps, key=lambda step: step.id)
+        ]
+
+    with app_ctx:
+        process = jwf.start("loop")
+        not_compacted = jwf.start("flow1")
+        short = jwf.start("loop")
+        proceed(process, 9)
+        proceed(not_compacted, 9)
+        proceed(short, 2)
+        started_at = process.steps[0].started_at
+
+        # poll: 1, 3, 5, 7, 9 wait: 2, 4, 6, 8 and active 10
+        assert jwf.compact_steps() == 3
+        assert states(process) == [
+            ("wait", 2, False),
+            ("poll", 3, False),
+            ("wait", None, False),
+            ("poll", None, False),
+            ("wait", None, False),
+            ("poll", None, False),
+            ("wait", None, True),
+        ]
+        assert len(not_compacted.steps) == 10
+        assert len(short.steps) == 3
+        summary = next(step for step in process.steps if step.compacted_steps == 3)
+        assert summary.started_at == started_at
+        assert summary.ended_at is not None
+
+        proceed(process, 4)
+        assert jwf.compact_steps() == 4
+        assert [(state, count) for state, count, _ in states(process)][:2] == [
+            ("wait", 4),
+            ("poll", 5),
+        ]
+        assert sum(step.compacted_steps or 1 for step in process.steps) == 14
+
+        # every prev_step points to existing step
+        step_ids = {step.id for step in process.steps}
+        assert all(
+            step.prev_step_id in step_ids
+            for step in process.steps
+            if step.prev_step_id is not None
+        )
+        assert process.proceed()
+
+        # prev_step pointing to deleted step is moved to summary step of its state
+        process = jwf.start("loop")
+        first = process.steps[0]
+        first.is_active = False
+        second = Step(process=process, state_name="poll", prev_step=first)
+        wait = Step(process=process, state_name="wait", prev_step=first)
+        third = Step(process=process, state_name="poll", prev_step=second)
+        for step in (second, wait, third):
+            step.is_active = False
+            step.variables = {}
+            jwf.db.session.add(step)
+        jwf.db.session.commit()
+        assert Step.compact([process.id], keep=1) == 1
+        jwf.db.session.commit()
+        assert (second.compacted_steps, second.prev_step_id) == (2, None)
+        assert (wait.prev_step_id, third.prev_step_id) == (second.id, second.id)
+
+
+def test_load_steps(app, app_ctx, _db, process_step):
+    """Test last_steps scoped to process and answering from loaded steps"""
+    Process, Step = process_step
+    jwf = JembeWF()
+
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("state1").add(Transition("state2")),
+            State("state2"),
+        )
+        .start_with("state1")
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        process1 = jwf.start("flow1")
+        process2 = jwf.start("flow1")
+        jwf.db.session.commit()
+        process1.proceed()
+        jwf.db.session.commit()
+
+        assert process1.steps_loaded is False
+        assert [s.state_name for s in process1.last_steps()] == ["state2"]
+        assert process2.last_steps() == []
+
+        steps = process2.load_steps()
+        assert process2.steps_loaded is True
+        assert [s.state_name for s in steps] == ["state1"]
+        assert process2.current_steps() == steps
+
+        process2.proceed()
+        assert process2.is_running is False
+        assert [s.state_name for s in process2.last_steps()] == ["state2"]
+        jwf.db.session.commit()
+
+        processes = Process.query.options(Process.with_steps()).all()
+        assert all(p.steps_loaded for p in processes)
+        assert all(p.current_steps() == [] for p in processes)
+
+
+def test_auto_steps_order(app, app_ctx, _db, process_step):
+    """Test proceeding auto steps depth-first in order of transitions"""
+    Process, Step = process_step
+    jwf = JembeWF()
+    arrived = []
+
+    class ArriveCallback(StateCallback):
+        """Record arrival to the state"""
+
+        def callback(self):
+            arrived.append(self.state.name)
+
+    class GuardCallback(TransitionCallback):
+        """Record checking of the transition"""
+
+        def can_proceed(self):
+            arrived.append(f"guard->{self.to_state.name}")
+            return True
+
+    jwf.add(
+        Flow("flow1")
+        .add(
+            State("start", ArriveCallback)
+            .add(Transition("a", GuardCallback), Transition("b", GuardCallback))
+            .auto(),
+            State("a", ArriveCallback).add(Transition("a2")).auto(),
+            State("a2", ArriveCallback).add(Transition("a3")).auto(),
+            State("a3", ArriveCallback),
+            State("b", ArriveCallback).add(Transition("b2", GuardCallback)).auto(),
+            State("b2", ArriveCallback),
+        )
+        .start_with("start")
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        process = jwf.start("flow1")
+        assert arrived == [
+            "start",
+            "guard->a",
+            "a",
+            "a2",
+            "a3",
+            "guard->b",
+            "b",
+            "guard->b2",
+            "b2",
+        ]
+        assert process.is_running is False
+
+
+def test_long_auto_chain(app, app_ctx, _db, process_step):
+    """Test long chain of auto states without recursion and max_auto_steps"""
+    Process, Step = process_step
+    jwf = JembeWF(max_auto_steps=1000)
+    arrived = []
+
+    class ArriveCallback(StateCallback):
+        """Record arrival to the state"""
+
+        def callback(self):
+            arrived.append(self.state.name)
+
+    chain_length = 1500
+    flow = Flow("flow1")
+    for i in range(chain_length):
+        flow.add(State(f"state{i}", ArriveCallback).add(Transition(f"state{i+1}")).auto())
+    flow.add(State(f"state{chain_length}", ArriveCallback))
+    jwf.add(flow.start_with("state0"))
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        process = jwf.start("flow1")
+        assert arrived == [f"state{i}" for i in range(1001)]
+        assert process.is_running is True
+        assert [s.state_name for s in process.current_steps()] == ["state1000"]
+
+        process.proceed()
+        assert arrived == [f"state{i}" for i in range(chain_length + 1)]
+        assert process.is_running is False
+
+
+def test_callback_cache_and_can_start_flow(app, app_ctx, _db, process_step):
+    """Test callbacks are created once per instance and can_start without process"""
+    Process, Step = process_step
+    jwf = JembeWF()
+    instances = []
+
+    class Flow1Callback(FlowCallback):
+        """Flow callback that can't start process for negative number"""
+
+        def __init__(self, process):
+            super().__init__(process)
+            instances.append(self)
+
+        @classmethod
+        def can_start_flow(cls, flow, **process_vars):
+            return process_vars.get("number", 0) >= 0
+
+    class State1Callback(StateCallback):
+        """State callback"""
+
+    jwf.add(
+        Flow("flow1", Flow1Callback)
+        .add(
+            State("state1", State1Callback).add(Transition("state2")),
+            State("state2"),
+        )
+        .start_with("state1"),
+        Flow("flow2").add(State("state1")).start_with("state1"),
+    )
+    jwf.init_app(app, _db, Process, Step)
+
+    with app_ctx:
+        assert jwf.can_start("flow1", number=1) is True
+        assert jwf.can_start("flow1", number=-1) is False
+        assert instances == []
+
+        process = jwf.start("flow1", number=1)
+        assert len(instances) == 1
+        assert process.callback is instances[0]
+
+        step = process.current_steps()[0]
+        assert step.callback is step.callback
+        assert isinstance(step.callback, State1Callback)
+
+        process.flow_name = "flow2"
+        assert process.callback is not instances[0]
+        assert type(process.callback) is FlowCallback
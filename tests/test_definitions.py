@@ -0,0 +1,143 @@
+import json
+import sys
+import pytest
+from jembewf import (
+    JembeWF,
+    StateCallback,
+    TransitionCallback,
+    compile_flows,
+    flow_from_dict,
+    flows_from_file,
+)
+
+ARRIVED = []
+
+
+class ArriveCallback(StateCallback):
+    """Record arrival to the state"""
+
+    def callback(self):
+        ARRIVED.append(self.state.name)
+
+
+class AmountCallback(TransitionCallback):
+    """Proceed only processes with large amount"""
+
+    def can_proceed(self):
+        return self.process.vars["amount"] > 10
+
+
+FLOWS_YAML = """
+flows:
+  - name: order
+    start_with: [new]
+    compact_steps: 5
+    variables:
+      - {name: amount, type: int, default: 0, index: true}
+    states:
+      - name: new
+        callback: tests.test_definitions:ArriveCallback
+        transitions:
+          - {to: approved, callback: tests.test_definitions:AmountCallback}
+          - {to: escalated, after: 86400}
+      - {name: approved, callback: tests.test_definitions.ArriveCallback}
+      - {name: escalated}
+"""
+
+
+def test_flows_from_file(tmp_path):
+    """Test creating flows from YAML and JSON definitions"""
+    yaml_path = tmp_path / "flows.yaml"
+    yaml_path.write_text(FLOWS_YAML)
+    (flow,) = flows_from_file(str(yaml_path))
+    assert flow.name == "order"
+    assert flow.states["new"].callback is ArriveCallback
+    assert flow.states["new"].transitions[0].callback is AmountCallback
+    assert flow.states["new"].transitions[1].after.days == 1
+    assert flow.variables["amount"].type is int
+    assert flow.validated
+
+    json_path = tmp_path / "flows.json"
+    json_path.write_text(
+        json.dumps(
+            [
+                {
+                    "name": "flow1",
+                    "start_with": ["a"],
+                    "states": [
+                        {"name": "a", "auto": True, "transitions": [{"to": "b"}]},
+                        {"name": "b", "join": "all"},
+                    ],
+                }
+            ]
+        )
+    )
+    (flow,) = flows_from_file(str(json_path))
+    assert flow.states["a"].auto_proceed
+    assert flow.states["b"].join_count == 1
+
+    with pytest.raises(ValueError):
+        flow_from_dict({"name": "flow1", "states": [{"name": "a", "autoo": True}]})
+
+
+def test_load_snapshot(app, app_ctx, _db, process_step, tmp_path):
+    """Test lazily unpickling flows compiled to snapshot"""
+    Process, Step = process_step
+    yaml_path = tmp_path / "flows.yaml"
+    yaml_path.write_text(FLOWS_YAML)
+    snapshot = str(tmp_path / "flows.pickle")
+    snapshots = compile_flows(flows_from_file(str(yaml_path)), snapshot)
+    assert list(snapshots) == ["order"]
+    assert snapshots["order"].keep_steps == 5
+
+    jwf = JembeWF().load_snapshot(snapshot)
+    jwf.init_app(app, _db, Process, Step)
+    assert "order" in jwf.flows and not jwf.flows.is_loaded("order")
+    # indexed variables are declared without unpickling the flow
+    assert jwf.create_indexes() == ["ix_jwf_processes_order_variables_amount"]
+    assert not jwf.flows.is_loaded("order")
+
+    with app_ctx:
+        # compacting steps doesn't unpickle the flow
+        assert jwf.compact_steps() == 0
+        assert not jwf.flows.is_loaded("order")
+
+        ARRIVED.clear()
+        process = jwf.start("order", amount=20)
+        assert jwf.flows.is_loaded("order")
+        flow = jwf.get_flow("order")
+        assert flow.graph.state_names == ("new", "approved", "escalated")
+        assert process.proceed() is True
+        assert ARRIVED == ["new", "approved"]
+        assert [s.state_name for s in process.last_steps()] == ["approved"]
+        jwf.db.session.commit()
+
+
+def test_add_lazy(app, app_ctx, _db, process_step):
+    """Test importing lazily registered flows on the first use"""
+    Process, Step = process_step
+    sys.modules.pop("tests.lazy_flows", None)
+
+    jwf = JembeWF()
+    jwf.add_lazy("flow1", "tests.lazy_flows:flow1")
+    jwf.add_lazy("flow2", "tests.lazy_flows:make_flow2")
+    jwf.add_lazy("flow3", "tests.lazy_flows:make_flow2")
+    with pytest.raises(Exception):
+        jwf.add_lazy("flow1", "tests.lazy_flows:flow1")
+    jwf.init_app(app, _db, Process, Step)
+    assert "tests.lazy_flows" not in sys.modules
+    assert jwf.has_flow("flow2") and not jwf.flows.is_loaded("flow2")
+
+    with app_ctx:
+        process = jwf.start("flow1")
+        jwf.db.session.commit()
+        assert "tests.lazy_flows" in sys.modules
+        assert sys.modules["tests.lazy_flows"].ArriveCallback.arrived == ["a"]
+        assert process.is_running is False
+        assert not jwf.flows.is_loaded("flow2")
+
+        jwf.db.session.expunge_all()
+        assert jwf.db.session.get(Process, process.id).flow is jwf.get_flow("flow1")
+        assert jwf.get_flow("flow2").name == "flow2"
+        with pytest.raises(ValueError):
+            jwf.get_flow("flow3")
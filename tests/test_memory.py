@@ -0,0 +1,129 @@
+from datetime import timedelta
+import pytest
+from jembewf import (
+    CanProceed,
+    Flow,
+    FlowCallback,
+    MemoryStore,
+    State,
+    StateCallback,
+    Transition,
+    TransitionCallback,
+)
+from jembewf.process_mixin import CantStartProcess
+
+
+def test_memory_store():
+    """Test running flows with callbacks in memory without database"""
+    arrived = []
+
+    class StartCallback(FlowCallback):
+        """Start only processes with amount"""
+
+        def can_start(self):
+            return "amount" in self.process.variables
+
+    class ArriveCallback(StateCallback):
+        """Record arrival to the state"""
+
+        def callback(self):
+            arrived.append((self.process.id, self.state.name))
+
+    class AmountCallback(TransitionCallback):
+        """Approve large amounts"""
+
+        def can_proceed(self):
+            if self.process.variables["amount"] > 10:
+                return True
+            return CanProceed(False, "Amount is too small")
+
+    store = MemoryStore(
+        Flow("flow1", StartCallback)
+        .add(
+            State("state1", ArriveCallback).add(Transition("state2")).auto(),
+            State("state2", ArriveCallback).add(
+                Transition("approved", AmountCallback),
+                Transition("escalated", after=timedelta(days=1)),
+                Transition("paid", on="invoice.paid"),
+            ),
+            State("approved", ArriveCallback),
+            State("escalated"),
+            State("paid"),
+        )
+        .start_with("state1")
+    )
+
+    with pytest.raises(CantStartProcess):
+        store.start("flow1")
+
+    process1 = store.start("flow1", amount=20)
+    process2 = store.start("flow1", amount=5)
+    assert arrived == [(1, "state1"), (1, "state2"), (2, "state1"), (2, "state2")]
+    assert [s.id for s in store.active_steps("flow1", "state2")] == [2, 4]
+
+    can_proceed = process2.current_steps()[0].can_proceed()
+    assert not can_proceed and "Amount is too small" in can_proceed.reason
+
+    assert store.proceed_all() == 1
+    assert process1.is_running is False
+    assert [s.state_name for s in process1.last_steps()] == ["approved"]
+    assert process1.steps[-1].prev_step is process1.steps[1]
+    assert process2.is_running
+
+    assert store.signal("invoice.paid") == {process2.id}
+    assert [s.state_name for s in process2.last_steps()] == ["paid"]
+    assert list(store.active_steps("flow1")) == []
+
+
+def test_memory_store_join():
+    """Test join state of in memory process waiting for all branches"""
+    transited = []
+
+    class JoinTransitionCallback(TransitionCallback):
+        """Record transition to the join step"""
+
+        def callback(self, to_step):
+            transited.append((to_step, to_step.is_active))
+
+    store = MemoryStore(
+        Flow("flow1")
+        .add(
+            State("start").add(Transition("a"), Transition("b")).auto(),
+            State("a").add(Transition("join", JoinTransitionCallback)),
+            State("b").add(Transition("join", JoinTransitionCallback)),
+            State("join", join="all"),
+        )
+        .start_with("start")
+    )
+
+    process = store.start("flow1")
+    step_a, step_b = process.current_steps()
+    assert step_a.proceed() is True
+    assert [s.state_name for s in process.current_steps()] == ["b"]
+    assert step_b.proceed() is True
+    assert process.is_running is False
+    assert [s.state_name for s in process.last_steps()] == ["join"]
+    (join_step,) = process.last_steps()
+    assert transited == [(join_step, False), (join_step, True)]
+
+    # branch that loops back arrives to the join only once
+    store.add(
+        Flow("flow2")
+        .add(
+            State("a").add(Transition("join"), Transition("a")),
+            State("b").add(Transition("join")),
+            State("join", join="all"),
+        )
+        .start_with("a", "b")
+    )
+    process = store.start("flow2")
+    step_a, step_b = process.current_steps()
+    assert step_a.proceed() is True
+    (step_a,) = [s for s in process.current_steps() if s.state_name == "a"]
+    assert step_a.proceed() is True
+    assert [s.state_name for s in process.current_steps()] == ["b", "a"]
+    (join_step,) = [s for s in process.steps if s.state_name == "join"]
+    assert join_step.is_active is False and join_step.ended_at is None
+    assert step_b.proceed() is True
+    assert [s.state_name for s in process.steps].count("join") == 1
+    assert join_step.ended_at is not None